@@ -0,0 +1,92 @@
+import glob
+import os
+from typing import List, Optional
+
+from webcomix.comic import Comic
+from webcomix.download_state import DownloadState
+
+
+def downloaded_comics(directory: str = ".") -> List[Comic]:
+    """
+    Returns the comics whose download state is saved in the directory, as
+    long as their images or their .cbz archive are still there.
+    """
+    comics = []
+    pattern = os.path.join(directory, DownloadState.location("*"))
+    for path in sorted(glob.glob(pattern)):
+        download_state = DownloadState.load(path)
+        if download_state is None:
+            continue
+        comic = Comic(**download_state.comic)
+        if os.path.isdir(comic.name) or os.path.isfile("{}.cbz".format(comic.name)):
+            comics.append(comic)
+    return comics
+
+
+def last_downloaded_page(comic: Comic) -> Optional[int]:
+    last_page = DownloadState(
+        DownloadState.location(comic.name), comic.definition()
+    ).last_page()
+    return last_page[1] if last_page is not None else None
+
+
+def download_comics(
+    comics: List[Comic],
+    jobs: int = 1,
+    from_start: bool = False,
+    cbz: Optional[List[bool]] = None,
+    compression: str = "store",
+    compression_level: int = None,
+    debug: bool = False,
+    jobs_per_domain: int = None,
+    refresh: bool = False,
+) -> List[Optional[Exception]]:
+    """
+    Downloads the comics in a single process, at most jobs of them at the
+    same time and at most jobs_per_domain of them from the same website, so
+    that a slow website doesn't hold up the others. The comics for which
+    cbz is set are saved straight into a .cbz archive. If refresh is set,
+    the images downloaded before are only downloaded again if they changed.
+    The comics using the fast engine are downloaded first, in this process.
+    Returns the error that stopped the download of each comic, if any.
+    """
+    if cbz is None:
+        cbz = [False] * len(comics)
+    crawls = []
+    crawled = []
+    fast_downloads = []
+    downloaded_fast = []
+    for index, (comic, comic_cbz) in enumerate(zip(comics, cbz)):
+        settings, crawl_kwargs = comic.prepare_download(
+            from_start, comic_cbz, compression, compression_level, refresh=refresh
+        )
+        if comic.uses_fast_engine(refresh=refresh):
+            from webcomix.fast_engine import FastDownload
+
+            fast_downloads.append(FastDownload(settings, crawl_kwargs))
+            downloaded_fast.append(index)
+        else:
+            from webcomix.scrapy.download.comic_spider import ComicSpider
+
+            crawls.append((settings, ComicSpider, crawl_kwargs))
+            crawled.append(index)
+
+    errors = [None] * len(comics)  # type: List[Optional[Exception]]
+    if fast_downloads:
+        from webcomix.fast_engine import run_downloads
+
+        for index, error in zip(
+            downloaded_fast, run_downloads(fast_downloads, jobs, jobs_per_domain)
+        ):
+            errors[index] = error
+    if crawls or not fast_downloads:
+        from webcomix.scrapy.crawler_worker import BatchCrawlerWorker
+
+        worker = BatchCrawlerWorker(
+            {"LOG_ENABLED": debug}, crawls, jobs, jobs_per_domain
+        )
+        for index, result in zip(crawled, worker.start()):
+            errors[index] = next(
+                (item for item in result if isinstance(item, Exception)), None
+            )
+    return errors
@@ -1,11 +1,31 @@
 #! python3
 
+import os
+
 import click
 
-from webcomix.comic import Comic
+from webcomix.batch import download_comics, downloaded_comics, last_downloaded_page
+from webcomix.comic import (
+    ENGINES,
+    FAST_ENGINE,
+    SCRAPY_ENGINE,
+    Comic,
+    fast_engine_available,
+)
+from webcomix.compression import COMPRESSIONS
 from webcomix.exceptions import CrawlerBlocked, NextLinkNotFound
-from webcomix.search import discovery
-from webcomix.supported_comics import supported_comics
+from webcomix.manifest import Manifest
+from webcomix.page_index import index_location
+from webcomix.selector_cache import SelectorCache
+from webcomix.supported_comics import supported_archives, supported_comics
+
+
+def check_engine(ctx, param, value):
+    if value == FAST_ENGINE and not fast_engine_available():
+        raise click.BadParameter(
+            "the fast engine needs aiohttp, installed with: pip install webcomix[fast]"
+        )
+    return value
 
 
 @click.group()
@@ -29,24 +49,279 @@ def comics():
 
 @cli.command()
 @click.argument(
-    "name", type=click.Choice([k for k, v in sorted(supported_comics.items())])
+    "names",
+    nargs=-1,
+    required=True,
+    type=click.Choice([k for k, v in sorted(supported_comics.items())]),
 )
 @click.option(
     "--cbz", is_flag=True, default=False, help="Outputs the comic as a cbz file"
 )
+@click.option(
+    "--compression",
+    type=click.Choice(sorted(COMPRESSIONS)),
+    default="store",
+    help="Compression of the cbz file; already compressed images are always stored",
+)
+@click.option(
+    "--compression-level",
+    "--compression_level",
+    type=click.IntRange(min=0, max=9),
+    default=None,
+    help="Compression level, from 0 (fastest) to 9 (smallest)",
+)
+@click.option(
+    "--deep-verify",
+    "--deep_verify",
+    is_flag=True,
+    default=False,
+    help="Reads back every page of the cbz file after the download",
+)
 @click.option(
     "--title", is_flag=True, default=False, help="Add title of comic in image names"
 )
+@click.option(
+    "--from-start",
+    "--from_start",
+    is_flag=True,
+    default=False,
+    help="Downloads from the first page even if the comic was downloaded before",
+)
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=4,
+    help="Number of comics downloaded at the same time",
+)
+@click.option(
+    "--jobs-per-domain",
+    "--jobs_per_domain",
+    type=click.IntRange(min=1),
+    default=2,
+    help="Number of comics downloaded at the same time from the same website",
+)
+@click.option(
+    "--refresh",
+    is_flag=True,
+    default=False,
+    help="Goes through every page again and downloads the images which changed since",
+)
+@click.option(
+    "--export-index",
+    "--export_index",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Writes the pages gone through to this page index (.jsonl or .csv)",
+)
+@click.option(
+    "--from-index",
+    "--from_index",
+    default=None,
+    type=click.Path(exists=True, dir_okay=False),
+    help="Downloads the images listed in this page index instead of going through the pages",
+)
+@click.option(
+    "--parallel-pages",
+    "--parallel_pages",
+    type=click.IntRange(min=2),
+    default=None,
+    help="Fetches up to this many pages at the same time when their URLs follow a numeric pattern",
+)
+@click.option(
+    "--html-cache-ttl",
+    "--html_cache_ttl",
+    type=click.IntRange(min=0),
+    default=None,
+    help="Seconds the pages are kept in the HTML cache, a day by default; 0 disables it",
+)
+@click.option(
+    "--engine",
+    type=click.Choice(ENGINES),
+    default=SCRAPY_ENGINE,
+    callback=check_engine,
+    help="Downloads with Scrapy, or with the fast engine for comics which don't need Javascript",
+)
 @click.option(
     "--verbose", "-v", is_flag=True, default=False, help="Add debugging output"
 )
-def download(name, cbz, title, verbose):
+def download(
+    names,
+    cbz,
+    compression,
+    compression_level,
+    deep_verify,
+    title,
+    from_start,
+    jobs,
+    jobs_per_domain,
+    refresh,
+    export_index,
+    from_index,
+    parallel_pages,
+    html_cache_ttl,
+    engine,
+    verbose,
+):
     """
-    Downloads a predefined comic by name
+    Downloads predefined comics by name
     """
-    if name in list(supported_comics.keys()):
-        comic = Comic(name, *supported_comics[name], title=title, debug=verbose)
-        download_webcomic(comic, cbz)
+    comics = [
+        predefined_comic(
+            name,
+            title=title,
+            debug=verbose,
+            parallel_pages=parallel_pages,
+            html_cache_ttl=html_cache_ttl,
+            engine=engine,
+        )
+        for name in dict.fromkeys(names)
+    ]
+    if len(comics) == 1 and from_index is not None:
+        download_images(comics[0], from_index, cbz, compression, compression_level)
+        return
+    if len(comics) == 1:
+        download_webcomic(
+            comics[0],
+            cbz,
+            from_start,
+            compression,
+            compression_level,
+            deep_verify,
+            export_index,
+            refresh,
+        )
+        return
+    if export_index is not None or from_index is not None:
+        raise click.UsageError(
+            "--export-index and --from-index only work with a single comic."
+        )
+    errors = download_comics(
+        comics,
+        jobs,
+        from_start,
+        [cbz] * len(comics),
+        compression,
+        compression_level,
+        verbose,
+        jobs_per_domain,
+        refresh,
+    )
+    for comic, error in zip(comics, errors):
+        if cbz:
+            package_cbz(comic, compression, compression_level, deep_verify)
+        message = download_error_message(error)
+        click.echo(
+            "{}: {}".format(comic.name, message or "finished downloading the images")
+        )
+
+
+@cli.command()
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=4,
+    help="Number of comics updated at the same time",
+)
+@click.option(
+    "--jobs-per-domain",
+    "--jobs_per_domain",
+    type=click.IntRange(min=1),
+    default=2,
+    help="Number of comics updated at the same time from the same website",
+)
+@click.option(
+    "--compression",
+    type=click.Choice(sorted(COMPRESSIONS)),
+    default="store",
+    help="Compression of the cbz file; already compressed images are always stored",
+)
+@click.option(
+    "--compression-level",
+    "--compression_level",
+    type=click.IntRange(min=0, max=9),
+    default=None,
+    help="Compression level, from 0 (fastest) to 9 (smallest)",
+)
+@click.option(
+    "--deep-verify",
+    "--deep_verify",
+    is_flag=True,
+    default=False,
+    help="Reads back every page of the cbz file after the download",
+)
+@click.option(
+    "--refresh",
+    is_flag=True,
+    default=False,
+    help="Goes through every page again and downloads the images which changed since",
+)
+@click.option(
+    "--parallel-pages",
+    "--parallel_pages",
+    type=click.IntRange(min=2),
+    default=None,
+    help="Fetches up to this many pages at the same time when their URLs follow a numeric pattern",
+)
+@click.option(
+    "--html-cache-ttl",
+    "--html_cache_ttl",
+    type=click.IntRange(min=0),
+    default=None,
+    help="Seconds the pages are kept in the HTML cache, a day by default; 0 disables it",
+)
+@click.option(
+    "--engine",
+    type=click.Choice(ENGINES),
+    default=SCRAPY_ENGINE,
+    callback=check_engine,
+    help="Downloads with Scrapy, or with the fast engine for comics which don't need Javascript",
+)
+@click.option(
+    "--verbose", "-v", is_flag=True, default=False, help="Add debugging output"
+)
+def update(
+    jobs,
+    jobs_per_domain,
+    compression,
+    compression_level,
+    deep_verify,
+    refresh,
+    parallel_pages,
+    html_cache_ttl,
+    engine,
+    verbose,
+):
+    """
+    Downloads the pages published since the last download of every comic
+    in the current directory
+    """
+    comics = downloaded_comics()
+    if not comics:
+        click.echo("No downloaded comic was found in the current directory.")
+        return
+    for comic in comics:
+        comic.parallel_pages = parallel_pages
+        comic.html_cache_ttl = html_cache_ttl
+        comic.engine = engine
+    last_pages = [last_downloaded_page(comic) for comic in comics]
+    cbz = [os.path.isfile("{}.cbz".format(comic.name)) for comic in comics]
+    errors = download_comics(
+        comics,
+        jobs,
+        cbz=cbz,
+        compression=compression,
+        compression_level=compression_level,
+        debug=verbose,
+        jobs_per_domain=jobs_per_domain,
+        refresh=refresh,
+    )
+    for comic, comic_cbz, last_page, error in zip(comics, cbz, last_pages, errors):
+        if comic_cbz:
+            package_cbz(comic, compression, compression_level, deep_verify)
+        message = download_error_message(error)
+        if message is None:
+            message = "{} new pages".format(last_downloaded_page(comic) - last_page)
+        click.echo("{}: {}".format(comic.name, message))
 
 
 @cli.command()
@@ -68,6 +343,26 @@ def download(name, cbz, title, verbose):
 @click.option(
     "--cbz", default=False, is_flag=True, help="Outputs the comic as a cbz file"
 )
+@click.option(
+    "--compression",
+    type=click.Choice(sorted(COMPRESSIONS)),
+    default="store",
+    help="Compression of the cbz file; already compressed images are always stored",
+)
+@click.option(
+    "--compression-level",
+    "--compression_level",
+    type=click.IntRange(min=0, max=9),
+    default=None,
+    help="Compression level, from 0 (fastest) to 9 (smallest)",
+)
+@click.option(
+    "--deep-verify",
+    "--deep_verify",
+    is_flag=True,
+    default=False,
+    help="Reads back every page of the cbz file after the download",
+)
 @click.option(
     "--single-page",
     "--single_page",
@@ -96,6 +391,47 @@ def download(name, cbz, title, verbose):
 @click.option(
     "--yes", "-y", default=False, is_flag=True, help="Skips the verification prompt"
 )
+@click.option(
+    "--no-cache",
+    "--no_cache",
+    default=False,
+    is_flag=True,
+    help="Ignores the XPaths found by previous searches on the same website",
+)
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of processes verifying the XPaths in parallel",
+)
+@click.option(
+    "--from-start",
+    "--from_start",
+    is_flag=True,
+    default=False,
+    help="Downloads from the first page even if the comic was downloaded before",
+)
+@click.option(
+    "--parallel-pages",
+    "--parallel_pages",
+    type=click.IntRange(min=2),
+    default=None,
+    help="Fetches up to this many pages at the same time when their URLs follow a numeric pattern",
+)
+@click.option(
+    "--html-cache-ttl",
+    "--html_cache_ttl",
+    type=click.IntRange(min=0),
+    default=None,
+    help="Seconds the pages are kept in the HTML cache, a day by default; 0 disables it",
+)
+@click.option(
+    "--engine",
+    type=click.Choice(ENGINES),
+    default=SCRAPY_ENGINE,
+    callback=check_engine,
+    help="Downloads with Scrapy, or with the fast engine for comics which don't need Javascript",
+)
 @click.option(
     "--verbose", "-v", is_flag=True, default=False, help="Add debugging output"
 )
@@ -104,24 +440,197 @@ def search(
     start_url,
     start_page,
     cbz,
+    compression,
+    compression_level,
+    deep_verify,
     single_page,
     javascript,
     title,
     alt_text,
     yes,
+    no_cache,
+    jobs,
+    from_start,
+    parallel_pages,
+    html_cache_ttl,
+    engine,
     verbose,
 ):
     """
     Downloads a webcomic using a general XPath
     """
-    comic, validation = discovery(
-        name, start_url, start_page, alt_text, single_page, javascript, title, verbose
+    # Scrapy is only imported by the commands crawling, so that the others
+    # start quickly
+    from webcomix.scrapy.crawler_worker import CrawlerEngine
+    from webcomix.search import discovery
+
+    # The discovery and the download are crawled by the same process
+    with CrawlerEngine():
+        comic, validation = discovery(
+            name,
+            start_url,
+            start_page,
+            alt_text,
+            single_page,
+            javascript,
+            title,
+            verbose,
+            selector_cache=None if no_cache else SelectorCache(),
+            jobs=jobs,
+            html_cache_ttl=html_cache_ttl,
+        )
+        if comic is not None:
+            comic.parallel_pages = parallel_pages
+            comic.engine = engine
+            print_verification(validation)
+            click.echo("Verify that the links above are correct.")
+            if yes or click.confirm("Are you sure you want to proceed?"):
+                download_webcomic(
+                    comic, cbz, from_start, compression, compression_level, deep_verify
+                )
+
+
+@cli.command()
+@click.argument(
+    "name", type=click.Choice([k for k, v in sorted(supported_comics.items())])
+)
+@click.option(
+    "--output",
+    "-o",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Page index to write, <name>.index.jsonl by default",
+)
+@click.option(
+    "--parallel-pages",
+    "--parallel_pages",
+    type=click.IntRange(min=2),
+    default=None,
+    help="Fetches up to this many pages at the same time when their URLs follow a numeric pattern",
+)
+@click.option(
+    "--verbose", "-v", is_flag=True, default=False, help="Add debugging output"
+)
+def index(name, output, parallel_pages, verbose):
+    """
+    Lists the pages and images of a predefined comic without downloading them
+    """
+    comic = predefined_comic(name, debug=verbose, parallel_pages=parallel_pages)
+    try:
+        comic.index(output or index_location(name))
+    except CrawlerBlocked:
+        click.echo(
+            "Your download has been blocked by the hosting website. Please try again later."
+        )
+        raise click.Abort()
+
+
+@cli.command()
+@click.argument("name", type=click.STRING)
+@click.option(
+    "--index",
+    "index_path",
+    default=None,
+    type=click.Path(exists=True, dir_okay=False),
+    help="Page index to read, <name>.index.jsonl by default",
+)
+@click.option(
+    "--first-page",
+    "--first_page",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of the first image to download",
+)
+@click.option(
+    "--last-page",
+    "--last_page",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of the last image to download",
+)
+@click.option(
+    "--cbz", is_flag=True, default=False, help="Outputs the comic as a cbz file"
+)
+@click.option(
+    "--compression",
+    type=click.Choice(sorted(COMPRESSIONS)),
+    default="store",
+    help="Compression of the cbz file; already compressed images are always stored",
+)
+@click.option(
+    "--compression-level",
+    "--compression_level",
+    type=click.IntRange(min=0, max=9),
+    default=None,
+    help="Compression level, from 0 (fastest) to 9 (smallest)",
+)
+@click.option(
+    "--title", is_flag=True, default=False, help="Add title of comic in image names"
+)
+@click.option(
+    "--verbose", "-v", is_flag=True, default=False, help="Add debugging output"
+)
+def images(
+    name,
+    index_path,
+    first_page,
+    last_page,
+    cbz,
+    compression,
+    compression_level,
+    title,
+    verbose,
+):
+    """
+    Downloads the images listed in the page index of a comic
+    """
+    index_path = index_path or index_location(name)
+    if not os.path.isfile(index_path):
+        click.echo("Could not find the page index {}.".format(index_path))
+        raise click.Abort()
+    comic = Comic(name, None, None, None, title=title, debug=verbose)
+    download_images(
+        comic, index_path, cbz, compression, compression_level, first_page, last_page
     )
-    if comic is not None:
-        print_verification(validation)
-        click.echo("Verify that the links above are correct.")
-        if yes or click.confirm("Are you sure you want to proceed?"):
-            download_webcomic(comic, cbz)
+
+
+@cli.command()
+@click.argument("name", type=click.STRING)
+@click.option(
+    "--rebuild",
+    is_flag=True,
+    default=False,
+    help="Lists the images in the directory and the cbz file of the comic again",
+)
+def status(name, rebuild):
+    """
+    Reports the images of a comic downloaded so far
+    """
+    manifest_path = Manifest.location(name)
+    if not (
+        os.path.isfile(manifest_path)
+        or os.path.isdir(name)
+        or os.path.isfile("{}.cbz".format(name))
+    ):
+        click.echo("Could not find a download of {}.".format(name))
+        raise click.Abort()
+    manifest = Manifest(manifest_path)
+    try:
+        if rebuild:
+            manifest.rebuild(name)
+        else:
+            manifest.open(name)
+        report = manifest.report()
+    finally:
+        manifest.close(name)
+    output = "{}: {} images downloaded ({} bytes)".format(
+        name, report["downloaded"], report["size"]
+    )
+    if report["last_page"] is not None:
+        output += ", up to page {}".format(report["last_page"])
+    if report["failed"]:
+        output += ", {} failed".format(report["failed"])
+    click.echo(output)
 
 
 @cli.command()
@@ -157,6 +666,26 @@ def search(
 @click.option(
     "--cbz", default=False, is_flag=True, help="Outputs the comic as a cbz file"
 )
+@click.option(
+    "--compression",
+    type=click.Choice(sorted(COMPRESSIONS)),
+    default="store",
+    help="Compression of the cbz file; already compressed images are always stored",
+)
+@click.option(
+    "--compression-level",
+    "--compression_level",
+    type=click.IntRange(min=0, max=9),
+    default=None,
+    help="Compression level, from 0 (fastest) to 9 (smallest)",
+)
+@click.option(
+    "--deep-verify",
+    "--deep_verify",
+    is_flag=True,
+    default=False,
+    help="Reads back every page of the cbz file after the download",
+)
 @click.option(
     "--single-page",
     "--single_page",
@@ -186,6 +715,55 @@ def search(
 @click.option(
     "--yes", "-y", default=False, is_flag=True, help="Skips the verification prompt"
 )
+@click.option(
+    "--from-start",
+    "--from_start",
+    is_flag=True,
+    default=False,
+    help="Downloads from the first page even if the comic was downloaded before",
+)
+@click.option(
+    "--archive-url",
+    "--archive_url",
+    default=None,
+    type=click.STRING,
+    help="URL of a page or sitemap listing every page of the comic",
+)
+@click.option(
+    "--archive-xpath",
+    "--archive_xpath",
+    default=None,
+    type=click.STRING,
+    help="XPath giving out the links to the pages on the archive page",
+)
+@click.option(
+    "--export-index",
+    "--export_index",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Writes the pages gone through to this page index (.jsonl or .csv)",
+)
+@click.option(
+    "--parallel-pages",
+    "--parallel_pages",
+    type=click.IntRange(min=2),
+    default=None,
+    help="Fetches up to this many pages at the same time when their URLs follow a numeric pattern",
+)
+@click.option(
+    "--html-cache-ttl",
+    "--html_cache_ttl",
+    type=click.IntRange(min=0),
+    default=None,
+    help="Seconds the pages are kept in the HTML cache, a day by default; 0 disables it",
+)
+@click.option(
+    "--engine",
+    type=click.Choice(ENGINES),
+    default=SCRAPY_ENGINE,
+    callback=check_engine,
+    help="Downloads with Scrapy, or with the fast engine for comics which don't need Javascript",
+)
 @click.option(
     "--verbose", "-v", is_flag=True, default=False, help="Add debugging output"
 )
@@ -196,49 +774,92 @@ def custom(
     next_page_xpath,
     image_xpath,
     cbz,
+    compression,
+    compression_level,
+    deep_verify,
     single_page,
     javascript,
     title,
     alt_text,
     yes,
+    from_start,
+    archive_url,
+    archive_xpath,
+    export_index,
+    parallel_pages,
+    html_cache_ttl,
+    engine,
     verbose,
 ):
     """
     Downloads a user-defined webcomic
     """
-    comic = Comic(
+    from webcomix.scrapy.crawler_worker import CrawlerEngine
+
+    # The verification and the download are crawled by the same process
+    with CrawlerEngine():
+        comic = Comic(
+            name,
+            start_url,
+            image_xpath,
+            next_page_xpath,
+            start_page,
+            alt_text,
+            single_page,
+            javascript,
+            title,
+            verbose,
+            parallel_pages,
+            archive_url,
+            archive_xpath,
+            html_cache_ttl,
+            engine,
+        )
+        try:
+            validation = comic.verify_xpath()
+        except NextLinkNotFound as exception:
+            click.echo(
+                "Could not find next link of: {} \nwith next page XPath expression: {}".format(
+                    exception.failed_url, exception.next_page_xpath
+                )
+            )
+            click.echo(
+                "Have you tried testing your XPath expression with 'scrapy shell'?"
+            )
+            raise click.Abort()
+        try:
+            print_verification(validation)
+        except CrawlerBlocked as exception:
+            click.echo("{} could not be accessed with webcomix.".format(name))
+            click.echo(
+                "Chances are the website you're trying to download images from doesn't want to be scraped."
+            )
+            raise click.Abort()
+        click.echo("Verify that the links above are correct.")
+        if yes or click.confirm("Are you sure you want to proceed?"):
+            download_webcomic(
+                comic,
+                cbz,
+                from_start,
+                compression,
+                compression_level,
+                deep_verify,
+                export_index,
+            )
+
+
+def predefined_comic(name, **kwargs):
+    """
+    Returns the predefined comic, along with its archive if it has one
+    """
+    archive_url, archive_xpath = supported_archives.get(name, (None, None))
+    return Comic(
         name,
-        start_url,
-        image_xpath,
-        next_page_xpath,
-        start_page,
-        alt_text,
-        single_page,
-        javascript,
-        title,
-        verbose,
+        *supported_comics[name],
+        archive_url=archive_url,
+        archive_xpath=archive_xpath,
+        **kwargs
     )
-    try:
-        validation = comic.verify_xpath()
-    except NextLinkNotFound as exception:
-        click.echo(
-            "Could not find next link of: {} \nwith next page XPath expression: {}".format(
-                exception.failed_url, exception.next_page_xpath
-            )
-        )
-        click.echo("Have you tried testing your XPath expression with 'scrapy shell'?")
-        raise click.Abort()
-    try:
-        print_verification(validation)
-    except CrawlerBlocked as exception:
-        click.echo("{} could not be accessed with webcomix.".format(name))
-        click.echo(
-            "Chances are the website you're trying to download images from doesn't want to be scraped."
-        )
-        raise click.Abort()
-    click.echo("Verify that the links above are correct.")
-    if yes or click.confirm("Are you sure you want to proceed?"):
-        download_webcomic(comic, cbz)
 
 
 def print_verification(validation):
@@ -256,9 +877,20 @@ def print_verification(validation):
         click.echo(output)
 
 
-def download_webcomic(comic, cbz):
+def download_webcomic(
+    comic,
+    cbz,
+    from_start=False,
+    compression="store",
+    compression_level=None,
+    deep_verify=False,
+    export_index=None,
+    refresh=False,
+):
     try:
-        comic.download()
+        comic.download(
+            from_start, cbz, compression, compression_level, export_index, refresh
+        )
     except CrawlerBlocked:
         click.echo(
             "Your download has been blocked by the hosting website. Please try again later."
@@ -266,4 +898,41 @@ def download_webcomic(comic, cbz):
         raise click.Abort()
     finally:
         if cbz:
-            comic.convert_to_cbz()
+            package_cbz(comic, compression, compression_level, deep_verify)
+
+
+def download_images(
+    comic,
+    index_path,
+    cbz,
+    compression="store",
+    compression_level=None,
+    first_page=None,
+    last_page=None,
+):
+    try:
+        comic.download_from_index(
+            index_path, first_page, last_page, cbz, compression, compression_level
+        )
+    finally:
+        if cbz:
+            package_cbz(comic, compression, compression_level)
+
+
+def package_cbz(comic, compression="store", compression_level=None, deep_verify=False):
+    # Only the images downloaded before without --cbz are left to move
+    if os.path.isdir(comic.name):
+        comic.convert_to_cbz(compression, compression_level, deep_verify)
+    elif deep_verify and os.path.isfile("{}.cbz".format(comic.name)):
+        comic.verify_cbz()
+
+
+def download_error_message(error):
+    """
+    Describes the error that stopped the download of a comic among others
+    """
+    if isinstance(error, CrawlerBlocked):
+        return "blocked by the hosting website"
+    elif error is not None:
+        return "failed ({!r})".format(error)
+    return None
@@ -1,13 +1,19 @@
 import os
-from typing import List, Mapping, Dict
+from importlib.util import find_spec
+from typing import TYPE_CHECKING, AsyncIterator, List, Mapping, Dict, Optional, Tuple
 from urllib.parse import urlparse
 from zipfile import ZipFile, BadZipFile
 
 import click
 
-from webcomix.scrapy.download.comic_spider import ComicSpider
-from webcomix.scrapy.verification.verification_spider import VerificationSpider
-from webcomix.scrapy.crawler_worker import CrawlerWorker
+from webcomix.compression import add_files, drop_replaced_members, verify_files
+from webcomix.download_state import DownloadState
+from webcomix.util import cache_directory
+
+# Scrapy is only imported once a crawl starts, so that the commands which
+# don't crawl start quickly
+if TYPE_CHECKING:  # pragma: no cover
+    from webcomix.scrapy.crawler_worker import CrawlerEngine
 
 SPLASH_SETTINGS = {
     "SPLASH_URL": "http://0.0.0.0:8050",
@@ -31,6 +37,42 @@ FAKE_USERAGENT_SETTINGS = {
     "FAKEUSERAGENT_FALLBACK": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/74.0.3729.169 Safari/537.36",
 }
 
+HTML_CACHE_SETTINGS = {
+    "HTTPCACHE_ENABLED": True,
+    "HTTPCACHE_POLICY": "webcomix.scrapy.html_cache.HtmlCachePolicy",
+    "HTTPCACHE_STORAGE": "webcomix.scrapy.html_cache.HtmlCacheStorage",
+    "HTTPCACHE_GZIP": True,
+    "HTTPCACHE_IGNORE_SCHEMES": ["file", "data"],
+    "HTTPCACHE_MAX_SIZE": 256 * 1024 * 1024,
+}
+
+DEFAULT_HTML_CACHE_TTL = 24 * 60 * 60
+
+SCRAPY_ENGINE = "scrapy"
+FAST_ENGINE = "fast"
+ENGINES = [SCRAPY_ENGINE, FAST_ENGINE]
+
+
+def fast_engine_available() -> bool:
+    return find_spec("aiohttp") is not None
+
+
+def html_cache_settings(name: str, time_to_live: int = None) -> Dict:
+    """
+    Returns the settings keeping the pages of the comic in the HTML cache for
+    time_to_live seconds, a day by default, or none if it is 0.
+    """
+    if time_to_live is None:
+        time_to_live = DEFAULT_HTML_CACHE_TTL
+    if time_to_live == 0:
+        return {}
+    return {
+        **HTML_CACHE_SETTINGS,
+        "HTTPCACHE_DIR": os.path.join(cache_directory(), "pages"),
+        "HTTPCACHE_NAMESPACE": name,
+        "HTTPCACHE_EXPIRATION_SECS": time_to_live,
+    }
+
 
 class Comic:
     def __init__(
@@ -45,6 +87,11 @@ class Comic:
         javascript: bool = False,
         title: bool = False,
         debug: bool = False,
+        parallel_pages: int = None,
+        archive_url: str = None,
+        archive_xpath: str = None,
+        html_cache_ttl: int = None,
+        engine: str = SCRAPY_ENGINE,
     ):
         self.name = name
         self.start_url = start_url
@@ -56,60 +103,321 @@ class Comic:
         self.javascript = javascript
         self.title = title
         self.debug = debug
+        self.parallel_pages = parallel_pages
+        self.archive_url = archive_url
+        self.archive_xpath = archive_xpath
+        self.html_cache_ttl = html_cache_ttl
+        # Downloads with Scrapy, or with aiohttp and lxml for the fast engine
+        self.engine = engine
+        # The first pages of the comic, once verified
+        self.verified_pages = None  # type: Optional[List[Mapping]]
 
-    def download(self) -> None:
+    def download(
+        self,
+        from_start: bool = False,
+        cbz: bool = False,
+        compression: str = "store",
+        compression_level: int = None,
+        export_index: str = None,
+        refresh: bool = False,
+    ) -> None:
         """
         Downloads an entire comic page by page starting from the first one
         and saves them in the directory_name created in the current working
-        directory
+        directory, or straight into a .cbz archive if cbz is set. If the
+        comic was downloaded before, the download starts again from the last
+        page reached, unless from_start is set. The pages gone through are
+        written to the page index export_index if given. If refresh is set,
+        the whole comic is gone through again and the images downloaded
+        before are only downloaded again if they changed.
+        """
+        settings, crawl_kwargs = self.prepare_download(
+            from_start, cbz, compression, compression_level, export_index, refresh
+        )
+
+        if self.uses_fast_engine(export_index, refresh):
+            from webcomix.fast_engine import FastDownload, run_downloads
+
+            error = run_downloads([FastDownload(settings, crawl_kwargs)])[0]
+            if error is not None:
+                raise error
+        else:
+            from webcomix.scrapy.crawler_worker import CrawlerWorker
+            from webcomix.scrapy.download.comic_spider import ComicSpider
+
+            worker = CrawlerWorker(settings, False, ComicSpider, **crawl_kwargs)
+
+            worker.start()
+
+        click.echo("Finished downloading the images.")
+
+    async def download_async(
+        self,
+        from_start: bool = False,
+        cbz: bool = False,
+        compression: str = "store",
+        compression_level: int = None,
+        export_index: str = None,
+        refresh: bool = False,
+        engine: "CrawlerEngine" = None,
+    ) -> AsyncIterator[Mapping]:
+        """
+        Downloads the comic like download() without blocking the event loop,
+        and returns the pages as they are gone through. The crawl runs in the
+        CrawlerEngine given if any, and is stopped if the download is
+        cancelled.
         """
-        if not os.path.isdir(self.name):
+        settings, crawl_kwargs = self.prepare_download(
+            from_start, cbz, compression, compression_level, export_index, refresh
+        )
+
+        if self.uses_fast_engine(export_index, refresh):
+            from webcomix.fast_engine import FastDownload
+
+            async for page in FastDownload(settings, crawl_kwargs).pages():
+                yield page
+        else:
+            from webcomix.scrapy.crawler_worker import crawl_async
+            from webcomix.scrapy.download.comic_spider import ComicSpider
+
+            async for item in crawl_async(
+                settings, ComicSpider, engine, report_pages=True, **crawl_kwargs
+            ):
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+
+        click.echo("Finished downloading the images.")
+
+    def uses_fast_engine(self, export_index: str = None, refresh: bool = False) -> bool:
+        """
+        Returns whether the comic is downloaded with the fast engine, which
+        doesn't run Javascript, write page indexes or refresh images.
+        """
+        if self.engine != FAST_ENGINE:
+            return False
+        if self.javascript or export_index is not None or refresh:
+            click.echo(
+                "The fast engine can't download {} this way, so Scrapy does.".format(
+                    self.name
+                )
+            )
+            return False
+        return True
+
+    def prepare_download(
+        self,
+        from_start: bool = False,
+        cbz: bool = False,
+        compression: str = "store",
+        compression_level: int = None,
+        export_index: str = None,
+        refresh: bool = False,
+    ) -> Tuple[Dict, Dict]:
+        """
+        Creates the directory of the comic, unless it is saved straight into
+        a .cbz archive, and returns the settings and the ComicSpider
+        arguments of its download.
+        """
+        if not cbz and not os.path.isdir(self.name):
             os.makedirs(self.name)
 
+        download_state = DownloadState(
+            DownloadState.location(self.name), self.definition()
+        )
+        start_url, start_page = self.start_url, self.start_page
+        last_page = None if from_start or refresh else download_state.last_page()
+        if last_page is not None:
+            start_url, start_page = last_page
+            click.echo(
+                "Resuming the download of {} from page {}".format(self.name, start_page)
+            )
+
         settings = {
-            **FAKE_USERAGENT_SETTINGS,
+            **self.crawl_settings(),
+            **self.pipeline_settings(cbz, compression, compression_level),
+        }
+        if refresh:
+            settings["REFRESH_IMAGES"] = True
+        if export_index is not None:
+            # Before the ComicPipeline, which drops the images already there
+            settings["ITEM_PIPELINES"] = {
+                **settings["ITEM_PIPELINES"],
+                "webcomix.scrapy.download.page_index_pipeline.PageIndexPipeline": 0,
+            }
+            settings["PAGE_INDEX"] = export_index
+            # A resumed download only goes through the pages published since
+            settings["PAGE_INDEX_APPEND"] = last_page is not None
+        crawl_kwargs = {
+            **self.crawl_kwargs(start_url, start_page),
+            "download_state": download_state,
+        }
+        if (
+            self.verified_pages
+            and not any(isinstance(page, Exception) for page in self.verified_pages)
+            and last_page is None
+        ):
+            # The download doesn't fetch the pages verified again
+            crawl_kwargs["verified_pages"] = [
+                dict(verified_page)
+                for verified_page in sorted(
+                    self.verified_pages, key=lambda page: page["page"]
+                )
+            ]
+        return settings, crawl_kwargs
+
+    def index(self, path: str) -> None:
+        """
+        Goes through every page of the comic without downloading its images,
+        and lists them in the page index at path.
+        """
+        settings = {
+            **self.crawl_settings(),
             "ITEM_PIPELINES": {
-                "webcomix.scrapy.download.comic_pipeline.ComicPipeline": 1,
-                "scrapy.pipelines.files.FilesPipeline": 500,
+                "webcomix.scrapy.download.page_index_pipeline.PageIndexPipeline": 1
             },
-            "LOG_ENABLED": self.debug,
-            "FILES_STORE": self.name,
-            "MEDIA_ALLOW_REDIRECTS": True,
-        }  # type: Dict
+            "PAGE_INDEX": path,
+        }
 
-        if self.javascript:
-            settings.update(SPLASH_SETTINGS)
+        from webcomix.scrapy.crawler_worker import CrawlerWorker
+        from webcomix.scrapy.download.comic_spider import ComicSpider
 
         worker = CrawlerWorker(
             settings,
             False,
             ComicSpider,
-            start_url=self.start_url,
-            start_page=self.start_page,
-            comic_image_selector=self.comic_image_selector,
-            next_page_selector=self.next_page_selector,
+            **self.crawl_kwargs(self.start_url, self.start_page)
+        )
+
+        worker.start()
+
+        click.echo("Finished indexing the pages.")
+
+    def download_from_index(
+        self,
+        path: str,
+        first_page: int = None,
+        last_page: int = None,
+        cbz: bool = False,
+        compression: str = "store",
+        compression_level: int = None,
+    ) -> None:
+        """
+        Downloads the images listed in the page index at path, or only the
+        ones from first_page to last_page, without going through the pages
+        of the comic. The images already downloaded are skipped, so that
+        the download can be run again until every image is there.
+        """
+        if not cbz and not os.path.isdir(self.name):
+            os.makedirs(self.name)
+
+        settings = {
+            **self.crawl_settings(),
+            **self.pipeline_settings(cbz, compression, compression_level),
+            # Only images are fetched, and never one after the other
+            "CONCURRENT_REQUESTS": 32,
+            "CONCURRENT_REQUESTS_PER_DOMAIN": 16,
+        }
+
+        from webcomix.scrapy.crawler_worker import CrawlerWorker
+        from webcomix.scrapy.download.index_spider import IndexSpider
+
+        worker = CrawlerWorker(
+            settings,
+            False,
+            IndexSpider,
+            index=path,
+            first_page=first_page,
+            last_page=last_page,
             directory=self.name,
-            javascript=self.javascript,
             title=self.title,
-            alt_text=self.alt_text,
         )
 
         worker.start()
 
         click.echo("Finished downloading the images.")
 
-    def convert_to_cbz(self) -> None:
+    def crawl_settings(self) -> Dict:
+        settings = {**FAKE_USERAGENT_SETTINGS, "LOG_ENABLED": self.debug}  # type: Dict
+        settings.update(self.html_cache_settings())
+        if self.javascript:
+            settings.update(SPLASH_SETTINGS)
+        if self.parallel_pages:
+            settings["CONCURRENT_REQUESTS_PER_DOMAIN"] = max(8, self.parallel_pages)
+            settings["CONCURRENT_REQUESTS"] = max(16, self.parallel_pages)
+        return settings
+
+    def html_cache_settings(self) -> Dict:
+        # Pages rendered by Splash are left to its own cache storage
+        if self.javascript:
+            return {}
+        return html_cache_settings(self.name, self.html_cache_ttl)
+
+    def pipeline_settings(
+        self, cbz: bool = False, compression: str = "store", compression_level=None
+    ) -> Dict:
+        return {
+            "ITEM_PIPELINES": {
+                "webcomix.scrapy.download.comic_pipeline.ComicPipeline": 1
+            },
+            "FILES_STORE": "cbz://{}.cbz".format(self.name) if cbz else self.name,
+            "MEDIA_ALLOW_REDIRECTS": True,
+            "CBZ_COMPRESSION": compression,
+            "CBZ_COMPRESSION_LEVEL": compression_level,
+        }
+
+    def crawl_kwargs(self, start_url: str, start_page: int) -> Dict:
+        return {
+            "start_url": start_url,
+            "start_page": start_page,
+            "comic_image_selector": self.comic_image_selector,
+            "next_page_selector": self.next_page_selector,
+            "directory": self.name,
+            "javascript": self.javascript,
+            "title": self.title,
+            "alt_text": self.alt_text,
+            "parallel_pages": self.parallel_pages,
+            "archive_url": self.archive_url,
+            "archive_xpath": self.archive_xpath,
+        }
+
+    def convert_to_cbz(
+        self,
+        compression: str = "store",
+        compression_level: int = None,
+        deep_verify: bool = False,
+    ) -> None:
         """
         Takes all of the previously downloaded pages and compresses them in
-        a .cbz file, erasing them afterwards.
+        a .cbz file, erasing them afterwards. Images which are already
+        compressed are always stored as they are. Only the pages added are
+        checked, unless deep_verify is set.
         """
-        with ZipFile("{}.cbz".format(self.name), mode="a") as cbz_file:
+        cbz_path = "{}.cbz".format(self.name)
+        with ZipFile(cbz_path, mode="a") as cbz_file:
             images = os.listdir(self.name)
-            for image in images:
-                image_location = "{}/{}".format(self.name, image)
-                cbz_file.write(image_location, image)
-                os.remove(image_location)
-            os.rmdir(self.name)
+            image_locations = ["{}/{}".format(self.name, image) for image in images]
+            written = add_files(
+                cbz_file,
+                list(zip(image_locations, images)),
+                compression,
+                compression_level,
+            )
+        # Images downloaded again by a refresh replace those in the archive
+        drop_replaced_members(cbz_path)
+        verify_files(cbz_path, written)
+        for image_location in image_locations:
+            os.remove(image_location)
+        os.rmdir(self.name)
+        if deep_verify:
+            self.verify_cbz()
+
+    def verify_cbz(self) -> None:
+        """
+        Reads back every page of the .cbz file to check that none of them is
+        corrupted.
+        """
+        with ZipFile("{}.cbz".format(self.name)) as cbz_file:
             if cbz_file.testzip() is not None:
                 raise BadZipFile(
                     "Error while testing the archive; it might be corrupted."
@@ -119,28 +427,88 @@ class Comic:
         """
         Takes a url and the XPath expressions for the next_page and image to
         go three pages into the comic. It returns a tuple containing the url
-        of each page and their respective image urls.
+        of each page and their respective image urls, which the download
+        then starts from.
         """
-        settings = {**FAKE_USERAGENT_SETTINGS, "LOG_ENABLED": self.debug}  # type: Dict
-
-        if self.javascript:
-            settings.update(SPLASH_SETTINGS)
+        from webcomix.scrapy.crawler_worker import CrawlerWorker
+        from webcomix.scrapy.verification.verification_spider import (
+            VerificationSpider,
+        )
 
         worker = CrawlerWorker(
-            settings,
+            self.verification_settings(),
             True,
             VerificationSpider,
-            start_url=self.start_url,
-            comic_image_selector=self.comic_image_selector,
-            next_page_selector=self.next_page_selector,
-            number_of_pages_to_check=1 if self.single_page else 3,
-            javascript=self.javascript,
-            alt_text=self.alt_text,
+            **self.verification_kwargs()
         )
 
-        verification = worker.start()
+        verification = []
+        for item in worker.results():
+            # Any page failing is enough to reject the XPath expressions, so
+            # the crawl stops there
+            if isinstance(item, Exception):
+                raise item
+            verification.append(item)
+        self.verified_pages = verification or None
+
+        return self.verified_pages
 
-        return verification
+    async def verify_xpath_async(self, engine: "CrawlerEngine" = None) -> List[Mapping]:
+        """
+        Verifies the XPath expressions like verify_xpath() without blocking
+        the event loop, in the CrawlerEngine given if any.
+        """
+        from webcomix.scrapy.crawler_worker import crawl_async
+        from webcomix.scrapy.verification.verification_spider import (
+            VerificationSpider,
+        )
+
+        verification = []
+        async for item in crawl_async(
+            self.verification_settings(),
+            VerificationSpider,
+            engine,
+            **self.verification_kwargs()
+        ):
+            if isinstance(item, Exception):
+                raise item
+            verification.append(item)
+        self.verified_pages = verification or None
+
+        return self.verified_pages
+
+    def verification_settings(self) -> Dict:
+        settings = {**FAKE_USERAGENT_SETTINGS, "LOG_ENABLED": self.debug}  # type: Dict
+        settings.update(self.html_cache_settings())
+
+        if self.javascript:
+            settings.update(SPLASH_SETTINGS)
+        return settings
+
+    def verification_kwargs(self) -> Dict:
+        return {
+            "start_url": self.start_url,
+            "comic_image_selector": self.comic_image_selector,
+            "next_page_selector": self.next_page_selector,
+            "number_of_pages_to_check": 1 if self.single_page else 3,
+            "javascript": self.javascript,
+            "alt_text": self.alt_text,
+        }
+
+    def definition(self) -> Dict:
+        """
+        Returns what is needed to download the comic again the same way.
+        """
+        return {
+            "name": self.name,
+            "start_url": self.start_url,
+            "comic_image_selector": self.comic_image_selector,
+            "next_page_selector": self.next_page_selector,
+            "start_page": self.start_page,
+            "alt_text": self.alt_text,
+            "javascript": self.javascript,
+            "title": self.title,
+        }
 
     @staticmethod
     def save_image_location(
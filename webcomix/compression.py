@@ -0,0 +1,155 @@
+import os
+import zlib
+from functools import partial
+from typing import Dict, List, Tuple
+from zipfile import (
+    ZIP64_LIMIT,
+    BadZipFile,
+    ZIP_BZIP2,
+    ZIP_DEFLATED,
+    ZIP_LZMA,
+    ZIP_STORED,
+    ZipFile,
+    ZipInfo,
+)
+
+COMPRESSIONS = {
+    "store": ZIP_STORED,
+    "deflate": ZIP_DEFLATED,
+    "bzip2": ZIP_BZIP2,
+    "lzma": ZIP_LZMA,
+}
+
+# Compressing these again only costs time
+COMPRESSED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".avif"}
+
+
+def compress_type(file_name: str, compression: str = "store") -> int:
+    """
+    Returns how a file is compressed in a .cbz archive: images which are
+    already compressed are always stored as they are.
+    """
+    if os.path.splitext(file_name)[1].lower() in COMPRESSED_EXTENSIONS:
+        return ZIP_STORED
+    return COMPRESSIONS[compression]
+
+
+def add_files(
+    cbz_file: ZipFile,
+    files: List[Tuple[str, str]],
+    compression: str = "store",
+    compression_level: int = None,
+    processes: int = None,
+) -> Dict[str, Tuple[int, int]]:
+    """
+    Adds the files, given as (location, name in the archive), to the
+    archive in that order. The files to deflate are compressed in parallel,
+    and only written to the archive one at a time. Returns the CRC and size
+    of each file added, computed while reading it.
+    """
+    deflated_files = [
+        location
+        for location, name in files
+        if compress_type(name, compression) == ZIP_DEFLATED
+    ]
+    from multiprocessing.pool import ThreadPool
+
+    pool = ThreadPool(processes) if len(deflated_files) > 1 else None
+    try:
+        # zlib releases the GIL while compressing, so threads are enough to
+        # use every core without copying the files between processes
+        deflated = (pool.imap if pool is not None else map)(
+            partial(deflate_file, compression_level=compression_level), deflated_files
+        )
+        written = {}
+        for location, name in files:
+            file_compress_type = compress_type(name, compression)
+            zip_info = ZipInfo.from_file(location, name)
+            if file_compress_type == ZIP_DEFLATED:
+                data, crc = next(deflated)
+                write_deflated(cbz_file, zip_info, data, crc)
+            else:
+                with open(location, "rb") as file:
+                    data = file.read()
+                crc = zlib.crc32(data)
+                cbz_file.writestr(
+                    zip_info,
+                    data,
+                    compress_type=file_compress_type,
+                    compresslevel=compression_level,
+                )
+            written[name] = (crc, zip_info.file_size)
+        return written
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def deflate_file(location: str, compression_level: int = None) -> Tuple[bytes, int]:
+    with open(location, "rb") as file:
+        data = file.read()
+    compressor = zlib.compressobj(
+        zlib.Z_DEFAULT_COMPRESSION if compression_level is None else compression_level,
+        zlib.DEFLATED,
+        -zlib.MAX_WBITS,
+    )
+    return compressor.compress(data) + compressor.flush(), zlib.crc32(data)
+
+
+def write_deflated(cbz_file: ZipFile, zip_info: ZipInfo, data: bytes, crc: int) -> None:
+    """
+    Writes a member that was already deflated into the archive, the same way
+    ZipFile.write would have after compressing it itself.
+    """
+    zip_info.compress_type = ZIP_DEFLATED
+    zip_info.compress_size = len(data)
+    zip_info.CRC = crc
+    zip64 = zip_info.file_size > ZIP64_LIMIT or zip_info.compress_size > ZIP64_LIMIT
+    with cbz_file._lock:
+        cbz_file.fp.seek(cbz_file.start_dir)
+        zip_info.header_offset = cbz_file.fp.tell()
+        cbz_file._writecheck(zip_info)
+        cbz_file._didModify = True
+        cbz_file.fp.write(zip_info.FileHeader(zip64))
+        cbz_file.fp.write(data)
+        cbz_file.start_dir = cbz_file.fp.tell()
+        cbz_file.filelist.append(zip_info)
+        cbz_file.NameToInfo[zip_info.filename] = zip_info
+
+
+def drop_replaced_members(cbz_path: str) -> None:
+    """
+    Rewrites the archive without the members which were replaced by a later
+    member of the same name, keeping each page where it first was.
+    """
+    with ZipFile(cbz_path) as cbz_file:
+        names = list(dict.fromkeys(cbz_file.namelist()))
+        if len(names) == len(cbz_file.infolist()):
+            return
+        new_path = "{}.tmp".format(cbz_path)
+        with ZipFile(new_path, "w") as new_file:
+            for name in names:
+                zip_info = cbz_file.getinfo(name)
+                new_file.writestr(
+                    zip_info,
+                    cbz_file.read(zip_info),
+                    compress_type=zip_info.compress_type,
+                )
+    os.replace(new_path, cbz_path)
+
+
+def verify_files(cbz_path: str, written: Dict[str, Tuple[int, int]]) -> None:
+    """
+    Checks the entries of the central directory of the archive against the
+    CRC and size of the files just added to it, without reading any member.
+    """
+    with ZipFile(cbz_path) as cbz_file:
+        for name, (crc, size) in written.items():
+            try:
+                zip_info = cbz_file.getinfo(name)
+            except KeyError:
+                raise BadZipFile("{} is missing from the archive.".format(name))
+            if zip_info.CRC != crc or zip_info.file_size != size:
+                raise BadZipFile(
+                    "{} doesn't match the file added to the archive.".format(name)
+                )
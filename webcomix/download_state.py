@@ -0,0 +1,58 @@
+import json
+import os
+from typing import Dict, Optional, Tuple
+
+
+class DownloadState:
+    """
+    Where the last download of a comic stopped, kept in a file next to its
+    output so that the next download can start from the last page reached
+    instead of the first one.
+    """
+
+    def __init__(self, path: str, comic: Dict):
+        self.path = path
+        self.comic = comic
+
+    @staticmethod
+    def location(name: str) -> str:
+        return "{}.webcomix.json".format(name)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["DownloadState"]:
+        """
+        Returns the state saved at the path, whatever comic it was saved for.
+        """
+        state = cls._read(path)
+        if state is None or "comic" not in state:
+            return None
+        return cls(path, state["comic"])
+
+    def last_page(self) -> Optional[Tuple[str, int]]:
+        """
+        Returns the url and number of the last page reached by the previous
+        download, if it was made with the same settings as this one.
+        """
+        state = self._read(self.path)
+        if state is None or state.get("comic") != self.comic:
+            return None
+        return state["last_page_url"], state["last_page"]
+
+    def save(self, last_page_url: str, last_page: int) -> None:
+        state = {
+            "comic": self.comic,
+            "last_page_url": last_page_url,
+            "last_page": last_page,
+        }
+        temporary_path = "{}.tmp".format(self.path)
+        with open(temporary_path, "w") as state_file:
+            json.dump(state, state_file)
+        os.replace(temporary_path, self.path)
+
+    @staticmethod
+    def _read(path: str) -> Optional[Dict]:
+        try:
+            with open(path) as state_file:
+                return json.load(state_file)
+        except (OSError, ValueError):
+            return None
@@ -0,0 +1,354 @@
+import asyncio
+import hashlib
+import os
+from collections import defaultdict
+from io import BytesIO
+from typing import AsyncIterator, Dict, List, Mapping, Optional, Set, Tuple
+from urllib.parse import urljoin, urlparse
+from urllib.request import url2pathname
+
+import click
+from lxml import etree
+from w3lib.encoding import html_to_unicode
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+from webcomix.comic import Comic
+from webcomix.exceptions import CrawlerBlocked
+from webcomix.manifest import FAILED, Manifest
+from webcomix.scrapy.download.cbz_files_store import CbzFilesStore
+from webcomix.scrapy.util import is_not_end_of_comic
+
+# Connections kept open to each website
+CONNECTIONS_PER_HOST = 8
+
+# Seconds before a request is given up, and how many times a request which
+# failed is made again, as with Scrapy
+TIMEOUT = 180
+RETRY_TIMES = 2
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504, 522, 524}
+
+
+class FastDownload:
+    """
+    Download of a comic with aiohttp and lxml instead of Scrapy, for comics
+    which don't need Javascript. It takes the settings and the ComicSpider
+    arguments of the download, goes through the pages one by one like the
+    ComicSpider, and saves the images like the ComicPipeline while the next
+    pages are fetched.
+    """
+
+    def __init__(self, settings: Dict, crawl_kwargs: Dict):
+        if aiohttp is None:
+            raise ImportError(
+                "The fast engine needs aiohttp, installed with: pip install webcomix[fast]"
+            )
+        self.settings = settings
+        self.start_url = crawl_kwargs["start_url"]
+        self.start_page = crawl_kwargs.get("start_page", 1)
+        self.comic_image_selector = crawl_kwargs["comic_image_selector"]
+        self.next_page_selector = crawl_kwargs["next_page_selector"]
+        self.directory = crawl_kwargs["directory"]
+        self.title = crawl_kwargs.get("title", False)
+        self.alt_text = crawl_kwargs.get("alt_text", None)
+        self.download_state = crawl_kwargs.get("download_state", None)
+        self.verified_pages = crawl_kwargs.get("verified_pages", None)
+        files_store = settings["FILES_STORE"]
+        self.store = (
+            CbzFilesStore(files_store) if files_store.startswith("cbz://") else None
+        )  # type: Optional[CbzFilesStore]
+        self.manifest = None  # type: Optional[Manifest]
+        self.downloaded = set()  # type: Set[str]
+        self.session = None
+        self.images = []  # type: List[asyncio.Future]
+        self.last_page = None  # type: Optional[Tuple[str, int]]
+
+    @property
+    def domain(self) -> str:
+        return urlparse(self.start_url).netloc
+
+    async def pages(self) -> AsyncIterator[Dict]:
+        """
+        Downloads the comic, returning each page gone through once its
+        images are requested. The images downloaded so far are kept if the
+        download is stopped.
+        """
+        self.open()
+        finished = False
+        try:
+            async with aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=CONNECTIONS_PER_HOST),
+                headers={"User-Agent": self.settings.get("FAKEUSERAGENT_FALLBACK")},
+                timeout=aiohttp.ClientTimeout(total=TIMEOUT),
+            ) as self.session:
+                try:
+                    async for page in self.go_through_pages():
+                        yield page
+                    await asyncio.gather(*self.images)
+                    finished = True
+                finally:
+                    if not finished:
+                        for image in self.images:
+                            image.cancel()
+                        await asyncio.gather(*self.images, return_exceptions=True)
+        finally:
+            self.close(finished)
+
+    def open(self) -> None:
+        self.manifest = Manifest(Manifest.location(self.directory))
+        self.manifest.open(self.directory)
+        self.downloaded = self.manifest.downloaded_files()
+        if self.store is not None:
+            self.store.open(
+                self.settings.get("CBZ_COMPRESSION", "store"),
+                self.settings.get("CBZ_COMPRESSION_LEVEL"),
+            )
+
+    def close(self, finished: bool) -> None:
+        if self.store is not None:
+            self.store.close()
+        if self.manifest is not None:
+            self.manifest.close(self.directory)
+            self.manifest = None
+        # An interrupted download resumes from where the previous complete
+        # one stopped, since the images of the last pages may be missing
+        if finished and self.download_state is not None and self.last_page:
+            self.download_state.save(*self.last_page)
+
+    async def go_through_pages(self) -> AsyncIterator[Dict]:
+        page = self.start_page
+        next_url = self.start_url  # type: Optional[str]
+        for verified_page in self.verified_pages or []:
+            click.echo("Downloading page {}".format(verified_page["url"]))
+            yield self.request_images(
+                verified_page["url"],
+                page,
+                verified_page["image_urls"],
+                verified_page["alt_text"],
+            )
+            page += len(verified_page["image_urls"])
+            next_url = verified_page["next_page_url"]
+        visited = set()
+        while next_url is not None and next_url not in visited:
+            visited.add(next_url)
+            click.echo("Downloading page {}".format(next_url))
+            response = await self.fetch(next_url)
+            if response is not None and response[0] == 403:
+                raise CrawlerBlocked()
+            if response is None or response[0] != 200:
+                return
+            _, url, body, headers = response
+            document = parse_page(body, headers.get("Content-Type"))
+            comic_image_urls = [
+                urljoin(url, comic_image_url.strip())
+                for comic_image_url in xpath_values(document, self.comic_image_selector)
+            ]
+            alt_text = (
+                next(iter(xpath_values(document, self.alt_text)), None)
+                if self.alt_text is not None
+                else None
+            )
+            next_page_url = next(
+                iter(xpath_values(document, self.next_page_selector)), None
+            )
+            yield self.request_images(url, page, comic_image_urls, alt_text)
+            page += len(comic_image_urls)
+            next_url = (
+                urljoin(url, next_page_url).strip()
+                if is_not_end_of_comic(next_page_url)
+                else None
+            )
+
+    def request_images(
+        self, url: str, page: int, comic_image_urls: List[str], alt_text: str
+    ) -> Dict:
+        self.last_page = (url, page)
+        for index, comic_image_url in enumerate(comic_image_urls):
+            self.request_image(comic_image_url, page + index, alt_text, url)
+        if not comic_image_urls:
+            click.echo("Could not find comic image.")
+        return {
+            "url": url,
+            "page": page,
+            "image_urls": comic_image_urls,
+            "alt_text": alt_text,
+        }
+
+    def request_image(
+        self, url: str, page: int, alt_text: Optional[str], page_url: str
+    ) -> None:
+        click.echo("Saving image {}".format(url))
+        image_file_name = Comic.save_image_filename(
+            url, page, self.title, self.directory
+        )
+        if (
+            image_file_name in self.downloaded
+            or Comic.save_image_location(url, page) in self.downloaded
+        ):
+            click.echo("The image was already downloaded. Skipping...")
+            return
+        self.downloaded.add(image_file_name)
+        if self.store is not None:
+            self.store.expect(
+                image_file_name,
+                (
+                    []
+                    if alt_text is None
+                    else [(Comic.save_alt_text_location(page), alt_text)]
+                ),
+            )
+        elif alt_text is not None:
+            with open(
+                Comic.save_alt_text_location(page, self.directory), "w"
+            ) as alt_text_file:
+                alt_text_file.write(alt_text)
+        self.images.append(
+            asyncio.ensure_future(
+                self.download_image(url, image_file_name, page, page_url)
+            )
+        )
+
+    async def download_image(
+        self, url: str, image_file_name: str, page: int, page_url: str
+    ) -> None:
+        response = await self.fetch(url)
+        if response is None or response[0] != 200:
+            if self.store is not None:
+                self.store.fail(image_file_name)
+            self.record(image_file_name, page, page_url, url, status=FAILED)
+            click.echo("Could not find comic image.")
+            return
+        _, _, body, headers = response
+        if self.store is not None:
+            self.store.persist_file(image_file_name, BytesIO(body), None)
+        else:
+            with open(os.path.join(self.directory, image_file_name), "wb") as image:
+                image.write(body)
+        self.record(
+            image_file_name,
+            page,
+            page_url,
+            url,
+            size=len(body),
+            content_hash=hashlib.md5(body).hexdigest(),
+            etag=headers.get("ETag"),
+            last_modified=headers.get("Last-Modified"),
+        )
+
+    def record(
+        self, image_file_name: str, page: int, page_url: str, url: str, **kwargs
+    ) -> None:
+        if self.manifest is not None:
+            self.manifest.add(
+                image_file_name, page=page, page_url=page_url, image_url=url, **kwargs
+            )
+
+    async def fetch(self, url: str) -> Optional[Tuple[int, str, bytes, Mapping]]:
+        """
+        Returns the status, URL, body and headers of the response, or None if
+        the website couldn't be reached.
+        """
+        if urlparse(url).scheme == "file":
+            try:
+                with open(url2pathname(urlparse(url).path), "rb") as local_file:
+                    return 200, url, local_file.read(), {}
+            except OSError:
+                return None
+        for attempt in range(RETRY_TIMES + 1):
+            try:
+                async with self.session.get(url) as response:
+                    body = await response.read()
+                    if response.status in RETRY_STATUSES and attempt < RETRY_TIMES:
+                        continue
+                    return response.status, str(response.url), body, response.headers
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                continue
+        return None
+
+
+def parse_page(body: bytes, content_type: Optional[str] = None):
+    """
+    Parses the page the way Scrapy does, so that the XPath expressions select
+    the same things.
+    """
+    _, text = html_to_unicode(content_type, body)
+    body = text.strip().replace("\x00", "").encode("utf8") or b"<html/>"
+    return etree.fromstring(
+        body, parser=etree.HTMLParser(recover=True, encoding="utf8")
+    )
+
+
+def xpath_values(document, selector: str) -> List[str]:
+    """
+    Returns what the XPath expression selects as text, like getall() does
+    with Scrapy.
+    """
+    results = document.xpath(selector)
+    if not isinstance(results, list):
+        results = [results]
+    values = []
+    for result in results:
+        if isinstance(result, etree._Element):
+            values.append(
+                etree.tostring(
+                    result, method="html", encoding="unicode", with_tail=False
+                )
+            )
+        elif result is True or result is False:
+            values.append("1" if result else "0")
+        else:
+            values.append(str(result))
+    return values
+
+
+def run_downloads(
+    downloads: List[FastDownload], jobs: int = 1, jobs_per_domain: int = None
+) -> List[Optional[Exception]]:
+    """
+    Runs the downloads in a single event loop, at most jobs of them at the
+    same time and at most jobs_per_domain of them from the same website.
+    Returns the error that stopped each download, if any.
+    """
+    loop = asyncio.new_event_loop()
+    task = asyncio.ensure_future(
+        download_all(downloads, jobs, jobs_per_domain), loop=loop
+    )
+    try:
+        return loop.run_until_complete(task)
+    except KeyboardInterrupt:
+        # The downloads are stopped properly, keeping what they downloaded
+        task.cancel()
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+        raise
+    finally:
+        loop.close()
+
+
+async def download_all(
+    downloads: List[FastDownload], jobs: int = 1, jobs_per_domain: int = None
+) -> List[Optional[Exception]]:
+    semaphore = asyncio.Semaphore(jobs)
+    domain_semaphores = defaultdict(
+        lambda: asyncio.Semaphore(jobs_per_domain or jobs)
+    )  # type: Dict[str, asyncio.Semaphore]
+
+    async def download(fast_download: FastDownload) -> Optional[Exception]:
+        # A download waiting for its website doesn't hold one of the global
+        # slots, so the other websites keep going meanwhile
+        async with domain_semaphores[fast_download.domain], semaphore:
+            try:
+                async for _ in fast_download.pages():
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as exception:
+                return exception
+        return None
+
+    return await asyncio.gather(*(download(d) for d in downloads))
@@ -0,0 +1,196 @@
+import json
+import os
+import sqlite3
+from typing import Dict, Optional, Set
+from zipfile import ZipFile
+
+DOWNLOADED = "downloaded"
+FAILED = "failed"
+
+COLUMNS = [
+    "file_name",
+    "page",
+    "page_url",
+    "image_url",
+    "size",
+    "content_hash",
+    "etag",
+    "last_modified",
+    "status",
+]
+
+
+class Manifest:
+    """
+    Every image of a comic downloaded so far, or which failed to download,
+    kept in an SQLite database next to the comic. The rows are written in
+    batches, so that keeping the manifest doesn't slow the download down.
+    """
+
+    BATCH_SIZE = 100
+
+    def __init__(self, path: str):
+        self.path = path
+        self.created = not os.path.isfile(path)
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS images ("
+                "file_name TEXT PRIMARY KEY, page INTEGER, page_url TEXT, "
+                "image_url TEXT, size INTEGER, content_hash TEXT, etag TEXT, "
+                "last_modified TEXT, status TEXT)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS outputs (directory TEXT PRIMARY KEY, "
+                "signature TEXT)"
+            )
+        self.pending = {}  # type: Dict[str, tuple]
+
+    @staticmethod
+    def location(name: str) -> str:
+        return "{}.webcomix.sqlite".format(name)
+
+    def open(self, directory: str) -> None:
+        """
+        Rebuilds the manifest from the images in the directory and in the
+        .cbz archive of the comic, unless they are still as they were when
+        the manifest was last closed.
+        """
+        row = self.connection.execute(
+            "SELECT signature FROM outputs WHERE directory = ?", (directory,)
+        ).fetchone()
+        if self.created or row is None or row[0] != output_signature(directory):
+            self.rebuild(directory)
+
+    def close(self, directory: str = None) -> None:
+        self.commit()
+        if directory is not None:
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO outputs VALUES (?, ?)",
+                    (directory, output_signature(directory)),
+                )
+        self.connection.close()
+
+    def add(
+        self,
+        file_name: str,
+        page: int = None,
+        page_url: str = None,
+        image_url: str = None,
+        size: int = None,
+        content_hash: str = None,
+        etag: str = None,
+        last_modified: str = None,
+        status: str = DOWNLOADED,
+    ) -> None:
+        self.pending[file_name] = (
+            file_name,
+            page,
+            page_url,
+            image_url,
+            size,
+            content_hash,
+            etag,
+            last_modified,
+            status,
+        )
+        if len(self.pending) >= self.BATCH_SIZE:
+            self.commit()
+
+    def commit(self) -> None:
+        if not self.pending:
+            return
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO images VALUES ({})".format(
+                    ", ".join("?" * len(COLUMNS))
+                ),
+                self.pending.values(),
+            )
+        self.pending.clear()
+
+    def downloaded_files(self) -> Set[str]:
+        self.commit()
+        return set(
+            file_name
+            for (file_name,) in self.connection.execute(
+                "SELECT file_name FROM images WHERE status = ?", (DOWNLOADED,)
+            )
+        )
+
+    def images(self, status: str = DOWNLOADED) -> Dict[str, Dict]:
+        """
+        Returns the rows of the images with the status, by file name.
+        """
+        self.commit()
+        rows = self.connection.execute(
+            "SELECT {} FROM images WHERE status = ?".format(", ".join(COLUMNS)),
+            (status,),
+        )
+        return {row[0]: dict(zip(COLUMNS, row)) for row in rows}
+
+    def rebuild(self, directory: str) -> None:
+        """
+        Lists the images found in the directory and in the .cbz archive of
+        the comic again. What isn't known from the files alone, such as the
+        URL of the images, is lost.
+        """
+        self.pending.clear()
+        with self.connection:
+            self.connection.execute("DELETE FROM images")
+        if os.path.isdir(directory):
+            for file_name in os.listdir(directory):
+                self.add(
+                    file_name,
+                    page=page_of(file_name),
+                    size=os.path.getsize(os.path.join(directory, file_name)),
+                )
+        cbz_path = "{}.cbz".format(directory)
+        if os.path.isfile(cbz_path):
+            with ZipFile(cbz_path) as cbz_file:
+                for zip_info in cbz_file.infolist():
+                    self.add(
+                        zip_info.filename,
+                        page=page_of(zip_info.filename),
+                        size=zip_info.file_size,
+                        content_hash="crc32:{:08x}".format(zip_info.CRC),
+                    )
+        self.commit()
+
+    def report(self) -> Dict:
+        self.commit()
+        downloaded, size, last_page = self.connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), MAX(page) FROM images "
+            "WHERE status = ?",
+            (DOWNLOADED,),
+        ).fetchone()
+        (failed,) = self.connection.execute(
+            "SELECT COUNT(*) FROM images WHERE status = ?", (FAILED,)
+        ).fetchone()
+        return {
+            "downloaded": downloaded,
+            "failed": failed,
+            "size": size,
+            "last_page": last_page,
+        }
+
+
+def page_of(file_name: str) -> Optional[int]:
+    name = os.path.splitext(file_name)[0].rsplit("-", 1)[-1]
+    return int(name) if name.isdigit() else None
+
+
+def output_signature(directory: str) -> str:
+    """
+    Returns what changes whenever a file is added to or removed from the
+    directory or the .cbz archive of the comic, without listing them.
+    """
+    cbz_path = "{}.cbz".format(directory)
+    signature = {}
+    if os.path.isdir(directory):
+        signature["directory"] = os.stat(directory).st_mtime_ns
+    if os.path.isfile(cbz_path):
+        cbz_stat = os.stat(cbz_path)
+        signature["cbz"] = [cbz_stat.st_size, cbz_stat.st_mtime_ns]
+    return json.dumps(signature, sort_keys=True)
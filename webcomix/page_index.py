@@ -0,0 +1,96 @@
+import csv
+import json
+import os
+from typing import Dict, Iterator, List, Optional
+
+CSV_COLUMNS = ["page", "url", "image_url", "alt_text"]
+
+
+def index_location(name: str) -> str:
+    return "{}.index.jsonl".format(name)
+
+
+def is_csv(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() == ".csv"
+
+
+class PageIndexWriter:
+    """
+    Writes a page index, as JSON Lines with one line per page, or as CSV
+    with one row per image if its path ends with .csv. The images of a page
+    are numbered from the page number on.
+    """
+
+    def __init__(self, path: str, append: bool = False):
+        self.csv = is_csv(path)
+        write_header = not (append and os.path.isfile(path))
+        self.index_file = open(path, "a" if append else "w", newline="")
+        if self.csv:
+            self.csv_writer = csv.writer(self.index_file)
+            if write_header:
+                self.csv_writer.writerow(CSV_COLUMNS)
+
+    def write_page(
+        self, page: int, url: str, image_urls: List[str], alt_text: Optional[str]
+    ) -> None:
+        if self.csv:
+            for offset, image_url in enumerate(image_urls):
+                self.csv_writer.writerow([page + offset, url, image_url, alt_text])
+            return
+        line = json.dumps(
+            {
+                "page": page,
+                "url": url,
+                "image_urls": image_urls,
+                "alt_text": alt_text,
+            },
+            separators=(",", ":"),
+        )
+        self.index_file.write(line + "\n")
+
+    def close(self) -> None:
+        self.index_file.close()
+
+
+def read_images(
+    path: str, first_page: int = None, last_page: int = None
+) -> Iterator[Dict]:
+    """
+    Returns the images listed in the page index, in order, along with their
+    page number and alt text, keeping only those between first_page and
+    last_page if given. An image listed again, as the last page of a
+    resumed download is, only comes out once.
+    """
+    last_number = None
+    for image in _read_index(path):
+        number = image["page"]
+        if last_number is not None and number <= last_number:
+            continue
+        last_number = number
+        if first_page is not None and number < first_page:
+            continue
+        if last_page is not None and number > last_page:
+            return
+        yield image
+
+
+def _read_index(path: str) -> Iterator[Dict]:
+    with open(path, newline="") as index_file:
+        if is_csv(path):
+            for row in csv.DictReader(index_file):
+                yield {
+                    "url": row["image_url"],
+                    "page": int(row["page"]),
+                    "alt_text": row["alt_text"] or None,
+                }
+            return
+        for line in index_file:
+            if not line.strip():
+                continue
+            page = json.loads(line)
+            for offset, image_url in enumerate(page["image_urls"]):
+                yield {
+                    "url": image_url,
+                    "page": page["page"] + offset,
+                    "alt_text": page.get("alt_text"),
+                }
@@ -1,15 +1,30 @@
+import asyncio
 import signal
 from multiprocessing import Process, Queue
+from collections import defaultdict
+from queue import Empty
+from threading import Thread
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
 
 from pydispatch import dispatcher
 from scrapy import signals
-from scrapy.crawler import CrawlerProcess
+from scrapy.crawler import Crawler, CrawlerProcess
+from twisted.internet.defer import DeferredList, DeferredSemaphore
+
+# Items a crawl puts in its result queue before its spider waits for them to
+# be read, so that they don't pile up in memory during long crawls
+RESULT_QUEUE_SIZE = 100
+
+# Put in the result queue once a crawl is over
+CRAWL_DONE = "crawl done"
 
 
 class CrawlerWorker(Process):
     def __init__(self, settings, return_items, *crawl_args, **crawl_kwargs):
         super().__init__(daemon=True)
-        self.result_queue = Queue()
+        self.result_queue = Queue(RESULT_QUEUE_SIZE)
+        self.settings = settings
         self.crawl_args = crawl_args
         self.crawl_kwargs = crawl_kwargs
 
@@ -31,20 +46,341 @@ class CrawlerWorker(Process):
             *self.crawl_args, **self.crawl_kwargs, result_queue=self.result_queue
         )
         self.process.start()
+        self.result_queue.put(CRAWL_DONE)
 
-    def start(self):
-        super().start()
-        super().join()
-
-        result = []
-        while not self.result_queue.empty():
-            result.append(self.result_queue.get())
+    def results(self) -> Iterator:
+        """
+        Runs the crawl and returns the items and errors its spider puts in
+        the result queue as they come. The crawl is stopped if they stop
+        being read before it is over.
+        """
+        engine = CrawlerEngine.current
+        if engine is not None:
+            yield from engine.crawl(
+                self.settings, *self.crawl_args, **self.crawl_kwargs
+            )
+        else:
+            super().start()
+            finished = False
+            try:
+                yield from read_results(self.result_queue, self)
+                finished = True
+            finally:
+                if not finished:
+                    # The spider may be waiting for room in the result queue
+                    # to shut down
+                    self.terminate()
+                    for _ in read_results(self.result_queue, self):
+                        pass
+                super().join()
 
         if self.kill_process:
             raise KeyboardInterrupt
+
+    def start(self):
+        result = list(self.results())
         if len(result) == 1 and isinstance(result[0], Exception):
             raise result[0]
         elif not result:
             return None
         else:
             return result
+
+
+class BatchCrawlerWorker(Process):
+    """
+    Runs several crawls in a single CrawlerProcess, at most max_active of
+    them at the same time, and at most max_active_per_domain of them on the
+    same website if set. Each crawl is given as its own settings, spider
+    class and spider arguments.
+    """
+
+    def __init__(
+        self,
+        settings,
+        crawls: List[Tuple[Dict, type, Dict]],
+        max_active,
+        max_active_per_domain=None,
+    ):
+        super().__init__(daemon=True)
+        self.result_queues = [Queue() for _ in crawls]
+        self.crawls = crawls
+        self.max_active = max_active
+        self.max_active_per_domain = max_active_per_domain
+
+        self.process = CrawlerProcess(settings)
+        self.kill_process = False
+        dispatcher.connect(self._spider_error, signals.spider_error)
+        signal.signal(signal.SIGINT, self._exit_gracefully)
+        signal.signal(signal.SIGTERM, self._exit_gracefully)
+
+    def _spider_error(self, failure, spider):
+        spider.result_queue.put(failure.value)
+
+    def _exit_gracefully(self, signum, frame):
+        self.kill_process = True
+        self.process.stop()
+
+    def run(self):
+        from twisted.internet import reactor
+
+        semaphore = DeferredSemaphore(self.max_active)
+        domain_semaphores = defaultdict(
+            lambda: DeferredSemaphore(self.max_active_per_domain)
+        )
+        crawls = []
+        for (settings, spider, crawl_kwargs), result_queue in zip(
+            self.crawls, self.result_queues
+        ):
+            crawler = Crawler(spider, settings)
+            crawl_kwargs = {**crawl_kwargs, "result_queue": result_queue}
+            if self.max_active_per_domain is None:
+                crawl = semaphore.run(self.process.crawl, crawler, **crawl_kwargs)
+            else:
+                # A crawl waiting for its website doesn't hold one of the
+                # global slots, so the other websites keep going meanwhile
+                domain = urlparse(crawl_kwargs.get("start_url", "")).netloc
+                crawl = domain_semaphores[domain].run(
+                    semaphore.run, self.process.crawl, crawler, **crawl_kwargs
+                )
+            crawls.append(crawl)
+        # The crawls waiting for the semaphore aren't known to the
+        # CrawlerProcess yet, so it can't tell by itself when all are done
+        DeferredList(crawls).addBoth(lambda _: reactor.stop())
+        self.process.start(stop_after_crawl=False)
+
+    def start(self):
+        """
+        Returns the items and errors put in the result queue of each crawl,
+        in the order of the crawls.
+        """
+        super().start()
+        super().join()
+
+        results = []
+        for result_queue in self.result_queues:
+            result = []
+            while not result_queue.empty():
+                result.append(result_queue.get())
+            results.append(result)
+
+        if self.kill_process:
+            raise KeyboardInterrupt
+        return results
+
+
+def read_results(result_queue: Queue, process: Process) -> Iterator:
+    """
+    Returns what is put in the result queue until the crawl is over, or
+    until the process running it is stopped, by Ctrl-C for instance.
+    """
+    while True:
+        try:
+            item = result_queue.get(timeout=1)
+        except Empty:
+            if not process.is_alive() and result_queue.empty():
+                return
+            continue
+        if item == CRAWL_DONE:
+            return
+        yield item
+
+
+class JobResultQueue:
+    """
+    Result queue given to the spider of a crawl run by a CrawlerEngine,
+    putting what the spider puts in it in the results of the engine along
+    with the number of the crawl.
+    """
+
+    def __init__(self, results: Queue, job: int):
+        self.results = results
+        self.job = job
+
+    def put(self, item) -> None:
+        self.results.put((self.job, item))
+
+
+class CrawlerEngine(Process):
+    """
+    Process whose reactor is only started once, and which then runs the
+    crawls submitted to it one after the other, so that only the first one
+    pays for forking and starting Scrapy. While it is used as a context
+    manager, every CrawlerWorker runs its crawl in it. The engine is read
+    either with crawl(), one crawl at a time, or from an event loop with
+    crawl_async(), as many crawls at the same time as needed.
+    """
+
+    current = None  # type: Optional[CrawlerEngine]
+
+    def __init__(self, settings: Dict = None):
+        super().__init__(daemon=True)
+        # The settings of each crawl are its own, logging included
+        self.settings = settings or {"LOG_ENABLED": False}
+        self.jobs = Queue()  # type: Queue
+        self.results = Queue(RESULT_QUEUE_SIZE)  # type: Queue
+        self.job_count = 0
+        # Crawls running in the engine, by number
+        self.crawlers = {}  # type: Dict[int, Crawler]
+        # Results of the crawls read from the event loop, by number
+        self.loop = None  # type: Optional[asyncio.AbstractEventLoop]
+        self.job_queues = {}  # type: Dict[int, asyncio.Queue]
+
+    def __enter__(self) -> "CrawlerEngine":
+        CrawlerEngine.current = self
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        CrawlerEngine.current = None
+        self.stop()
+
+    def run(self):
+        self.process = CrawlerProcess(self.settings)
+        Thread(target=self._read_jobs, daemon=True).start()
+        self.process.start(stop_after_crawl=False)
+
+    def _read_jobs(self):
+        from twisted.internet import reactor
+
+        while True:
+            message = self.jobs.get()
+            if message is None:
+                reactor.callFromThread(self._stop)
+                return
+            if len(message) == 1:
+                reactor.callFromThread(self._stop_crawl, *message)
+            else:
+                reactor.callFromThread(self._crawl, *message)
+
+    def _crawl(self, job: int, settings: Dict, spider: type, crawl_kwargs: Dict):
+        result_queue = JobResultQueue(self.results, job)
+        crawler = Crawler(spider, settings)
+        crawler.signals.connect(self._spider_error, signals.spider_error)
+        self.crawlers[job] = crawler
+        crawl = self.process.crawl(crawler, **crawl_kwargs, result_queue=result_queue)
+        crawl.addErrback(lambda failure: result_queue.put(failure.value))
+        crawl.addBoth(lambda _: self.crawlers.pop(job, None))
+        crawl.addBoth(lambda _: result_queue.put(CRAWL_DONE))
+
+    def _stop(self):
+        from twisted.internet import reactor
+
+        # The crawls still running are closed properly, saving their state
+        self.process.stop().addBoth(lambda _: reactor.stop())
+
+    def _stop_crawl(self, job: int):
+        crawler = self.crawlers.get(job)
+        if crawler is not None:
+            crawler.stop()
+
+    def _spider_error(self, failure, spider):
+        spider.result_queue.put(failure.value)
+
+    def crawl(self, settings: Dict, spider: type, **crawl_kwargs) -> Iterator:
+        """
+        Runs a crawl in the engine, starting it first if needed, and returns
+        what its spider puts in its result queue as it comes. The crawl is
+        stopped if it stops being read before it is over.
+        """
+        if not self.is_alive():
+            self.start()
+        self.job_count += 1
+        job = self.job_count
+        self.jobs.put((job, dict(settings), spider, crawl_kwargs))
+        finished = False
+        try:
+            yield from self._job_results(job)
+            finished = True
+        finally:
+            if not finished:
+                self.jobs.put((job,))
+                for _ in self._job_results(job):
+                    pass
+
+    def _job_results(self, job: int) -> Iterator:
+        # What is left of the crawls stopped early is skipped
+        for result_job, item in read_results(self.results, self):
+            if result_job == job:
+                if item == CRAWL_DONE:
+                    return
+                yield item
+
+    async def crawl_async(
+        self, settings: Dict, spider: type, **crawl_kwargs
+    ) -> AsyncIterator:
+        """
+        Runs a crawl in the engine like crawl(), but returns its results to
+        the event loop without blocking it. The crawl is stopped if it is
+        cancelled or stops being read before it is over.
+        """
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+            if not self.is_alive():
+                self.start()
+            Thread(target=self._dispatch_results, daemon=True).start()
+        self.job_count += 1
+        job = self.job_count
+        job_queue = asyncio.Queue()  # type: asyncio.Queue
+        self.job_queues[job] = job_queue
+        self.jobs.put((job, dict(settings), spider, crawl_kwargs))
+        finished = False
+        try:
+            while True:
+                item = await job_queue.get()
+                if item == CRAWL_DONE:
+                    finished = True
+                    return
+                yield item
+        finally:
+            del self.job_queues[job]
+            if not finished:
+                self.jobs.put((job,))
+
+    def _dispatch_results(self):
+        # A single thread reads the results of every crawl for the event loop
+        for job, item in read_results(self.results, self):
+            self._call_in_loop(self._dispatch, job, item)
+        self._call_in_loop(self._engine_stopped)
+
+    def _call_in_loop(self, callback, *args):
+        try:
+            self.loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # The event loop was closed before the engine
+            pass
+
+    def _dispatch(self, job: int, item) -> None:
+        # What is left of the crawls stopped early is skipped
+        job_queue = self.job_queues.get(job)
+        if job_queue is not None:
+            job_queue.put_nowait(item)
+
+    def _engine_stopped(self) -> None:
+        for job_queue in self.job_queues.values():
+            job_queue.put_nowait(CRAWL_DONE)
+
+    def stop(self) -> None:
+        if self.is_alive():
+            self.jobs.put(None)
+            self.join()
+
+
+async def crawl_async(
+    settings: Dict, spider: type, engine: CrawlerEngine = None, **crawl_kwargs
+) -> AsyncIterator:
+    """
+    Runs a crawl in the engine given, or else in the current one, or else in
+    an engine of its own which is stopped once the crawl is over, and returns
+    its results to the event loop as they come.
+    """
+    engine = engine or CrawlerEngine.current
+    if engine is not None:
+        async for item in engine.crawl_async(settings, spider, **crawl_kwargs):
+            yield item
+        return
+    engine = CrawlerEngine()
+    try:
+        async for item in engine.crawl_async(settings, spider, **crawl_kwargs):
+            yield item
+    finally:
+        await asyncio.get_event_loop().run_in_executor(None, engine.stop)
@@ -0,0 +1,8 @@
+import scrapy
+
+
+class CachedPage(scrapy.Item):
+    url = scrapy.Field()
+    response_url = scrapy.Field()
+    body = scrapy.Field()
+    encoding = scrapy.Field()
@@ -0,0 +1,175 @@
+from collections import Counter
+from itertools import product
+from typing import Iterable, List, Tuple
+
+from webcomix.supported_comics import supported_comics
+
+next_page_tokens = ["next"]
+image_tokens = ["comic", "image"]
+next_page_link_texts = [">", ">>", "›", "»"]
+
+generic_tags_image = ["*", "img", "div"]
+generic_tags_next = ["*", "a", "div", "li"]
+generic_attributes_image = [".", "@src", "@class", "@id", "@alt"]
+generic_attributes_next = [".", "text()", "@class", "@id", "@alt", "@rel"]
+
+CLASS_XPATH = "contains(concat(' ', normalize-space(@class), ' '), ' {} ')"
+
+
+def to_lower_case(attribute: str) -> str:
+    return "translate({}, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz')".format(
+        attribute
+    )
+
+
+class DomIndex:
+    """
+    Index of the parts of a page that usually give away where the comic image
+    and the link to the next page are, built in a single pass over the DOM.
+    """
+
+    def __init__(self, response):
+        self.response = response
+        self.ids = []  # (tag, id)
+        self.classes = []  # (tag, class)
+        self.rels = set()  # tag
+        self.link_texts = []
+        for element in response.selector.root.iter():
+            tag = element.tag
+            if not isinstance(tag, str):
+                continue
+            element_id = element.get("id")
+            if element_id and (tag, element_id) not in self.ids:
+                self.ids.append((tag, element_id))
+            for element_class in (element.get("class") or "").split():
+                if (tag, element_class) not in self.classes:
+                    self.classes.append((tag, element_class))
+            if "next" in (element.get("rel") or "").lower().split():
+                self.rels.add(tag)
+            if tag == "a":
+                text = " ".join(element.text_content().split())
+                if text and text not in self.link_texts:
+                    self.link_texts.append(text)
+
+    def ids_with(self, tokens: List[str]):
+        return [
+            (tag, element_id)
+            for token in tokens
+            for tag, element_id in self.ids
+            if token in element_id.lower() and "'" not in element_id
+        ]
+
+    def classes_with(self, tokens: List[str]):
+        return [
+            (tag, element_class)
+            for token in tokens
+            for tag, element_class in self.classes
+            if token in element_class.lower() and "'" not in element_class
+        ]
+
+    def selects(self, selector: str) -> bool:
+        try:
+            return self.response.xpath(selector).get() is not None
+        except ValueError:
+            return False
+
+
+def supported_comics_xpaths(index: int) -> List[str]:
+    """
+    Returns the XPath expressions used by the supported comics, the most
+    common ones first.
+    """
+    counter = Counter(comic[index] for comic in supported_comics.values())
+    return [xpath for xpath, _ in counter.most_common()]
+
+
+def generate_candidates(response) -> Tuple[List[str], List[str]]:
+    """
+    Returns the image and next page XPath candidates of a page, reading its
+    DOM only once.
+    """
+    dom_index = DomIndex(response)
+    return image_candidates(dom_index), next_page_candidates(dom_index)
+
+
+def image_candidates(dom_index: DomIndex) -> List[str]:
+    """
+    Returns the XPath expressions that could give the comic image of the page,
+    from the most to the least likely. Only the expressions selecting
+    something on the page are returned.
+    """
+    candidates = supported_comics_xpaths(1)
+    for tag, element_id in dom_index.ids_with(image_tokens):
+        if tag == "img":
+            candidates.append("//img[@id='{}']/@src".format(element_id))
+        else:
+            candidates.append("//{}[@id='{}']//img/@src".format(tag, element_id))
+    for tag, element_class in dom_index.classes_with(image_tokens):
+        class_xpath = CLASS_XPATH.format(element_class)
+        if tag == "img":
+            candidates.append("//img[{}]/@src".format(class_xpath))
+        else:
+            candidates.append("//{}[{}]//img/@src".format(tag, class_xpath))
+    for token, attribute in product(image_tokens, ["@alt", "@title", "@src"]):
+        candidates.append(
+            "//img[contains({}, '{}')]/@src".format(to_lower_case(attribute), token)
+        )
+    for token, tag, attribute in product(
+        image_tokens, generic_tags_image, generic_attributes_image
+    ):
+        candidates.append(
+            "//{}[contains({}, '{}')]//@src".format(
+                tag, to_lower_case(attribute), token
+            )
+        )
+    return selecting_candidates(dom_index, candidates)
+
+
+def next_page_candidates(dom_index: DomIndex) -> List[str]:
+    """
+    Returns the XPath expressions that could give the link to the next page,
+    from the most to the least likely. Only the expressions selecting
+    something on the page are returned.
+    """
+    candidates = supported_comics_xpaths(2)
+    for tag in sorted(dom_index.rels):
+        candidates.append("//{}[@rel='next']/@href".format(tag))
+    for tag, element_id in dom_index.ids_with(next_page_tokens):
+        if tag == "a":
+            candidates.append("//a[@id='{}']/@href".format(element_id))
+        else:
+            candidates.append("//{}[@id='{}']//a/@href".format(tag, element_id))
+    for tag, element_class in dom_index.classes_with(next_page_tokens):
+        class_xpath = CLASS_XPATH.format(element_class)
+        if tag == "a":
+            candidates.append("//a[{}]/@href".format(class_xpath))
+        else:
+            candidates.append("//{}[{}]//a/@href".format(tag, class_xpath))
+    for text in dom_index.link_texts:
+        if "'" in text:
+            continue
+        if text in next_page_link_texts or any(
+            token in text.lower() for token in next_page_tokens
+        ):
+            candidates.append("//a[normalize-space(.)='{}']/@href".format(text))
+    for token, attribute in product(next_page_tokens, ["@src", "@alt"]):
+        candidates.append(
+            "//a[img[contains({}, '{}')]]/@href".format(to_lower_case(attribute), token)
+        )
+    for token, tag, attribute in product(
+        next_page_tokens, generic_tags_next, generic_attributes_next
+    ):
+        candidates.append(
+            "//{}[contains({}, '{}')]//@href".format(
+                tag, to_lower_case(attribute), token
+            )
+        )
+    return selecting_candidates(dom_index, candidates)
+
+
+def selecting_candidates(dom_index: DomIndex, candidates: Iterable[str]) -> List[str]:
+    result = []  # type: List[str]
+    for candidate in candidates:
+        if candidate not in result and dom_index.selects(candidate):
+            result.append(candidate)
+    return result
@@ -0,0 +1,73 @@
+from scrapy import Spider
+
+from webcomix.scrapy.discovery.cached_page import CachedPage
+from webcomix.scrapy.discovery.candidates import generate_candidates
+from webcomix.scrapy.discovery.page_candidates import PageCandidates
+from webcomix.scrapy.request_factory import RequestFactory
+from webcomix.scrapy.util import is_not_end_of_comic
+
+
+class DiscoverySpider(Spider):
+    name = "Discovery Spider"
+
+    def __init__(self, *args, **kwargs):
+        self.start_url = kwargs.get("start_url")
+        self.next_page_selectors = kwargs.get("next_page_selectors", None)
+        self.number_of_pages_to_check = kwargs.get("number_of_pages_to_check", 3)
+        javascript = kwargs.get("javascript", False)
+        self.result_queue = kwargs.get("result_queue")
+        self.request_factory = RequestFactory(javascript)
+        self.responses = {}
+        self.depths = {self.start_url: 1}
+        super(DiscoverySpider, self).__init__(*args, **kwargs)
+
+    def start_requests(self):
+        yield self.request_factory.create(url=self.start_url, next_page=1)
+
+    def parse(self, response):
+        url = response.meta.get("requested_url", self.start_url)
+        if self.next_page_selectors is None:
+            # The DOM of the first page is indexed only once, here, for the
+            # candidates of both the image and the next page
+            image_candidates, self.next_page_selectors = generate_candidates(response)
+            self.result_queue.put(
+                PageCandidates(
+                    image_candidates=image_candidates,
+                    next_page_candidates=self.next_page_selectors,
+                )
+            )
+        if url not in self.responses:
+            self.responses[url] = response
+            self.result_queue.put(
+                CachedPage(
+                    url=url,
+                    response_url=response.url,
+                    body=response.body,
+                    encoding=response.encoding,
+                )
+            )
+        # A page can be reached at different depths by different candidates;
+        # the shallowest one decides how far its next links are followed.
+        yield from self.follow_next_pages(response, self.depths.get(url, 1))
+
+    def follow_next_pages(self, response, page):
+        if page >= self.number_of_pages_to_check:
+            return
+        for next_page_selector in self.next_page_selectors:
+            try:
+                next_page_url = response.xpath(next_page_selector).get()
+            except ValueError:
+                continue
+            if not is_not_end_of_comic(next_page_url):
+                continue
+            url = response.urljoin(next_page_url).strip()
+            if self.depths.get(url, page + 2) <= page + 1:
+                continue
+            already_requested = url in self.depths
+            self.depths[url] = page + 1
+            if url in self.responses:
+                yield from self.follow_next_pages(self.responses[url], page + 1)
+            elif not already_requested:
+                request = self.request_factory.create(url=url, next_page=page + 1)
+                request.meta["requested_url"] = url
+                yield request
@@ -0,0 +1,147 @@
+from queue import Empty, Queue
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from scrapy.http import HtmlResponse
+
+from webcomix.scrapy.verification.verification_spider import VerificationSpider
+
+NO_IMAGE_SELECTOR = "/.."
+
+
+class PageCache:
+    """
+    Pages fetched once by the DiscoverySpider, against which any pair of
+    XPath expressions can be verified without going back to the network.
+    """
+
+    def __init__(self, cached_pages=()):
+        self.pages = {}  # type: Dict[str, Mapping]
+        self.responses = {}  # type: Dict[str, HtmlResponse]
+        self.candidates = None  # type: Optional[Tuple[List[str], List[str]]]
+        for cached_page in cached_pages:
+            self.add(cached_page)
+
+    def __getstate__(self):
+        # The parsed responses are rebuilt on demand after unpickling
+        return {**self.__dict__, "responses": {}}
+
+    def __len__(self):
+        return len(self.pages)
+
+    def __contains__(self, url):
+        return url in self.pages
+
+    def add(self, cached_page: Mapping) -> None:
+        self.pages[cached_page.get("url")] = cached_page
+
+    def response(self, request) -> Optional[HtmlResponse]:
+        """
+        Returns the cached response to a request, parsed only once no matter
+        how many candidates look at it.
+        """
+        response = self.parsed_page(request.url)
+        if response is not None:
+            response.request = request
+        return response
+
+    def parsed_page(self, url: str) -> Optional[HtmlResponse]:
+        if url not in self.pages:
+            return None
+        if url not in self.responses:
+            page = self.pages[url]
+            self.responses[url] = HtmlResponse(
+                url=page.get("response_url"),
+                body=page.get("body"),
+                encoding=page.get("encoding"),
+            )
+        return self.responses[url]
+
+    def selects(self, selector: str) -> bool:
+        """
+        Returns whether the XPath expression selects anything in at least one
+        of the cached pages.
+        """
+        try:
+            return any(
+                self.parsed_page(url).xpath(selector).get() is not None
+                for url in self.pages
+            )
+        except ValueError:
+            return False
+
+    def verify_next_page_xpath(
+        self,
+        start_url: str,
+        next_page_selector: str,
+        single_page: bool = False,
+        javascript: bool = False,
+    ) -> bool:
+        """
+        Returns whether the next page XPath expression alone leads through
+        enough distinct pages for the verification to succeed.
+        """
+        try:
+            first_pages = self.verify_xpath(
+                start_url,
+                NO_IMAGE_SELECTOR,
+                next_page_selector,
+                None,
+                single_page,
+                javascript,
+            )
+        except Exception:
+            return False
+        if first_pages is None or any(
+            isinstance(page, Exception) for page in first_pages
+        ):
+            return False
+        page_links = set(page.get("url") for page in first_pages)
+        return 0 < len(page_links) == len(first_pages)
+
+    def verify_xpath(
+        self,
+        start_url: str,
+        comic_image_selector: str,
+        next_page_selector: str,
+        alt_text: str = None,
+        single_page: bool = False,
+        javascript: bool = False,
+    ) -> Optional[List[Mapping]]:
+        """
+        Replays the VerificationSpider over the cached pages. The result is
+        the same as the one given by Comic.verify_xpath for the same XPath
+        expressions.
+        """
+        result_queue = Queue()  # type: Queue
+        spider = VerificationSpider(
+            start_url=start_url,
+            comic_image_selector=comic_image_selector,
+            next_page_selector=next_page_selector,
+            number_of_pages_to_check=1 if single_page else 3,
+            javascript=javascript,
+            alt_text=alt_text,
+            result_queue=result_queue,
+        )
+        requests = list(spider.start_requests())
+        seen_urls = set()
+        while requests:
+            request = requests.pop(0)
+            if request.url in seen_urls:
+                continue
+            seen_urls.add(request.url)
+            response = self.response(request)
+            if response is not None:
+                requests.extend(spider.parse(response))
+
+        result = []
+        while True:
+            try:
+                result.append(result_queue.get_nowait())
+            except Empty:
+                break
+        if len(result) == 1 and isinstance(result[0], Exception):
+            raise result[0]
+        elif not result:
+            return None
+        else:
+            return result
@@ -0,0 +1,6 @@
+import scrapy
+
+
+class PageCandidates(scrapy.Item):
+    image_candidates = scrapy.Field()
+    next_page_candidates = scrapy.Field()
@@ -0,0 +1,55 @@
+from scrapy.http import HtmlResponse
+
+from webcomix.scrapy.discovery.candidates import generate_candidates
+
+COMIC_CONTROL_PAGE = """
+<html>
+  <body>
+    <div id="cc-comicbody"><img id="cc-comic" src="1.jpeg"></div>
+    <img class="logo" src="logo.png">
+    <a class="cc-prev" rel="prev" href="0.html">Previous</a>
+    <a class="cc-next" rel="next" href="2.html">Next</a>
+  </body>
+</html>
+"""
+
+UNRELATED_PAGE = """
+<html>
+  <body>
+    <img src="1.jpeg">
+    <a href="about.html">About</a>
+  </body>
+</html>
+"""
+
+
+def make_response(body):
+    return HtmlResponse(url="http://example.com/1.html", body=body, encoding="utf-8")
+
+
+def test_candidates_rank_common_layouts_first():
+    image_candidates, next_page_candidates = generate_candidates(
+        make_response(COMIC_CONTROL_PAGE)
+    )
+
+    assert image_candidates[0] == "//img[@id='cc-comic']/@src"
+    assert next_page_candidates[0] == "//a[@class='cc-next']/@href"
+
+
+def test_candidates_only_select_something():
+    response = make_response(COMIC_CONTROL_PAGE)
+    image_candidates, next_page_candidates = generate_candidates(response)
+
+    assert image_candidates
+    assert next_page_candidates
+    for candidate in image_candidates + next_page_candidates:
+        assert response.xpath(candidate).get() is not None
+
+
+def test_candidates_of_unrelated_page_are_empty():
+    image_candidates, next_page_candidates = generate_candidates(
+        make_response(UNRELATED_PAGE)
+    )
+
+    assert image_candidates == []
+    assert next_page_candidates == []
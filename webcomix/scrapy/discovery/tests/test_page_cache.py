@@ -0,0 +1,67 @@
+import pytest
+
+from webcomix.comic import Comic
+from webcomix.scrapy.discovery.candidates import generate_candidates
+from webcomix.exceptions import NextLinkNotFound
+from webcomix.search import fetch_first_pages
+from webcomix.tests.fake_websites.fixture import (
+    one_webpage_uri,
+    three_webpages_alt_text_uri,
+    three_webpages_classes_uri,
+)
+
+
+def test_page_cache_verification_matches_crawled_verification(
+    three_webpages_alt_text_uri,
+    three_webpages_classes_uri,
+):
+    comic = Comic(
+        "test",
+        three_webpages_alt_text_uri,
+        "//img/@src",
+        "//a/@href",
+        alt_text="//img/@title",
+    )
+    page_cache = fetch_first_pages(three_webpages_alt_text_uri, ["//a/@href"])
+
+    assert len(page_cache) == 3
+    assert (
+        page_cache.verify_xpath(
+            comic.start_url,
+            comic.comic_image_selector,
+            comic.next_page_selector,
+            comic.alt_text,
+        )
+        == comic.verify_xpath()
+    )
+
+
+def test_page_cache_follows_every_next_page_candidate(three_webpages_alt_text_uri):
+    page_cache = fetch_first_pages(
+        three_webpages_alt_text_uri, ["//div/@href", "//a/@href"]
+    )
+
+    assert len(page_cache) == 3
+
+
+def test_page_cache_raises_next_link_not_found(one_webpage_uri):
+    page_cache = fetch_first_pages(one_webpage_uri, ["//a/@href"])
+
+    with pytest.raises(NextLinkNotFound):
+        page_cache.verify_xpath(one_webpage_uri, "//img/@src", "//div/@href")
+
+
+def test_page_cache_keeps_the_candidates_generated_by_the_crawl(
+    three_webpages_classes_uri,
+):
+    page_cache = fetch_first_pages(three_webpages_classes_uri)
+
+    assert page_cache.candidates == generate_candidates(
+        page_cache.parsed_page(three_webpages_classes_uri)
+    )
+
+
+def test_page_cache_has_no_candidates_when_they_are_given(one_webpage_uri):
+    page_cache = fetch_first_pages(one_webpage_uri, ["//a/@href"])
+
+    assert page_cache.candidates is None
@@ -0,0 +1,85 @@
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+import warnings
+from zipfile import ZipFile
+
+from webcomix.compression import compress_type, drop_replaced_members
+
+
+class CbzFilesStore:
+    """
+    FilesPipeline storage writing the downloaded images straight into a .cbz
+    archive instead of a directory. The downloads finish in any order, but
+    the archive is only ever written by this store, in the order in which
+    the images were requested, so that the pages stay in order in it.
+    """
+
+    def __init__(self, uri: str):
+        self.path = uri.split("://", 1)[1]
+        self.cbz_file = None  # type: Optional[ZipFile]
+        self.expected = deque()  # type: Deque[str]
+        self.texts = {}  # type: Dict[str, List[Tuple[str, str]]]
+        self.completed = {}  # type: Dict[str, Optional[bytes]]
+        self.compression = "store"
+        self.compression_level = None  # type: Optional[int]
+        self.replaced = False
+
+    def open(self, compression: str = "store", compression_level: int = None) -> None:
+        self.compression = compression
+        self.compression_level = compression_level
+        self.cbz_file = ZipFile(self.path, mode="a")
+
+    def close(self) -> None:
+        # The images still missing at this point will never come
+        for path in list(self.expected):
+            self.completed.setdefault(path, None)
+        self.commit()
+        if self.cbz_file is not None:
+            self.cbz_file.close()
+            self.cbz_file = None
+        if self.replaced:
+            drop_replaced_members(self.path)
+            self.replaced = False
+
+    def expect(self, path: str, texts: List[Tuple[str, str]] = ()) -> None:
+        """
+        Reserves the place of an image in the archive, along with the text
+        files going with it.
+        """
+        self.expected.append(path)
+        self.texts[path] = list(texts)
+
+    def fail(self, path: str) -> None:
+        if path in self.texts:
+            self.completed[path] = None
+            self.commit()
+
+    def persist_file(self, path: str, buf, info, meta=None, headers=None) -> None:
+        self.completed[path] = buf.getvalue()
+        self.commit()
+
+    def stat_file(self, path: str, info) -> Dict:
+        # Only the images missing from the archive are requested
+        return {}
+
+    def commit(self) -> None:
+        while self.expected and self.expected[0] in self.completed:
+            path = self.expected.popleft()
+            data = self.completed.pop(path)
+            if data is not None:
+                self.write(path, data)
+            for text_path, text in self.texts.pop(path):
+                self.write(text_path, text)
+
+    def write(self, path: str, data) -> None:
+        with warnings.catch_warnings():
+            # An image downloaded again by a refresh replaces the one in the
+            # archive once it is closed
+            warnings.filterwarnings("ignore", "Duplicate name")
+            self.replaced |= path in self.cbz_file.NameToInfo
+            self.cbz_file.writestr(
+                path,
+                data,
+                compress_type=compress_type(path, self.compression),
+                compresslevel=self.compression_level,
+            )
@@ -6,3 +6,4 @@ class ComicPage(scrapy.Item):
     page = scrapy.Field()
     title = scrapy.Field()
     alt_text = scrapy.Field()
+    page_url = scrapy.Field()
@@ -1,6 +1,5 @@
 from operator import itemgetter
-import os
-from zipfile import ZipFile
+from typing import Dict, Optional, Set, Tuple
 
 import click
 import scrapy
@@ -8,52 +7,223 @@ from scrapy.exceptions import DropItem
 from scrapy.pipelines.files import FilesPipeline
 
 from webcomix.comic import Comic
+from webcomix.manifest import FAILED, Manifest
+from webcomix.scrapy.download.cbz_files_store import CbzFilesStore
 
 
 class ComicPipeline(FilesPipeline):
+    STORE_SCHEMES = {**FilesPipeline.STORE_SCHEMES, "cbz": CbzFilesStore}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.manifest = None  # type: Optional[Manifest]
+        self.downloaded = set()  # type: Set[str]
+        # Size, ETag and Last-Modified of the images downloaded, by file name
+        self.responses = {}  # type: Dict[str, Tuple]
+        # Images already downloaded, checked for changes instead of skipped
+        self.refresh = False
+        self.known = {}  # type: Dict[str, Dict]
+        self.refreshing = set()  # type: Set[str]
+
+    def open_spider(self, spider):
+        # The files already downloaded come from the manifest of the comic,
+        # which is only rebuilt from the directory and the archive when they
+        # changed since the last crawl
+        self.manifest = Manifest(Manifest.location(spider.directory))
+        self.manifest.open(spider.directory)
+        self.downloaded = self.manifest.downloaded_files()
+        self.refresh = spider.settings.getbool("REFRESH_IMAGES")
+        if self.refresh:
+            self.known = self.manifest.images()
+        if isinstance(self.store, CbzFilesStore):
+            self.store.open(
+                spider.settings.get("CBZ_COMPRESSION", "store"),
+                spider.settings.get("CBZ_COMPRESSION_LEVEL"),
+            )
+        return super().open_spider(spider)
+
+    def close_spider(self, spider):
+        if isinstance(self.store, CbzFilesStore):
+            self.store.close()
+        if self.manifest is not None:
+            self.manifest.close(spider.directory)
+            self.manifest = None
+
     def get_media_requests(self, item, info):
         click.echo("Saving image {}".format(item.get("url")))
         url, page, title, alt_text = itemgetter("url", "page", "title", "alt_text")(
             item
         )
-        image_path_directory = Comic.save_image_location(
-            url, page, info.spider.directory, title
+        image_file_name = Comic.save_image_filename(
+            url, page, title, info.spider.directory
         )
-        if os.path.isfile(image_path_directory) or self.image_in_zipfile(
-            item, info.spider.directory
+        if (
+            image_file_name in self.downloaded
+            or Comic.save_image_location(url, page) in self.downloaded
         ):
-            click.echo("The image was already downloaded. Skipping...")
-            raise DropItem("The image was already downloaded. Skipping...")
-        if alt_text is not None:
+            request = self.refresh_request(url, image_file_name)
+            if request is None:
+                click.echo("The image was already downloaded. Skipping...")
+                raise DropItem("The image was already downloaded. Skipping...")
+            self.refreshing.add(image_file_name)
+            if isinstance(self.store, CbzFilesStore):
+                self.store.expect(image_file_name)
+            yield request
+            return
+        self.downloaded.add(image_file_name)
+        if isinstance(self.store, CbzFilesStore):
+            self.store.expect(
+                image_file_name,
+                (
+                    []
+                    if alt_text is None
+                    else [(Comic.save_alt_text_location(page), alt_text)]
+                ),
+            )
+        elif alt_text is not None:
             with open(
                 Comic.save_alt_text_location(page, info.spider.directory), "w"
             ) as alt_text_file:
                 alt_text_file.write(alt_text)
-        yield scrapy.Request(
-            item.get("url"),
-            meta={
-                "image_file_name": Comic.save_image_filename(
-                    item.get("url"), item.get("page"), title, info.spider.directory
-                )
-            },
+        yield scrapy.Request(item.get("url"), meta={"image_file_name": image_file_name})
+
+    def refresh_request(self, url, image_file_name) -> Optional[scrapy.Request]:
+        """
+        Returns a request only downloading the image again if it changed
+        since it was downloaded: a conditional request if its ETag or
+        Last-Modified are known, or else a HEAD request to compare its size.
+        """
+        image = self.known.get(image_file_name)
+        if not self.refresh or image is None:
+            return None
+        meta = {"image_file_name": image_file_name, "refresh": True}
+        headers = {}
+        if image["etag"] is not None:
+            headers["If-None-Match"] = image["etag"]
+        if image["last_modified"] is not None:
+            headers["If-Modified-Since"] = image["last_modified"]
+        if headers:
+            return scrapy.Request(url, headers=headers, meta=meta)
+        if image["size"] is not None:
+            return scrapy.Request(
+                url, method="HEAD", meta={**meta, "size": image["size"]}
+            )
+        return None
+
+    def media_to_download(self, request, info, *, item=None):
+        if request.meta.get("refresh"):
+            # The image on disk is as old as the last refresh, not as its
+            # version on the website
+            return None
+        return super().media_to_download(request, info, item=item)
+
+    def media_downloaded(self, response, request, info, *, item=None):
+        if not request.meta.get("refresh"):
+            return super().media_downloaded(response, request, info, item=item)
+        if response.status == 304 or (
+            request.method == "HEAD"
+            and response.status == 200
+            and header_value(response, "Content-Length") == str(request.meta["size"])
+        ):
+            return {
+                "url": request.url,
+                "path": self.file_path(request),
+                "checksum": None,
+                "status": "uptodate",
+            }
+        if request.method != "HEAD":
+            return super().media_downloaded(response, request, info, item=item)
+        # The size of the image changed, or the website doesn't tell it
+        request = scrapy.Request(
+            request.url, meta={"image_file_name": request.meta["image_file_name"]}
         )
+        self._modify_media_request(request)
+        dfd = self.crawler.engine.download(request)
+        dfd.addCallback(self.media_downloaded, request, info, item=item)
+        return dfd
+
+    def file_downloaded(self, response, request, info, *, item=None):
+        checksum = super().file_downloaded(response, request, info, item=item)
+        self.responses[self.file_path(request)] = (
+            len(response.body),
+            header_value(response, "ETag"),
+            header_value(response, "Last-Modified"),
+        )
+        return checksum
 
     def item_completed(self, results, item, info):
-        file_paths = [data["path"] for ok, data in results if ok]
-        if not file_paths:
+        downloaded = [data for ok, data in results if ok]
+        if self.refreshing:
+            image_file_name = Comic.save_image_filename(
+                item.get("url"),
+                item.get("page"),
+                item.get("title"),
+                info.spider.directory,
+            )
+            if image_file_name in self.refreshing:
+                return self.refresh_completed(image_file_name, downloaded, item)
+        if not downloaded:
+            if isinstance(self.store, CbzFilesStore) or self.manifest is not None:
+                image_file_name = Comic.save_image_filename(
+                    item.get("url"),
+                    item.get("page"),
+                    item.get("title"),
+                    info.spider.directory,
+                )
+                if isinstance(self.store, CbzFilesStore):
+                    self.store.fail(image_file_name)
+                self.record(image_file_name, item, status=FAILED)
             click.echo("Could not find comic image.")
             raise DropItem("Could not find comic image.")
 
+        self.record_downloaded(downloaded, item)
+        return item
+
+    def refresh_completed(self, image_file_name, downloaded, item):
+        self.refreshing.discard(image_file_name)
+        changed = [data for data in downloaded if data["status"] != "uptodate"]
+        if not changed:
+            # The image downloaded before stays as it is
+            if isinstance(self.store, CbzFilesStore):
+                self.store.fail(image_file_name)
+            message = (
+                "The image did not change. Skipping..."
+                if downloaded
+                else "Could not check the image for changes."
+            )
+            click.echo(message)
+            raise DropItem(message)
+        self.record_downloaded(changed, item)
         return item
 
+    def record_downloaded(self, downloaded, item) -> None:
+        for data in downloaded:
+            size, etag, last_modified = self.responses.pop(
+                data["path"], (None, None, None)
+            )
+            self.record(
+                data["path"],
+                item,
+                size=size,
+                content_hash=data.get("checksum"),
+                etag=etag,
+                last_modified=last_modified,
+            )
+
+    def record(self, image_file_name, item, **kwargs) -> None:
+        if self.manifest is not None:
+            self.manifest.add(
+                image_file_name,
+                page=item.get("page"),
+                page_url=item.get("page_url"),
+                image_url=item.get("url"),
+                **kwargs
+            )
+
     def file_path(self, request, response=None, info=None):
         return request.meta.get("image_file_name")
 
-    @staticmethod
-    def image_in_zipfile(item, directory):
-        zipfile_path = "{}.cbz".format(directory)
-        if not os.path.isfile(zipfile_path):
-            return False
-        image_path_cbz = Comic.save_image_location(item.get("url"), item.get("page"))
-        with ZipFile(zipfile_path, "r") as zipfile:
-            return image_path_cbz in zipfile.namelist()
+
+def header_value(response, name: str) -> Optional[str]:
+    value = response.headers.get(name)
+    return value.decode("latin-1") if value is not None else None
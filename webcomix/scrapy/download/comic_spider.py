@@ -1,12 +1,24 @@
+from typing import Dict, List, Optional, Tuple
 from urllib.parse import urljoin
 
 import click
-from scrapy import Spider
+from scrapy import Request, Spider
 
 from webcomix.scrapy.download.comic_page import ComicPage
+from webcomix.scrapy.download.index_spider import NO_PAGE_URL
+from webcomix.scrapy.download.numeric_url_pattern import NumericUrlPattern
 from webcomix.exceptions import CrawlerBlocked
 from webcomix.scrapy.request_factory import RequestFactory
 from webcomix.scrapy.util import is_not_end_of_comic
+from webcomix.scrapy.verification.web_page import WebPage
+
+# Number of pages followed one by one before their URLs are looked at for
+# a pattern, which then holds for three next page links in a row
+PATTERN_PAGES = 3
+
+BLOCKED = "blocked"
+
+SITEMAP_XPATH = "//*[local-name()='loc']/text()"
 
 
 class ComicSpider(Spider):
@@ -23,35 +35,331 @@ class ComicSpider(Spider):
         self.alt_text = kwargs.get("alt_text", None)
         self.title = kwargs.get("title", False)
         self.result_queue = kwargs.get("result_queue")
+        self.download_state = kwargs.get("download_state", None)
+        self.last_page = None
         self.request_factory = RequestFactory(javascript)
+        self.parallel_pages = kwargs.get("parallel_pages", None)
+        # Pages fetched ahead of the one the download is at, by index in
+        # the comic, along with the URL they were fetched from
+        self.fetched_pages = {}  # type: Dict[int, Tuple[str, Optional[Tuple]]]
+        self.next_index = 0
+        self.next_url = self.start_url
+        self.next_page = self.start_page
+        self.requested = 0
+        self.previous_urls = []  # type: List[str]
+        self.pattern = None  # type: Optional[NumericUrlPattern]
+        self.pattern_index = 0
+        self.guess = 0
+        self.archive_url = kwargs.get("archive_url", None)
+        self.archive_xpath = kwargs.get("archive_xpath", None)
+        self.archive_listing = None  # type: Optional[List[str]]
+        self.archive_urls = []  # type: List[str]
+        self.archive_index = 0
+        # Pages already fetched by the verification of the comic
+        self.verified_pages = kwargs.get("verified_pages", None)
+        # Pages gone through are put in the result queue to follow the download
+        self.report_pages = kwargs.get("report_pages", False)
         super(ComicSpider, self).__init__(*args, **kwargs)
 
     def start_requests(self):
+        if self.archive_url is not None:
+            yield self.request_factory.create(
+                url=self.archive_url,
+                next_page=None,
+                callback=self.parse_archive,
+                errback=self.failed_archive,
+            )
+            return
+        if self.verified_pages:
+            yield Request(
+                NO_PAGE_URL, callback=self.parse_verified_pages, dont_filter=True
+            )
+            return
+        if self.parallel_pages:
+            yield from self.request_next_pages()
+            return
         yield self.request_factory.create(url=self.start_url, next_page=self.start_page)
 
+    def parse_verified_pages(self, response):
+        """
+        Downloads the images of the pages the verification went through, then
+        goes on from the last of them.
+        """
+        if self.parallel_pages:
+            self.queue_verified_pages()
+            yield from self.go_through_pages()
+            return
+        page = self.start_page
+        for verified_page in self.verified_pages:
+            url, comic_image_urls = verified_page["url"], verified_page["image_urls"]
+            click.echo("Downloading page {}".format(url))
+            self.last_page = (url, page)
+            self.report_page(url, page, comic_image_urls, verified_page["alt_text"])
+            for index, comic_image_url in enumerate(comic_image_urls):
+                yield ComicPage(
+                    url=comic_image_url,
+                    page=page + index,
+                    title=self.title,
+                    alt_text=verified_page["alt_text"],
+                    page_url=url,
+                )
+            if not comic_image_urls:
+                click.echo("Could not find comic image.")
+            page += len(comic_image_urls)
+        next_page_url = self.verified_pages[-1]["next_page_url"]
+        if next_page_url is not None:
+            yield self.request_factory.create(url=next_page_url, next_page=page)
+
+    def queue_verified_pages(self) -> None:
+        """
+        Keeps the pages the verification went through as if they had been
+        fetched ahead.
+        """
+        for index, verified_page in enumerate(self.verified_pages or []):
+            self.fetched_pages[index] = (
+                verified_page["url"],
+                (
+                    verified_page["image_urls"],
+                    verified_page["alt_text"],
+                    verified_page["next_page_url"],
+                ),
+            )
+            self.requested = max(self.requested, index + 1)
+
     def parse(self, response):
+        if self.parallel_pages or self.archive_url is not None:
+            yield from self.parse_ahead(response)
+            return
         click.echo("Downloading page {}".format(response.url))
         if response.status == 403:
             print(self.result_queue)
             self.result_queue.put(CrawlerBlocked())
             return
-        comic_image_urls = response.xpath(self.comic_image_selector).getall()
+        next_page_url = response.xpath(self.next_page_selector).get()
+        if not is_not_end_of_comic(next_page_url) and self.is_stale(response):
+            yield self.refresh_cached_page(response)
+            return
+        comic_image_urls = [
+            urljoin(response.url, comic_image_url.strip())
+            for comic_image_url in response.xpath(self.comic_image_selector).getall()
+        ]
         page = response.meta.get("page") or self.start_page
+        self.last_page = (response.url, page)
         alt_text = (
             response.xpath(self.alt_text).get() if self.alt_text is not None else None
         )
+        self.report_page(response.url, page, comic_image_urls, alt_text)
         for index, comic_image_url in enumerate(comic_image_urls):
             yield ComicPage(
-                url=urljoin(response.url, comic_image_url.strip()),
+                url=comic_image_url,
                 page=page + index,
                 title=self.title,
                 alt_text=alt_text,
+                page_url=response.url,
             )
         if not comic_image_urls:
             click.echo("Could not find comic image.")
-        next_page_url = response.xpath(self.next_page_selector).get()
         if is_not_end_of_comic(next_page_url):
             yield self.request_factory.create(
                 url=response.urljoin(next_page_url).strip(),
                 next_page=page + len(comic_image_urls),
             )
+
+    def report_page(
+        self, url: str, page: int, comic_image_urls: List[str], alt_text: str
+    ) -> None:
+        if self.report_pages:
+            self.result_queue.put(
+                WebPage(
+                    url=url, page=page, image_urls=comic_image_urls, alt_text=alt_text
+                )
+            )
+
+    @staticmethod
+    def is_stale(response) -> bool:
+        # A page the website couldn't serve again comes from the cache too
+        return "cached" in response.flags and not response.meta.get("refresh_cache")
+
+    def refresh_cached_page(self, response):
+        """
+        Fetches the last page again rather than reading it from the HTML
+        cache, as a link to a new page may have been added to it since.
+        """
+        return response.request.replace(
+            meta={**response.request.meta, "refresh_cache": True}, dont_filter=True
+        )
+
+    def parse_archive(self, response):
+        """
+        Reads the links to every page of the comic from its archive page or
+        sitemap, then fetches the first page to find their order.
+        """
+        if response.status == 403:
+            self.result_queue.put(CrawlerBlocked())
+            return
+        self.archive_listing = list(
+            dict.fromkeys(
+                response.urljoin(url.strip())
+                for url in response.xpath(self.archive_xpath or SITEMAP_XPATH).getall()
+            )
+        )
+        self.queue_verified_pages()
+        yield from self.go_through_pages()
+
+    def failed_archive(self, failure):
+        click.echo("Could not read the archive of the comic.")
+        self.queue_verified_pages()
+        yield from self.go_through_pages()
+
+    def read_archive(self, first_url: str, next_url: str) -> List[str]:
+        """
+        Returns the pages of the archive from the first page on, in the
+        order of the next page links, or none if they aren't in it.
+        """
+        listing = self.archive_listing
+        if first_url not in listing or next_url not in listing:
+            click.echo("Could not find the pages in the archive.")
+            return []
+        if listing.index(next_url) < listing.index(first_url):
+            listing = listing[::-1]
+        return listing[listing.index(first_url) :]
+
+    def parse_ahead(self, response):
+        """
+        Keeps a page fetched ahead until the download reaches it.
+        """
+        if response.meta.get("guess") != self.guess:
+            return
+        if response.status == 403:
+            page = BLOCKED
+        else:
+            page = self.read_page(response)
+            if page[2] is None and self.is_stale(response):
+                yield self.refresh_cached_page(response)
+                return
+        self.fetched_pages[response.meta.get("index")] = (
+            response.meta.get("url"),
+            page,
+        )
+        yield from self.go_through_pages()
+
+    def failed_ahead(self, failure):
+        meta = failure.request.meta
+        if meta.get("guess") != self.guess:
+            return
+        self.fetched_pages[meta.get("index")] = (meta.get("url"), None)
+        yield from self.go_through_pages()
+
+    def read_page(self, response) -> Tuple[List[str], Optional[str], Optional[str]]:
+        comic_image_urls = [
+            urljoin(response.url, comic_image_url.strip())
+            for comic_image_url in response.xpath(self.comic_image_selector).getall()
+        ]
+        alt_text = (
+            response.xpath(self.alt_text).get() if self.alt_text is not None else None
+        )
+        next_page_url = response.xpath(self.next_page_selector).get()
+        if is_not_end_of_comic(next_page_url):
+            next_page_url = response.urljoin(next_page_url).strip()
+        else:
+            next_page_url = None
+        return comic_image_urls, alt_text, next_page_url
+
+    def go_through_pages(self):
+        """
+        Downloads the images of the pages fetched so far, in the order of
+        the next page links, as long as the guessed or archived URLs match
+        them.
+        """
+        while self.next_url is not None and self.next_index in self.fetched_pages:
+            url, page = self.fetched_pages.pop(self.next_index)
+            if url != self.next_url:
+                # The comic doesn't follow the pattern or the archive anymore,
+                # so the pages are followed one by one again from the last
+                # one found
+                self.pattern = None
+                self.archive_urls = []
+                self.guess += 1
+                self.fetched_pages.clear()
+                self.requested = self.next_index
+                break
+            if page is None:
+                self.next_url = None
+                return
+            if page == BLOCKED:
+                self.result_queue.put(CrawlerBlocked())
+                self.next_url = None
+                return
+            click.echo("Downloading page {}".format(url))
+            comic_image_urls, alt_text, next_page_url = page
+            self.last_page = (url, self.next_page)
+            self.report_page(url, self.next_page, comic_image_urls, alt_text)
+            for index, comic_image_url in enumerate(comic_image_urls):
+                yield ComicPage(
+                    url=comic_image_url,
+                    page=self.next_page + index,
+                    title=self.title,
+                    alt_text=alt_text,
+                    page_url=url,
+                )
+            if not comic_image_urls:
+                click.echo("Could not find comic image.")
+            self.previous_urls = (self.previous_urls + [url])[-PATTERN_PAGES:]
+            self.next_index += 1
+            self.next_page += len(comic_image_urls)
+            self.next_url = next_page_url
+        if self.next_url is not None:
+            yield from self.request_next_pages()
+
+    def request_next_pages(self):
+        """
+        Requests the next page, along with the pages coming after it when
+        they are listed in the archive, or when their URLs follow a pattern,
+        up to parallel_pages pages ahead.
+        """
+        if self.archive_listing is not None and self.previous_urls:
+            self.archive_urls = self.read_archive(self.previous_urls[-1], self.next_url)
+            self.archive_index = self.next_index - 1
+            self.archive_listing = None
+        if (
+            self.parallel_pages
+            and self.pattern is None
+            and len(self.previous_urls) == PATTERN_PAGES
+        ):
+            self.pattern = NumericUrlPattern.detect(
+                self.previous_urls + [self.next_url]
+            )
+            self.pattern_index = self.next_index
+        if self.pattern is None:
+            last_index = self.next_index + 1
+        else:
+            last_index = self.next_index + self.parallel_pages
+        last_index = max(last_index, self.archive_index + len(self.archive_urls))
+        while self.requested < last_index:
+            if self.requested < self.archive_index + len(self.archive_urls):
+                url = self.archive_urls[self.requested - self.archive_index]
+            elif self.pattern is not None:
+                url = self.pattern.url(self.requested - self.pattern_index)
+            else:
+                url = self.next_url
+            yield self.request_factory.create(
+                url=url,
+                next_page=None,
+                meta={"index": self.requested, "url": url, "guess": self.guess},
+                errback=self.failed_ahead,
+                dont_filter=True,
+                # The pages are gone through in order, so the first ones
+                # are the ones to fetch first
+                priority=-self.requested,
+            )
+            self.requested += 1
+
+    def closed(self, reason):
+        # An interrupted download resumes from where the previous complete
+        # one stopped, since the images of the last pages may be missing
+        if (
+            reason == "finished"
+            and self.download_state is not None
+            and self.last_page is not None
+        ):
+            self.download_state.save(*self.last_page)
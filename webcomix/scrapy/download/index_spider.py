@@ -0,0 +1,33 @@
+from scrapy import Request, Spider
+
+from webcomix.page_index import read_images
+from webcomix.scrapy.download.comic_page import ComicPage
+
+# Answered by Scrapy itself, so that the images are yielded without
+# fetching any page
+NO_PAGE_URL = "data:,"
+
+
+class IndexSpider(Spider):
+    """
+    Downloads the images listed in a page index, without going through the
+    pages of the comic again.
+    """
+
+    name = "Index Spider"
+
+    def __init__(self, *args, **kwargs):
+        self.index = kwargs.get("index")
+        self.first_page = kwargs.get("first_page", None)
+        self.last_page = kwargs.get("last_page", None)
+        self.directory = kwargs.get("directory", None)
+        self.title = kwargs.get("title", False)
+        self.result_queue = kwargs.get("result_queue")
+        super(IndexSpider, self).__init__(*args, **kwargs)
+
+    def start_requests(self):
+        yield Request(NO_PAGE_URL, dont_filter=True)
+
+    def parse(self, response):
+        for image in read_images(self.index, self.first_page, self.last_page):
+            yield ComicPage(title=self.title, **image)
@@ -0,0 +1,57 @@
+import re
+from typing import List, Optional
+
+NUMBERS = re.compile(r"(\d+)")
+
+
+class NumericUrlPattern:
+    """
+    Page URLs of a comic which only differ by a counter, such as
+    https://xkcd.com/1/, https://xkcd.com/2/, from which the URLs of the
+    next pages can be guessed before they are found.
+    """
+
+    def __init__(self, parts: List[str], counter: int, step: int):
+        self.parts = parts
+        self.counter = counter
+        self.step = step
+
+    @classmethod
+    def detect(cls, urls: List[str]) -> Optional["NumericUrlPattern"]:
+        """
+        Returns the pattern followed by the URLs of consecutive pages, if
+        the same number goes up by the same step from one URL to the next.
+        """
+        if len(urls) < 2:
+            return None
+        parts = [NUMBERS.split(url) for url in urls]
+        if any(len(url_parts) != len(parts[0]) for url_parts in parts):
+            return None
+        changing = [
+            index
+            for index in range(1, len(parts[0]), 2)
+            if len(set(url_parts[index] for url_parts in parts)) > 1
+        ]
+        other_parts_match = all(
+            url_parts[index] == parts[0][index]
+            for url_parts in parts
+            for index in range(0, len(parts[0]), 2)
+        )
+        if len(changing) != 1 or not other_parts_match:
+            return None
+        counter = changing[0]
+        numbers = [int(url_parts[counter]) for url_parts in parts]
+        steps = set(after - before for before, after in zip(numbers, numbers[1:]))
+        if len(steps) != 1 or min(steps) <= 0:
+            return None
+        return cls(parts[-1], counter, steps.pop())
+
+    def url(self, offset: int) -> str:
+        """
+        Returns the URL of the page coming offset pages after the last one
+        the pattern was detected from.
+        """
+        number = self.parts[self.counter]
+        parts = list(self.parts)
+        parts[self.counter] = str(int(number) + offset * self.step).zfill(len(number))
+        return "".join(parts)
@@ -0,0 +1,51 @@
+from typing import Optional
+
+from webcomix.page_index import PageIndexWriter
+
+
+class PageIndexPipeline:
+    """
+    Writes every page gone through by the ComicSpider to the page index
+    given by the PAGE_INDEX setting, after the pages already in it if
+    PAGE_INDEX_APPEND is set. The images of a page are yielded one after
+    the other, so a page is written once the images of the next page start
+    coming.
+    """
+
+    def __init__(self, path: str, append: bool = False):
+        self.path = path
+        self.append = append
+        self.index_writer = None  # type: Optional[PageIndexWriter]
+        self.page = None  # type: Optional[dict]
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            crawler.settings.get("PAGE_INDEX"),
+            crawler.settings.getbool("PAGE_INDEX_APPEND"),
+        )
+
+    def open_spider(self, spider):
+        self.index_writer = PageIndexWriter(self.path, self.append)
+
+    def close_spider(self, spider):
+        self.write_page()
+        self.index_writer.close()
+
+    def process_item(self, item, spider):
+        page_url = item.get("page_url")
+        if self.page is None or self.page["url"] != page_url:
+            self.write_page()
+            self.page = {
+                "page": item.get("page"),
+                "url": page_url,
+                "image_urls": [],
+                "alt_text": item.get("alt_text"),
+            }
+        self.page["image_urls"].append(item.get("url"))
+        return item
+
+    def write_page(self):
+        if self.page is not None:
+            self.index_writer.write_page(**self.page)
+            self.page = None
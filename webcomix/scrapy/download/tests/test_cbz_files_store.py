@@ -0,0 +1,47 @@
+from io import BytesIO
+from zipfile import ZipFile
+
+from webcomix.scrapy.download.cbz_files_store import CbzFilesStore
+
+
+def test_files_are_written_in_the_order_they_were_expected(tmp_path):
+    store = CbzFilesStore("cbz://{}".format(tmp_path / "test.cbz"))
+    store.open()
+    for path in ["1.jpg", "2.jpg", "3.jpg"]:
+        store.expect(path)
+
+    store.persist_file("3.jpg", BytesIO(b"3"), None)
+    store.persist_file("2.jpg", BytesIO(b"2"), None)
+    assert store.cbz_file.namelist() == []
+    store.persist_file("1.jpg", BytesIO(b"1"), None)
+    store.close()
+
+    with ZipFile(str(tmp_path / "test.cbz")) as cbz_file:
+        assert cbz_file.namelist() == ["1.jpg", "2.jpg", "3.jpg"]
+        assert cbz_file.read("2.jpg") == b"2"
+
+
+def test_failed_files_do_not_hold_up_the_next_ones(tmp_path):
+    store = CbzFilesStore("cbz://{}".format(tmp_path / "test.cbz"))
+    store.open()
+    store.expect("1.jpg", [("1.txt", "alt text")])
+    store.expect("2.jpg")
+
+    store.persist_file("2.jpg", BytesIO(b"2"), None)
+    store.fail("1.jpg")
+
+    assert store.cbz_file.namelist() == ["1.txt", "2.jpg"]
+    store.close()
+
+
+def test_closing_writes_what_was_downloaded(tmp_path):
+    store = CbzFilesStore("cbz://{}".format(tmp_path / "test.cbz"))
+    store.open()
+    store.expect("1.jpg")
+    store.expect("2.jpg")
+
+    store.persist_file("2.jpg", BytesIO(b"2"), None)
+    store.close()
+
+    with ZipFile(str(tmp_path / "test.cbz")) as cbz_file:
+        assert cbz_file.namelist() == ["2.jpg"]
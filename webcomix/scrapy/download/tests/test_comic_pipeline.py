@@ -1,8 +1,11 @@
 import os
+from zipfile import ZipFile
 
 from scrapy.exceptions import DropItem
+from scrapy.http import Request, Response
 import pytest
 
+from webcomix.manifest import Manifest
 from webcomix.scrapy.download.comic_pipeline import ComicPipeline
 from webcomix.scrapy.download.comic_page import ComicPage
 from webcomix.supported_comics import supported_comics
@@ -15,15 +18,12 @@ expected_image_filename = "1.jpg"
 
 
 def test_get_media_requests_returns_good_request_when_file_not_present(mocker):
-    mocker.patch("os.path.isfile", return_value=False)
     mock_spider_info = mocker.patch("scrapy.pipelines.media.MediaPipeline.SpiderInfo")
-    mocker.patch(
-        "webcomix.comic.Comic.save_image_location", return_value=expected_image_location
-    )
     mocker.patch(
         "webcomix.comic.Comic.save_image_filename", return_value=expected_image_filename
     )
     pipeline = ComicPipeline(store_uri="foo")
+    pipeline.downloaded = set()
     elements = list(
         pipeline.get_media_requests(
             ComicPage(url=expected_url_image, page=1, title=False, alt_text=None),
@@ -37,12 +37,12 @@ def test_get_media_requests_returns_good_request_when_file_not_present(mocker):
 
 
 def test_get_media_requests_drops_item_when_file_present(mocker):
-    mocker.patch("os.path.isfile", return_value=True)
     mock_spider_info = mocker.patch("scrapy.pipelines.media.MediaPipeline.SpiderInfo")
     mocker.patch(
-        "webcomix.comic.Comic.save_image_location", return_value=expected_image_location
+        "webcomix.comic.Comic.save_image_filename", return_value=expected_image_filename
     )
     pipeline = ComicPipeline(store_uri="foo")
+    pipeline.downloaded = {expected_image_filename}
     with pytest.raises(DropItem):
         list(
             pipeline.get_media_requests(
@@ -54,16 +54,12 @@ def test_get_media_requests_drops_item_when_file_present(mocker):
 
 
 def test_get_media_requests_drops_item_when_file_present_in_zip(mocker):
-    mocker.patch("os.path.isfile", side_effect=[False])
-    mocker.patch(
-        "webcomix.scrapy.download.comic_pipeline.ComicPipeline.image_in_zipfile",
-        return_value=True,
-    )
     mock_spider_info = mocker.patch("scrapy.pipelines.media.MediaPipeline.SpiderInfo")
     mocker.patch(
-        "webcomix.comic.Comic.save_image_location", return_value=expected_image_location
+        "webcomix.comic.Comic.save_image_location", return_value=expected_image_filename
     )
     pipeline = ComicPipeline(store_uri="foo")
+    pipeline.downloaded = {expected_image_filename}
     with pytest.raises(DropItem):
         list(
             pipeline.get_media_requests(
@@ -74,6 +70,73 @@ def test_get_media_requests_drops_item_when_file_present_in_zip(mocker):
     os.rmdir("foo")
 
 
+def test_get_media_requests_drops_item_already_requested(mocker):
+    mock_spider_info = mocker.patch("scrapy.pipelines.media.MediaPipeline.SpiderInfo")
+    pipeline = ComicPipeline(store_uri="foo")
+    pipeline.downloaded = set()
+    item = ComicPage(url=expected_url_image, page=1, title=False, alt_text=None)
+    list(pipeline.get_media_requests(item, mock_spider_info))
+    with pytest.raises(DropItem):
+        list(pipeline.get_media_requests(item, mock_spider_info))
+    os.rmdir("foo")
+
+
+def test_open_spider_lists_the_files_already_downloaded(mocker, tmp_path):
+    directory = str(tmp_path / "test")
+    os.mkdir(directory)
+    with open(os.path.join(directory, "2.jpg"), "w") as image_file:
+        image_file.write("image")
+    with ZipFile("{}.cbz".format(directory), "w") as zipfile:
+        zipfile.writestr("1.jpg", "image")
+    mock_spider = mocker.Mock(directory=directory)
+    pipeline = ComicPipeline(store_uri=directory)
+
+    pipeline.open_spider(mock_spider)
+
+    assert pipeline.downloaded == {"1.jpg", "2.jpg"}
+    assert os.path.isfile(Manifest.location(directory))
+
+
+def test_open_spider_trusts_the_manifest_while_the_files_are_unchanged(
+    mocker, tmp_path
+):
+    directory = str(tmp_path / "test")
+    os.mkdir(directory)
+    manifest = Manifest(Manifest.location(directory))
+    manifest.add("1.jpg", page=1, image_url=expected_url_image)
+    manifest.close(directory)
+    mock_spider = mocker.Mock(directory=directory)
+    pipeline = ComicPipeline(store_uri=directory)
+
+    pipeline.open_spider(mock_spider)
+
+    assert pipeline.downloaded == {"1.jpg"}
+
+
+def test_item_completed_records_the_image_in_the_manifest(mocker, tmp_path):
+    directory = str(tmp_path / "test")
+    mock_spider = mocker.Mock(directory=directory)
+    pipeline = ComicPipeline(store_uri=directory)
+    pipeline.open_spider(mock_spider)
+    pipeline.responses["1.jpg"] = (5, '"abc"', None)
+    item = ComicPage(
+        url=expected_url_image, page=1, title=False, alt_text=None, page_url="p1"
+    )
+
+    pipeline.item_completed(
+        [(True, {"path": "1.jpg", "checksum": "123"})], item, mocker.ANY
+    )
+    pipeline.close_spider(mock_spider)
+
+    image = Manifest(Manifest.location(directory)).images()["1.jpg"]
+    assert image["page"] == 1
+    assert image["page_url"] == "p1"
+    assert image["image_url"] == expected_url_image
+    assert image["size"] == 5
+    assert image["content_hash"] == "123"
+    assert image["etag"] == '"abc"'
+
+
 def test_item_completed_returns_item_when_file_downloaded(mocker):
     results = [(True, {"path": expected_image_location})]
     item = ComicPage()
@@ -104,6 +167,87 @@ def test_file_path_is_image_path(mocker):
     os.rmdir("foo")
 
 
-def test_image_not_in_zip_if_zip_does_not_exist(mocker):
-    mocker.patch("os.path.isfile", return_value=False)
-    assert ComicPipeline.image_in_zipfile(mocker.ANY, mocker.ANY) == False
+@pytest.mark.parametrize(
+    "image,headers,method",
+    [
+        (
+            {"etag": '"abc"', "last_modified": None, "size": 5},
+            {b"If-None-Match": [b'"abc"']},
+            "GET",
+        ),
+        (
+            {"etag": None, "last_modified": "Sat, 01 Jan 2000 00:00:00 GMT", "size": 5},
+            {b"If-Modified-Since": [b"Sat, 01 Jan 2000 00:00:00 GMT"]},
+            "GET",
+        ),
+        ({"etag": None, "last_modified": None, "size": 5}, {}, "HEAD"),
+    ],
+)
+def test_refresh_request_only_downloads_the_image_if_it_changed(image, headers, method):
+    pipeline = ComicPipeline(store_uri="foo")
+    pipeline.refresh = True
+    pipeline.known = {expected_image_filename: image}
+
+    request = pipeline.refresh_request(expected_url_image, expected_image_filename)
+
+    assert request.method == method
+    assert dict(request.headers) == headers
+    assert request.meta["refresh"]
+    os.rmdir("foo")
+
+
+def test_refresh_request_skips_the_image_without_validators_or_size():
+    pipeline = ComicPipeline(store_uri="foo")
+    pipeline.refresh = True
+    pipeline.known = {
+        expected_image_filename: {"etag": None, "last_modified": None, "size": None}
+    }
+
+    assert pipeline.refresh_request(expected_url_image, expected_image_filename) is None
+    os.rmdir("foo")
+
+
+@pytest.mark.parametrize(
+    "method,status,headers",
+    [("GET", 304, {}), ("HEAD", 200, {"Content-Length": "5"})],
+)
+def test_media_downloaded_keeps_the_image_which_did_not_change(
+    mocker, method, status, headers
+):
+    pipeline = ComicPipeline(store_uri="foo")
+    request = Request(
+        expected_url_image,
+        method=method,
+        meta={"image_file_name": expected_image_filename, "refresh": True, "size": 5},
+    )
+    response = Response(
+        expected_url_image, status=status, headers=headers, request=request
+    )
+
+    result = pipeline.media_downloaded(response, request, mocker.Mock())
+
+    assert result["status"] == "uptodate"
+    assert result["path"] == expected_image_filename
+    os.rmdir("foo")
+
+
+def test_item_completed_drops_the_image_which_did_not_change(mocker, tmp_path):
+    directory = str(tmp_path / "test")
+    mock_spider = mocker.Mock(directory=directory)
+    pipeline = ComicPipeline(store_uri=directory)
+    pipeline.open_spider(mock_spider)
+    pipeline.refreshing = {expected_image_filename}
+    item = ComicPage(url=expected_url_image, page=1, title=False, alt_text=None)
+    mocker.patch(
+        "webcomix.comic.Comic.save_image_filename", return_value=expected_image_filename
+    )
+
+    with pytest.raises(DropItem):
+        pipeline.item_completed(
+            [(True, {"path": expected_image_filename, "status": "uptodate"})],
+            item,
+            mocker.Mock(),
+        )
+    assert pipeline.refreshing == set()
+    assert pipeline.manifest.images() == {}
+    pipeline.close_spider(mock_spider)
@@ -1,6 +1,8 @@
 from multiprocessing import Queue
 
 import pytest
+from scrapy import Request
+from scrapy.http import HtmlResponse
 
 from webcomix.scrapy.download.comic_spider import ComicSpider
 from webcomix.exceptions import CrawlerBlocked
@@ -90,3 +92,120 @@ def test_parse_raise_crawler_blocked_if_forbidden(mocker):
     spider = ComicSpider(result_queue=result_queue)
     list(spider.parse(mock_response))
     assert isinstance(result_queue.get(), CrawlerBlocked)
+
+
+def xkcd_response(request):
+    number = int(request.url.split("/")[-2])
+    body = '<img src="{0}.png"><a href="/{1}/">Next</a>'.format(number, number + 1)
+    return HtmlResponse(
+        url=request.url, body=body.encode("ascii"), encoding="ascii", request=request
+    )
+
+
+def test_parse_fetches_the_pages_ahead_once_their_urls_follow_a_pattern():
+    spider = ComicSpider(
+        start_url="https://xkcd.com/1/",
+        comic_image_selector="//img/@src",
+        next_page_selector="//a/@href",
+        parallel_pages=3,
+    )
+    requests = list(spider.start_requests())
+    for _ in range(3):
+        assert [request.url for request in requests] == [spider.next_url]
+        results = list(spider.parse(xkcd_response(requests[0])))
+        requests = [result for result in results if isinstance(result, Request)]
+
+    assert [request.url for request in requests] == [
+        "https://xkcd.com/4/",
+        "https://xkcd.com/5/",
+        "https://xkcd.com/6/",
+    ]
+    # The pages coming back out of order wait for the ones before them
+    assert list(spider.parse(xkcd_response(requests[1]))) == []
+    results = list(spider.parse(xkcd_response(requests[0])))
+    assert [result.get("page") for result in results[:2]] == [4, 5]
+    assert [result.url for result in results[2:]] == [
+        "https://xkcd.com/7/",
+        "https://xkcd.com/8/",
+    ]
+
+
+def test_parse_fetches_every_page_of_the_archive_after_the_first_one():
+    spider = ComicSpider(
+        start_url="https://xkcd.com/2/",
+        comic_image_selector="//img/@src",
+        next_page_selector="//a/@href",
+        archive_url="https://xkcd.com/archive/",
+        archive_xpath="//div/a/@href",
+    )
+    [archive_request] = spider.start_requests()
+    archive = HtmlResponse(
+        url=archive_request.url,
+        body=b'<div><a href="/4/">4</a><a href="/3/">3</a>'
+        b'<a href="/2/">2</a><a href="/1/">1</a></div>',
+        encoding="ascii",
+        request=archive_request,
+    )
+    [first_request] = archive_request.callback(archive)
+    assert first_request.url == "https://xkcd.com/2/"
+
+    results = list(spider.parse(xkcd_response(first_request)))
+
+    requests = [result for result in results if isinstance(result, Request)]
+    assert [request.url for request in requests] == [
+        "https://xkcd.com/3/",
+        "https://xkcd.com/4/",
+    ]
+    assert requests[0].priority > requests[1].priority
+
+
+@pytest.mark.parametrize("parallel_pages", [None, 2])
+def test_parse_fetches_the_last_page_again_if_it_was_cached(parallel_pages):
+    spider = ComicSpider(
+        start_url="https://xkcd.com/1/",
+        comic_image_selector="//img/@src",
+        next_page_selector="//a/@href",
+        parallel_pages=parallel_pages,
+    )
+    request = list(spider.start_requests())[0]
+    response = HtmlResponse(
+        url=request.url, body=b'<img src="1.png">', request=request, flags=["cached"]
+    )
+
+    results = list(spider.parse(response))
+
+    assert len(results) == 1
+    assert results[0].url == request.url
+    assert results[0].meta["refresh_cache"]
+    assert results[0].dont_filter
+    # The page fetched again is read even if it still comes from the cache
+    response = response.replace(request=results[0])
+    assert [result.get("page") for result in spider.parse(response)] == [1]
+
+
+def test_start_requests_go_on_from_the_pages_verified():
+    verified_pages = [
+        {
+            "url": "https://xkcd.com/{}/".format(page),
+            "page": page,
+            "image_urls": ["https://imgs.xkcd.com/{}.png".format(page)],
+            "alt_text": None,
+            "next_page_url": "https://xkcd.com/{}/".format(page + 1),
+        }
+        for page in [1, 2, 3]
+    ]
+    spider = ComicSpider(
+        start_url="https://xkcd.com/1/",
+        comic_image_selector="//img/@src",
+        next_page_selector="//a/@href",
+        verified_pages=verified_pages,
+    )
+
+    requests = list(spider.start_requests())
+    assert [request.url for request in requests] == ["data:,"]
+    results = list(requests[0].callback(HtmlResponse(url="data:,")))
+
+    assert [result.get("page") for result in results[:3]] == [1, 2, 3]
+    assert results[3].url == "https://xkcd.com/4/"
+    assert results[3].meta["page"] == 4
+    assert spider.last_page == ("https://xkcd.com/3/", 3)
@@ -0,0 +1,42 @@
+import pytest
+
+from webcomix.scrapy.download.numeric_url_pattern import NumericUrlPattern
+
+
+def test_detect_finds_the_counter_of_the_urls():
+    pattern = NumericUrlPattern.detect(
+        ["https://xkcd.com/1/", "https://xkcd.com/2/", "https://xkcd.com/3/"]
+    )
+    assert [pattern.url(offset) for offset in range(3)] == [
+        "https://xkcd.com/3/",
+        "https://xkcd.com/4/",
+        "https://xkcd.com/5/",
+    ]
+
+
+def test_detect_keeps_the_step_and_the_padding_of_the_counter():
+    pattern = NumericUrlPattern.detect(
+        [
+            "https://example.com/2020/page-006.html",
+            "https://example.com/2020/page-008.html",
+        ]
+    )
+    assert pattern.url(1) == "https://example.com/2020/page-010.html"
+
+
+@pytest.mark.parametrize(
+    "urls",
+    [
+        ["https://xkcd.com/1/"],
+        ["https://xkcd.com/1/", "https://xkcd.com/2/", "https://xkcd.com/4/"],
+        ["https://xkcd.com/3/", "https://xkcd.com/2/"],
+        ["https://example.com/1/1", "https://example.com/2/2"],
+        ["https://example.com/1/a", "https://example.com/2/b"],
+        [
+            "https://www.smbc-comics.com/comic/2002-09-05",
+            "https://www.smbc-comics.com/comic/cat",
+        ],
+    ],
+)
+def test_detect_finds_no_pattern(urls):
+    assert NumericUrlPattern.detect(urls) is None
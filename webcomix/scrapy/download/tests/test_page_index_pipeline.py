@@ -0,0 +1,25 @@
+from webcomix.page_index import read_images
+from webcomix.scrapy.download.comic_page import ComicPage
+from webcomix.scrapy.download.page_index_pipeline import PageIndexPipeline
+
+
+def test_page_index_pipeline_writes_one_line_per_page(mocker, tmp_path):
+    path = str(tmp_path / "test.index.jsonl")
+    pipeline = PageIndexPipeline(path)
+    pipeline.open_spider(mocker.ANY)
+    for url, page, page_url in [
+        ("1.png", 1, "https://xkcd.com/1/"),
+        ("2.png", 2, "https://xkcd.com/2/"),
+        ("3.png", 3, "https://xkcd.com/2/"),
+    ]:
+        item = ComicPage(url=url, page=page, alt_text=None, page_url=page_url)
+        assert pipeline.process_item(item, mocker.ANY) is item
+    pipeline.close_spider(mocker.ANY)
+
+    with open(path) as index_file:
+        assert len(index_file.readlines()) == 2
+    assert [(image["url"], image["page"]) for image in read_images(path)] == [
+        ("1.png", 1),
+        ("2.png", 2),
+        ("3.png", 3),
+    ]
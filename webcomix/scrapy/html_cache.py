@@ -0,0 +1,74 @@
+import os
+import shutil
+from glob import escape, glob
+
+from scrapy.extensions.httpcache import DummyPolicy, FilesystemCacheStorage
+from scrapy.http import TextResponse
+
+
+class HtmlCachePolicy(DummyPolicy):
+    """
+    Caches the pages of a comic, but neither its images nor the pages the
+    website didn't serve. A request whose meta has refresh_cache set is
+    fetched again and replaces the page in the cache.
+    """
+
+    def should_cache_request(self, request):
+        return "image_file_name" not in request.meta and super().should_cache_request(
+            request
+        )
+
+    def should_cache_response(self, response, request):
+        return isinstance(response, TextResponse) and response.status == 200
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        return not request.meta.get("refresh_cache", False)
+
+    def is_cached_response_valid(self, cachedresponse, response, request):
+        return not request.meta.get("refresh_cache", False)
+
+
+class HtmlCacheStorage(FilesystemCacheStorage):
+    """
+    Keeps the cached pages of each comic in a directory of their own, named
+    after HTTPCACHE_NAMESPACE, and evicts the least recently used pages of
+    every comic once the cache grows past HTTPCACHE_MAX_SIZE bytes.
+    """
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.namespace = settings.get("HTTPCACHE_NAMESPACE") or "default"
+        self.maximum_size = settings.getint("HTTPCACHE_MAX_SIZE")
+
+    def close_spider(self, spider):
+        if self.maximum_size > 0:
+            evict_least_recently_used(self.cachedir, self.maximum_size)
+
+    def retrieve_response(self, spider, request):
+        response = super().retrieve_response(spider, request)
+        if response is not None:
+            # The time of the entry's directory is when it was last used,
+            # while its files keep the time it was stored to expire
+            os.utime(self._get_request_path(spider, request))
+        return response
+
+    def _get_request_path(self, spider, request) -> str:
+        key = self._fingerprinter.fingerprint(request).hex()
+        return os.path.join(self.cachedir, self.namespace, key[0:2], key)
+
+
+def evict_least_recently_used(cache_directory: str, maximum_size: int) -> None:
+    entries = []
+    total_size = 0
+    for entry in glob(os.path.join(escape(cache_directory), "*", "*", "*")):
+        size = sum(
+            os.path.getsize(os.path.join(entry, file_name))
+            for file_name in os.listdir(entry)
+        )
+        entries.append((os.path.getmtime(entry), size, entry))
+        total_size += size
+    for _, size, entry in sorted(entries):
+        if total_size <= maximum_size:
+            return
+        shutil.rmtree(entry, ignore_errors=True)
+        total_size -= size
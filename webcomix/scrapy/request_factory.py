@@ -6,8 +6,9 @@ class RequestFactory:
     def __init__(self, javascript):
         self.javascript = javascript
 
-    def create(self, url, next_page):
+    def create(self, url, next_page, meta=None, **kwargs):
+        meta = {"page": next_page, **(meta or {})}
         if self.javascript:
-            return SplashRequest(url, args={"wait": 0.5}, meta={"page": next_page})
+            return SplashRequest(url, args={"wait": 0.5}, meta=meta, **kwargs)
         else:
-            return Request(url, meta={"page": next_page})
+            return Request(url, meta=meta, **kwargs)
@@ -1,9 +1,18 @@
+import os
+import time
+
 import pytest
+import scrapy
 
 from webcomix.exceptions import NextLinkNotFound
-from webcomix.scrapy.crawler_worker import CrawlerWorker
+from webcomix.scrapy.crawler_worker import (
+    RESULT_QUEUE_SIZE,
+    BatchCrawlerWorker,
+    CrawlerEngine,
+    CrawlerWorker,
+)
 from webcomix.scrapy.verification.verification_spider import VerificationSpider
-from webcomix.tests.fake_websites.fixture import one_webpage_uri
+from webcomix.tests.fake_websites.fixture import one_webpage_uri, three_webpages_uri
 
 
 def test_spider_raising_error_gets_raised_by_crawler_worker(one_webpage_uri):
@@ -20,3 +29,168 @@ def test_spider_raising_error_gets_raised_by_crawler_worker(one_webpage_uri):
 
     with pytest.raises(NextLinkNotFound):
         worker.start()
+
+
+class TimingSpider(scrapy.Spider):
+    name = "timing"
+
+    def __init__(self, *args, **kwargs):
+        self.start_url = kwargs.get("start_url")
+        self.result_queue = kwargs.get("result_queue")
+        super().__init__(*args, **kwargs)
+
+    def start_requests(self):
+        self.result_queue.put(time.time())
+        yield scrapy.Request(self.start_url)
+
+    def parse(self, response):
+        pass
+
+    def closed(self, reason):
+        self.result_queue.put(time.time())
+
+
+@pytest.mark.parametrize(
+    "max_active_per_domain,one_after_the_other", [(None, False), (1, True)]
+)
+def test_batch_crawler_worker_limits_the_crawls_on_the_same_website(
+    one_webpage_uri, three_webpages_uri, max_active_per_domain, one_after_the_other
+):
+    crawls = [
+        ({}, TimingSpider, {"start_url": one_webpage_uri}),
+        ({}, TimingSpider, {"start_url": three_webpages_uri}),
+    ]
+    worker = BatchCrawlerWorker(
+        {"LOG_ENABLED": False}, crawls, 2, max_active_per_domain
+    )
+
+    [(first_start, first_end), (second_start, second_end)] = worker.start()
+
+    assert (second_start >= first_end) == one_after_the_other
+
+
+class ProcessSpider(scrapy.Spider):
+    name = "process"
+
+    def __init__(self, *args, **kwargs):
+        self.start_url = kwargs.get("start_url")
+        self.result_queue = kwargs.get("result_queue")
+        super().__init__(*args, **kwargs)
+
+    def start_requests(self):
+        yield scrapy.Request(self.start_url)
+
+    def parse(self, response):
+        self.result_queue.put(os.getpid())
+
+
+def test_crawler_engine_runs_the_crawls_of_crawler_workers_in_one_process(
+    one_webpage_uri, three_webpages_uri
+):
+    with CrawlerEngine() as engine:
+        first = CrawlerWorker(
+            {"LOG_ENABLED": False}, False, ProcessSpider, start_url=one_webpage_uri
+        ).start()
+        second = CrawlerWorker(
+            {"LOG_ENABLED": False}, False, ProcessSpider, start_url=three_webpages_uri
+        ).start()
+        assert engine.is_alive()
+
+    assert first == second == [engine.pid]
+    assert engine.pid != os.getpid()
+    assert not engine.is_alive()
+    assert CrawlerEngine.current is None
+
+
+def test_crawler_engine_raises_the_errors_of_its_crawls(one_webpage_uri):
+    with CrawlerEngine():
+        worker = CrawlerWorker(
+            {"LOG_ENABLED": False},
+            False,
+            VerificationSpider,
+            start_url=one_webpage_uri,
+            next_page_selector="//div/@href",
+            comic_image_selector="//img/@src",
+            number_of_pages_to_check=2,
+        )
+
+        with pytest.raises(NextLinkNotFound):
+            worker.start()
+        assert list(
+            CrawlerEngine.current.crawl(
+                {"LOG_ENABLED": False}, ProcessSpider, start_url=one_webpage_uri
+            )
+        ) == [CrawlerEngine.current.pid]
+
+
+class CountingSpider(scrapy.Spider):
+    name = "counting"
+
+    def __init__(self, *args, **kwargs):
+        self.start_url = kwargs.get("start_url")
+        self.count = kwargs.get("count")
+        self.result_queue = kwargs.get("result_queue")
+        super().__init__(*args, **kwargs)
+
+    def start_requests(self):
+        yield scrapy.Request(self.start_url)
+
+    def parse(self, response):
+        for number in range(self.count):
+            self.result_queue.put(number)
+
+
+def test_crawler_worker_returns_the_results_as_they_come(one_webpage_uri):
+    worker = CrawlerWorker(
+        {"LOG_ENABLED": False},
+        False,
+        CountingSpider,
+        start_url=one_webpage_uri,
+        count=RESULT_QUEUE_SIZE * 5,
+    )
+    results = worker.results()
+
+    assert next(results) == 0
+    # The spider waits for its results to be read
+    assert worker.is_alive()
+    assert list(results) == list(range(1, RESULT_QUEUE_SIZE * 5))
+    assert not worker.is_alive()
+
+
+def test_crawler_worker_stops_the_crawl_when_the_results_stop_being_read(
+    one_webpage_uri,
+):
+    worker = CrawlerWorker(
+        {"LOG_ENABLED": False},
+        False,
+        CountingSpider,
+        start_url=one_webpage_uri,
+        count=RESULT_QUEUE_SIZE * 5,
+    )
+    results = worker.results()
+
+    assert next(results) == 0
+    results.close()
+
+    assert not worker.is_alive()
+
+
+def test_crawler_engine_goes_on_after_a_crawl_stopped_early(one_webpage_uri):
+    with CrawlerEngine() as engine:
+        results = engine.crawl(
+            {"LOG_ENABLED": False},
+            CountingSpider,
+            start_url=one_webpage_uri,
+            count=RESULT_QUEUE_SIZE * 5,
+        )
+        assert next(results) == 0
+        results.close()
+
+        assert list(
+            engine.crawl(
+                {"LOG_ENABLED": False},
+                CountingSpider,
+                start_url=one_webpage_uri,
+                count=3,
+            )
+        ) == [0, 1, 2]
@@ -0,0 +1,66 @@
+import os
+import shutil
+
+from scrapy import Request
+from scrapy.http import HtmlResponse, Response
+from scrapy.settings import Settings
+
+from webcomix.comic import HTML_CACHE_SETTINGS, Comic
+from webcomix.scrapy.html_cache import HtmlCachePolicy, evict_least_recently_used
+from webcomix.tests.fake_websites.fixture import three_webpages_uri
+from webcomix.util import cache_directory
+
+
+def test_policy_only_caches_the_pages():
+    policy = HtmlCachePolicy(Settings(HTML_CACHE_SETTINGS))
+    page_request = Request("https://xkcd.com/1/")
+    image_request = Request(
+        "https://imgs.xkcd.com/comics/1.png", meta={"image_file_name": "1.png"}
+    )
+
+    assert policy.should_cache_request(page_request)
+    assert not policy.should_cache_request(image_request)
+    assert policy.should_cache_response(
+        HtmlResponse(page_request.url, body=b"<html></html>"), page_request
+    )
+    assert not policy.should_cache_response(
+        HtmlResponse(page_request.url, status=403), page_request
+    )
+    assert not policy.should_cache_response(Response(image_request.url), page_request)
+
+
+def test_policy_fetches_the_pages_to_refresh_again():
+    policy = HtmlCachePolicy(Settings(HTML_CACHE_SETTINGS))
+    cached_response = HtmlResponse("https://xkcd.com/1/")
+
+    assert policy.is_cached_response_fresh(
+        cached_response, Request("https://xkcd.com/1/")
+    )
+    assert not policy.is_cached_response_fresh(
+        cached_response, Request("https://xkcd.com/1/", meta={"refresh_cache": True})
+    )
+
+
+def test_evict_least_recently_used_keeps_the_cache_under_its_size(tmp_path):
+    for used, name in enumerate(["old", "recent", "newest"]):
+        entry = tmp_path / "comic" / "ab" / name
+        entry.mkdir(parents=True)
+        (entry / "response_body").write_bytes(b"x" * 100)
+        os.utime(str(entry), (used, used))
+
+    evict_least_recently_used(str(tmp_path), 250)
+
+    assert sorted(os.listdir(str(tmp_path / "comic" / "ab"))) == ["newest", "recent"]
+
+
+def test_verification_is_served_from_the_cache(mocker, tmp_path, three_webpages_uri):
+    mocker.patch.dict(HTML_CACHE_SETTINGS, {"HTTPCACHE_IGNORE_SCHEMES": []})
+    website = tmp_path / "website"
+    shutil.copytree(os.path.dirname(three_webpages_uri[len("file://") :]), website)
+    comic = Comic("test", (website / "1.html").as_uri(), "//img/@src", "//a/@href")
+    first_pages = comic.verify_xpath()
+
+    shutil.rmtree(str(website))
+
+    assert os.path.isdir(os.path.join(cache_directory(), "pages", "test"))
+    assert comic.verify_xpath() == first_pages
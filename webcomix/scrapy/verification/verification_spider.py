@@ -38,27 +38,24 @@ class VerificationSpider(Spider):
             else None
         )
         next_page_url = response.xpath(self.next_page_selector).get()
+        if is_not_end_of_comic(next_page_url):
+            next_page_url = response.urljoin(next_page_url).strip()
+        else:
+            next_page_url = None
+        # The link to the next page lets the download go on from the last
+        # page verified
+        web_page = WebPage(
+            url=response.url,
+            page=page,
+            image_urls=image_urls,
+            alt_text=alt_text,
+            next_page_url=next_page_url,
+        )
         if page >= self.number_of_pages_to_check:
-            self.result_queue.put(
-                WebPage(
-                    url=response.url,
-                    page=page,
-                    image_urls=image_urls,
-                    alt_text=alt_text,
-                )
-            )
-        elif is_not_end_of_comic(next_page_url):
-            self.result_queue.put(
-                WebPage(
-                    url=response.url,
-                    page=page,
-                    image_urls=image_urls,
-                    alt_text=alt_text,
-                )
-            )
-            yield self.request_factory.create(
-                url=response.urljoin(next_page_url).strip(), next_page=page + 1
-            )
+            self.result_queue.put(web_page)
+        elif next_page_url is not None:
+            self.result_queue.put(web_page)
+            yield self.request_factory.create(url=next_page_url, next_page=page + 1)
         else:
             self.result_queue.put(
                 NextLinkNotFound(response.url, self.next_page_selector)
@@ -6,3 +6,4 @@ class WebPage(scrapy.Item):
     page = scrapy.Field()
     image_urls = scrapy.Field()
     alt_text = scrapy.Field()
+    next_page_url = scrapy.Field()
@@ -1,19 +1,28 @@
+import asyncio
+import signal
 import sys
+from functools import partial
 from itertools import product
-from typing import Optional, List, Tuple, Mapping
+from multiprocessing import Pool
+from typing import Dict, Iterator, Optional, List, Tuple, Mapping
 
 import click
 from tqdm import tqdm
 
-from webcomix.comic import Comic
+from webcomix.comic import (
+    Comic,
+    FAKE_USERAGENT_SETTINGS,
+    SPLASH_SETTINGS,
+    html_cache_settings,
+)
+from webcomix.scrapy.crawler_worker import CrawlerEngine, CrawlerWorker, crawl_async
+from webcomix.scrapy.discovery.discovery_spider import DiscoverySpider
+from webcomix.scrapy.discovery.page_candidates import PageCandidates
+from webcomix.scrapy.discovery.page_cache import PageCache
+from webcomix.selector_cache import SelectorCache
 from webcomix.util import check_first_pages
 
-possible_next_page_xpath = ["next"]
-possible_image_xpath = ["comic", "image"]
-possible_tags_image = ["*", "img", "div"]
-possible_tags_next = ["*", "a", "div", "li"]
-possible_attributes_image = [".", "@src", "@class", "@id", "@alt"]
-possible_attributes_next = [".", "text()", "@class", "@id", "@alt", "@rel"]
+SINGLE_PAGE_NEXT_PAGE_XPATH = "//a[@rel='next']/@href"
 
 
 def discovery(
@@ -25,60 +34,454 @@ def discovery(
     javascript: bool = False,
     title: bool = False,
     debug: bool = False,
+    selector_cache: Optional[SelectorCache] = None,
+    jobs: int = 1,
+    html_cache_ttl: int = None,
 ) -> Tuple[Optional[Comic], Optional[List[Mapping]]]:
-    def to_lower_case(attribute):
-        return (
-            "translate({}, "
-            "'ABCDEFGHIJKLMNOPQRSTUVWXYZ',"
-            "'abcdefghijklmnopqrstuvwxyz')"
-        ).format(attribute)
+    if selector_cache is not None:
+        cached_comic, first_pages = verify_cached_selectors(
+            selector_cache,
+            name,
+            url,
+            start_page,
+            alt_text,
+            single_page,
+            javascript,
+            title,
+            debug,
+            html_cache_ttl,
+        )
+        if cached_comic is not None:
+            return cached_comic, first_pages
 
     click.echo("Looking for a path to the whole comic... (Ctrl-C to exit)")
-    combinations = product(
-        possible_next_page_xpath,
-        possible_image_xpath,
-        possible_tags_image,
-        possible_tags_next,
-        possible_attributes_image,
-        possible_attributes_next,
+    page_cache = PageCache()
+    try:
+        page_cache = fetch_first_pages(
+            url, None, single_page, javascript, debug, name, html_cache_ttl
+        )
+    except KeyboardInterrupt:
+        sys.exit(0)
+    except Exception:
+        pass
+
+    return search_first_pages(
+        page_cache,
+        name,
+        url,
+        start_page,
+        alt_text,
+        single_page,
+        javascript,
+        title,
+        debug,
+        selector_cache,
+        jobs,
+        html_cache_ttl,
     )
-    total = (
-        len(possible_next_page_xpath)
-        * len(possible_image_xpath)
-        * len(possible_tags_image)
-        * len(possible_tags_next)
-        * len(possible_attributes_image)
-        * len(possible_attributes_next)
+
+
+async def discovery_async(
+    name: str,
+    url: str,
+    start_page: int = 1,
+    alt_text: str = None,
+    single_page: bool = False,
+    javascript: bool = False,
+    title: bool = False,
+    debug: bool = False,
+    selector_cache: Optional[SelectorCache] = None,
+    jobs: int = 1,
+    html_cache_ttl: int = None,
+    engine: CrawlerEngine = None,
+) -> Tuple[Optional[Comic], Optional[List[Mapping]]]:
+    """
+    Searches for the XPath expressions of the comic like discovery() without
+    blocking the event loop. The pages are fetched in the CrawlerEngine given
+    if any, and the candidates are verified in another thread.
+    """
+    if selector_cache is not None:
+        selectors = selector_cache.get(url)
+        if selectors is not None:
+            comic = cached_selectors_comic(
+                selectors,
+                name,
+                url,
+                start_page,
+                alt_text,
+                single_page,
+                javascript,
+                title,
+                debug,
+                html_cache_ttl,
+            )
+            try:
+                first_pages = await comic.verify_xpath_async(engine)
+                check_first_pages(first_pages)
+            except Exception:
+                selector_cache.remove(url)
+            else:
+                click.echo("Found a path to the whole comic from a previous search.")
+                return comic, first_pages
+
+    click.echo("Looking for a path to the whole comic...")
+    page_cache = PageCache()
+    settings = first_pages_settings(javascript, debug, name, html_cache_ttl)
+    try:
+        async for item in crawl_async(
+            settings,
+            DiscoverySpider,
+            engine,
+            **first_pages_kwargs(url, None, single_page, javascript)
+        ):
+            add_to_page_cache(page_cache, item)
+    except Exception:
+        pass
+
+    return await asyncio.get_event_loop().run_in_executor(
+        None,
+        partial(
+            search_first_pages,
+            page_cache,
+            name,
+            url,
+            start_page,
+            alt_text,
+            single_page,
+            javascript,
+            title,
+            debug,
+            selector_cache,
+            jobs,
+            html_cache_ttl,
+        ),
     )
 
-    for next_page, image, tag_image, tag_next, attribute_image, attribute_next in tqdm(
-        combinations, total=total
-    ):
-        next_page_xpath = "//{}[contains({}, '{}')]//@href".format(
-            tag_next, to_lower_case(attribute_next), next_page
-        )
-        image_xpath = "//{}[contains({}, '{}')]//@src".format(
-            tag_image, to_lower_case(attribute_image), image
-        )
-        try:
+
+def search_first_pages(
+    page_cache: PageCache,
+    name: str,
+    url: str,
+    start_page: int = 1,
+    alt_text: str = None,
+    single_page: bool = False,
+    javascript: bool = False,
+    title: bool = False,
+    debug: bool = False,
+    selector_cache: Optional[SelectorCache] = None,
+    jobs: int = 1,
+    html_cache_ttl: int = None,
+) -> Tuple[Optional[Comic], Optional[List[Mapping]]]:
+    """
+    Looks for the XPath expressions of the comic among the candidates of the
+    first pages fetched, verifying them against the pages in memory.
+    """
+    if url not in page_cache:
+        click.echo("Search has failed.")
+        return None, None
+
+    image_candidates, next_page_candidates = page_cache.candidates
+    has_next_page = bool(next_page_candidates)
+    if single_page and not has_next_page:
+        # The next page is never looked at when verifying a single page
+        next_page_candidates = [SINGLE_PAGE_NEXT_PAGE_XPATH]
+
+    verifier = CandidateVerifier(page_cache, url, alt_text, single_page, javascript)
+    pool = (
+        Pool(jobs, initializer=initialize_verifier, initargs=(verifier,))
+        if jobs > 1
+        else None
+    )
+    progress = tqdm(total=len(next_page_candidates) + len(image_candidates))
+    try:
+        # The image and next page XPaths don't depend on each other, so each
+        # candidate is first scored on its own against the cached pages.
+        valid_next_pages = []
+        for next_page_candidate, is_valid in zip(
+            next_page_candidates,
+            verifier.evaluate(
+                "verify_next_page_xpath", next_page_candidates, pool, jobs
+            ),
+        ):
+            if is_valid:
+                valid_next_pages.append(next_page_candidate)
+            progress.update()
+        valid_images = []
+        for image_candidate, is_valid in zip(
+            image_candidates, verifier.evaluate("selects", image_candidates, pool, jobs)
+        ):
+            if is_valid:
+                valid_images.append(image_candidate)
+            progress.update()
+
+        # Only the pairs of valid candidates are verified together, the pairs
+        # of the most likely candidates first. The results come back in that
+        # order even when they are verified in parallel, so the first one
+        # passing is always the same.
+        combinations = [
+            (next_page_selector, image_selector)
+            for (_, next_page_selector), (_, image_selector) in sorted(
+                product(enumerate(valid_next_pages), enumerate(valid_images)),
+                key=lambda pair: (pair[0][0] + pair[1][0], pair[1][0]),
+            )
+        ]
+        progress.total += len(combinations)
+        progress.refresh()
+
+        for (next_page_selector, image_selector), first_pages in zip(
+            combinations, verifier.evaluate("verify", combinations, pool, jobs)
+        ):
+            progress.update()
+            if first_pages is None:
+                continue
             comic = Comic(
                 name,
                 url,
-                image_xpath,
-                next_page_xpath,
+                image_selector,
+                next_page_selector,
                 start_page=start_page,
                 alt_text=alt_text,
                 single_page=single_page,
                 javascript=javascript,
                 title=title,
                 debug=debug,
+                html_cache_ttl=html_cache_ttl,
             )
-            first_pages = comic.verify_xpath()
-            check_first_pages(first_pages)
+            comic.verified_pages = first_pages
+            # A placeholder next page XPath would only fail a later search
+            # of the whole comic on the same website
+            if selector_cache is not None and has_next_page:
+                selector_cache.set(url, image_selector, next_page_selector, alt_text)
             return comic, first_pages
-        except KeyboardInterrupt:
-            sys.exit(0)
-        except:
-            continue
+    except KeyboardInterrupt:
+        sys.exit(0)
+    finally:
+        progress.close()
+        if pool is not None:
+            # Stops the verifications still running once one has passed
+            pool.terminate()
     click.echo("Search has failed.")
     return None, None
+
+
+class CandidateVerifier:
+    """
+    Verifies the search candidates against the cached pages, either in the
+    current process or in the processes of a pool.
+    """
+
+    def __init__(
+        self,
+        page_cache: PageCache,
+        url: str,
+        alt_text: str = None,
+        single_page: bool = False,
+        javascript: bool = False,
+    ):
+        self.page_cache = page_cache
+        self.url = url
+        self.alt_text = alt_text
+        self.single_page = single_page
+        self.javascript = javascript
+
+    def verify_next_page_xpath(self, next_page_selector: str) -> bool:
+        return self.page_cache.verify_next_page_xpath(
+            self.url, next_page_selector, self.single_page, self.javascript
+        )
+
+    def selects(self, image_selector: str) -> bool:
+        return self.page_cache.selects(image_selector)
+
+    def verify(self, combination: Tuple[str, str]) -> Optional[List[Mapping]]:
+        next_page_selector, image_selector = combination
+        try:
+            first_pages = self.page_cache.verify_xpath(
+                self.url,
+                image_selector,
+                next_page_selector,
+                self.alt_text,
+                self.single_page,
+                self.javascript,
+            )
+            check_first_pages(first_pages)
+        except Exception:
+            return None
+        return first_pages
+
+    def evaluate(
+        self, method: str, candidates: List, pool=None, processes: int = 1
+    ) -> Iterator:
+        """
+        Lazily returns the result of the method for each candidate, in the
+        order of the candidates.
+        """
+        if pool is None:
+            return (getattr(self, method)(candidate) for candidate in candidates)
+        # Small chunks keep every process busy while still letting the
+        # results come back early enough to stop at the first one passing.
+        chunksize = max(1, len(candidates) // (4 * processes))
+        return pool.imap(partial(call_verifier, method), candidates, chunksize)
+
+
+pool_verifier = None  # type: Optional[CandidateVerifier]
+
+
+def initialize_verifier(verifier: CandidateVerifier) -> None:
+    global pool_verifier
+    pool_verifier = verifier
+    # The pool is forked from a process which may have handlers of its own;
+    # Ctrl-C is left to the main process and terminate() must kill the workers.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def call_verifier(method: str, candidate):
+    return getattr(pool_verifier, method)(candidate)
+
+
+def verify_cached_selectors(
+    selector_cache: SelectorCache,
+    name: str,
+    url: str,
+    start_page: int = 1,
+    alt_text: str = None,
+    single_page: bool = False,
+    javascript: bool = False,
+    title: bool = False,
+    debug: bool = False,
+    html_cache_ttl: int = None,
+) -> Tuple[Optional[Comic], Optional[List[Mapping]]]:
+    """
+    Verifies the XPath expressions previously found on the same website, if
+    any, so that the search can be skipped when they still work.
+    """
+    selectors = selector_cache.get(url)
+    if selectors is None:
+        return None, None
+    comic = cached_selectors_comic(
+        selectors,
+        name,
+        url,
+        start_page,
+        alt_text,
+        single_page,
+        javascript,
+        title,
+        debug,
+        html_cache_ttl,
+    )
+    try:
+        first_pages = comic.verify_xpath()
+        check_first_pages(first_pages)
+    except KeyboardInterrupt:
+        sys.exit(0)
+    except Exception:
+        selector_cache.remove(url)
+        return None, None
+    click.echo("Found a path to the whole comic from a previous search.")
+    return comic, first_pages
+
+
+def cached_selectors_comic(
+    selectors: Dict,
+    name: str,
+    url: str,
+    start_page: int = 1,
+    alt_text: str = None,
+    single_page: bool = False,
+    javascript: bool = False,
+    title: bool = False,
+    debug: bool = False,
+    html_cache_ttl: int = None,
+) -> Comic:
+    return Comic(
+        name,
+        url,
+        selectors["comic_image_selector"],
+        selectors["next_page_selector"],
+        start_page=start_page,
+        alt_text=alt_text if alt_text is not None else selectors["alt_text"],
+        single_page=single_page,
+        javascript=javascript,
+        title=title,
+        debug=debug,
+        html_cache_ttl=html_cache_ttl,
+    )
+
+
+def fetch_first_pages(
+    url: str,
+    next_page_xpaths: Optional[List[str]] = None,
+    single_page: bool = False,
+    javascript: bool = False,
+    debug: bool = False,
+    name: str = None,
+    html_cache_ttl: int = None,
+) -> PageCache:
+    """
+    Downloads the first pages of the comic in a single crawl, following every
+    distinct link given by the next page XPath candidates, so that all the
+    candidates can then be evaluated in memory. If no next page XPath
+    expressions are given, they are generated from the first page. The
+    pages are kept in the HTML cache of the comic if its name is given.
+    """
+    settings = first_pages_settings(javascript, debug, name, html_cache_ttl)
+
+    # The CrawlerWorker takes over Ctrl-C for the crawl; the candidates are
+    # evaluated afterwards in this process, where it must work as usual again.
+    previous_handlers = {
+        signum: signal.getsignal(signum) for signum in (signal.SIGINT, signal.SIGTERM)
+    }
+    page_cache = PageCache()
+    try:
+        worker = CrawlerWorker(
+            settings,
+            True,
+            DiscoverySpider,
+            **first_pages_kwargs(url, next_page_xpaths, single_page, javascript)
+        )
+        for item in worker.results():
+            add_to_page_cache(page_cache, item)
+    finally:
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+    return page_cache
+
+
+def first_pages_settings(
+    javascript: bool = False,
+    debug: bool = False,
+    name: str = None,
+    html_cache_ttl: int = None,
+) -> Dict:
+    settings = {**FAKE_USERAGENT_SETTINGS, "LOG_ENABLED": debug}  # type: Dict
+
+    if javascript:
+        settings.update(SPLASH_SETTINGS)
+    elif name is not None:
+        settings.update(html_cache_settings(name, html_cache_ttl))
+    return settings
+
+
+def first_pages_kwargs(
+    url: str,
+    next_page_xpaths: List[str] = None,
+    single_page: bool = False,
+    javascript: bool = False,
+) -> Dict:
+    return {
+        "start_url": url,
+        "next_page_selectors": next_page_xpaths,
+        "number_of_pages_to_check": 1 if single_page else 3,
+        "javascript": javascript,
+    }
+
+
+def add_to_page_cache(page_cache: PageCache, item) -> None:
+    if isinstance(item, PageCandidates):
+        page_cache.candidates = (
+            item.get("image_candidates"),
+            item.get("next_page_candidates"),
+        )
+    elif not isinstance(item, Exception):
+        page_cache.add(item)
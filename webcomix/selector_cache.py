@@ -0,0 +1,97 @@
+import json
+import os
+import time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+from webcomix.util import cache_directory
+
+DEFAULT_TIME_TO_LIVE = 30 * 24 * 60 * 60
+DEFAULT_MAXIMUM_SIZE = 256
+
+
+class SelectorCache:
+    """
+    On-disk cache of the XPath expressions found by the search, by host name.
+    Entries expire after a given time and the least recently used ones are
+    evicted once the cache is full.
+    """
+
+    def __init__(
+        self,
+        path: str = None,
+        time_to_live: int = DEFAULT_TIME_TO_LIVE,
+        maximum_size: int = DEFAULT_MAXIMUM_SIZE,
+    ):
+        self.path = path or os.path.join(cache_directory(), "selectors.json")
+        self.time_to_live = time_to_live
+        self.maximum_size = maximum_size
+
+    def get(self, url: str) -> Optional[Dict]:
+        """
+        Returns the selectors previously found for the host of the url, if
+        they haven't expired yet.
+        """
+        entries = self._load()
+        entry = entries.get(self.host(url))
+        if entry is None or time.time() - entry["created"] > self.time_to_live:
+            return None
+        entry["used"] = time.time()
+        self._save(entries)
+        return entry
+
+    def set(
+        self,
+        url: str,
+        comic_image_selector: str,
+        next_page_selector: str,
+        alt_text: str = None,
+    ) -> None:
+        entries = self._load()
+        now = time.time()
+        entries[self.host(url)] = {
+            "comic_image_selector": comic_image_selector,
+            "next_page_selector": next_page_selector,
+            "alt_text": alt_text,
+            "created": now,
+            "used": now,
+        }
+        entries = {
+            host: entry
+            for host, entry in entries.items()
+            if now - entry["created"] <= self.time_to_live
+        }
+        if len(entries) > self.maximum_size:
+            most_recently_used = sorted(
+                entries, key=lambda host: entries[host]["used"], reverse=True
+            )
+            entries = {
+                host: entries[host] for host in most_recently_used[: self.maximum_size]
+            }
+        self._save(entries)
+
+    def remove(self, url: str) -> None:
+        entries = self._load()
+        if entries.pop(self.host(url), None) is not None:
+            self._save(entries)
+
+    @staticmethod
+    def host(url: str) -> str:
+        return urlparse(url).netloc.lower() or url
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path) as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, entries: Dict) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temporary_path = "{}.tmp".format(self.path)
+            with open(temporary_path, "w") as cache_file:
+                json.dump(entries, cache_file)
+            os.replace(temporary_path, self.path)
+        except OSError:
+            pass
@@ -121,3 +121,10 @@ supported_comics = {
         "//a[img[contains(@src, 'next')]]/@href",
     ),
 }
+
+# Pages listing every page of a comic, with the XPath expression giving out
+# their links, or None for a sitemap
+supported_archives = {
+    "xkcd": ("https://xkcd.com/archive/", "//div[@id='middleContainer']/a/@href"),
+    "xkcd_alt": ("https://xkcd.com/archive/", "//div[@id='middleContainer']/a/@href"),
+}
@@ -50,3 +50,10 @@ def one_webpage_searchable_uri():
         .resolve()
         .as_uri()
     )
+
+
+@pytest.fixture
+def numbered_webpages_uri():
+    return str(
+        get_dir_path_of_script().joinpath("numbered_webpages/1.html").resolve().as_uri()
+    )
@@ -0,0 +1,47 @@
+import os
+
+from webcomix.batch import download_comics, downloaded_comics, last_downloaded_page
+from webcomix.comic import Comic
+from webcomix.tests.fake_websites.fixture import (
+    three_webpages_uri,
+    three_webpages_alt_text_uri,
+)
+
+
+def test_download_comics_downloads_every_comic(
+    tmp_path, monkeypatch, three_webpages_uri, three_webpages_alt_text_uri
+):
+    monkeypatch.chdir(tmp_path)
+    comics = [
+        Comic("first", three_webpages_uri, "//img/@src", "//a/@href"),
+        Comic(
+            "second",
+            three_webpages_alt_text_uri,
+            "//img/@src",
+            "//a/@href",
+            alt_text="//img/@title",
+        ),
+    ]
+
+    errors = download_comics(comics, jobs=1)
+
+    assert errors == [None, None]
+    assert len(os.listdir("first")) == 2
+    assert len(os.listdir("second")) == 4
+    assert [last_downloaded_page(comic) for comic in comics] == [3, 3]
+
+
+def test_downloaded_comics_finds_the_comics_still_present(
+    tmp_path, monkeypatch, three_webpages_uri
+):
+    monkeypatch.chdir(tmp_path)
+    comics = [
+        Comic("first", three_webpages_uri, "//img/@src", "//a/@href"),
+        Comic("second", three_webpages_uri, "//img/@src", "//a/@href"),
+    ]
+    download_comics(comics, jobs=2)
+    os.rename("first", "third")
+
+    found = downloaded_comics()
+
+    assert [comic.definition() for comic in found] == [comics[1].definition()]
@@ -1,3 +1,5 @@
+import os
+
 import click
 from click.testing import CliRunner
 import pytest
@@ -5,7 +7,8 @@ import pytest
 from webcomix import cli
 from webcomix.comic import Comic
 from webcomix.exceptions import CrawlerBlocked, NextLinkNotFound
-from webcomix.supported_comics import supported_comics
+from webcomix.manifest import Manifest
+from webcomix.supported_comics import supported_archives, supported_comics
 from webcomix.tests.fake_websites.fixture import (
     three_webpages_uri,
     three_webpages_alt_text_uri,
@@ -128,11 +131,51 @@ def test_predefined_downloadable_comic_makes_the_cbz_file(mocker):
     mock_download = mocker.patch("webcomix.comic.Comic.download")
     mock_convert_to_cbz = mocker.patch("webcomix.comic.Comic.convert_to_cbz")
 
+    result = runner.invoke(cli.download, [first_comic, "--cbz"])
+    assert result.exit_code == 0
+    assert mock_download.call_args == mocker.call(False, True, "store", None, None, False)
+    assert mock_convert_to_cbz.call_count == 0
+
+
+def test_predefined_downloadable_comic_adds_the_previous_images_to_the_cbz_file(
+    mocker,
+):
+    runner = CliRunner()
+    mocker.patch("os.path.isdir", return_value=True)
+    mock_download = mocker.patch("webcomix.comic.Comic.download")
+    mock_convert_to_cbz = mocker.patch("webcomix.comic.Comic.convert_to_cbz")
+
     result = runner.invoke(cli.download, [first_comic, "--cbz"])
     assert result.exit_code == 0
     assert mock_convert_to_cbz.call_count == 1
 
 
+def test_predefined_downloadable_comic_makes_the_cbz_file_with_compression(mocker):
+    runner = CliRunner()
+    mock_download = mocker.patch("webcomix.comic.Comic.download")
+
+    result = runner.invoke(
+        cli.download,
+        [first_comic, "--cbz", "--compression=deflate", "--compression-level=9"],
+    )
+    assert result.exit_code == 0
+    assert mock_download.call_args == mocker.call(False, True, "deflate", 9, None, False)
+
+
+def test_predefined_downloadable_comic_reads_back_the_cbz_file_with_deep_verify(
+    mocker,
+):
+    runner = CliRunner()
+    mocker.patch("os.path.isdir", return_value=False)
+    mocker.patch("os.path.isfile", return_value=True)
+    mocker.patch("webcomix.comic.Comic.download")
+    mock_verify_cbz = mocker.patch("webcomix.comic.Comic.verify_cbz")
+
+    result = runner.invoke(cli.download, [first_comic, "--cbz", "--deep-verify"])
+    assert result.exit_code == 0
+    assert mock_verify_cbz.call_count == 1
+
+
 def test_predefined_unknown_comic_does_not_make_the_cbz_file(mocker):
     runner = CliRunner()
     mock_download = mocker.patch("webcomix.comic.Comic.download")
@@ -168,7 +211,7 @@ def test_custom_comic_asks_for_verification_before_downloading(mocker):
         [
             mocker.call.verify_xpath(),
             mocker.call.print_verification(mocker.ANY),
-            mocker.call.download(),
+            mocker.call.download(False, False, "store", None, None, False),
         ]
     )
 
@@ -192,7 +235,7 @@ def test_custom_comic_makes_the_cbz_file(mocker):
         "y",
     )
     assert result.exit_code == 0
-    assert mock_convert_to_cbz.call_count == 1
+    assert mock_download.call_args == mocker.call(False, True, "store", None, None, False)
 
 
 def test_custom_comic_doesnt_ask_for_verification_if_next_link_not_found(mocker):
@@ -248,10 +291,194 @@ def test_custom_comic_doesnt_download_comic_if_crawler_blocked(mocker):
     assert mock_download.call_count == 0
 
 
+def test_predefined_downloadable_comic_uses_its_archive(mocker):
+    runner = CliRunner()
+    mock_download_webcomic = mocker.patch("webcomix.cli.download_webcomic")
+
+    result = runner.invoke(cli.download, ["xkcd"])
+    assert result.exit_code == 0
+    comic = mock_download_webcomic.call_args[0][0]
+    assert (comic.archive_url, comic.archive_xpath) == supported_archives["xkcd"]
+
+
+def test_download_uses_the_engine_chosen(mocker):
+    runner = CliRunner()
+    mock_download_webcomic = mocker.patch("webcomix.cli.download_webcomic")
+
+    result = runner.invoke(cli.download, ["xkcd", "--engine=fast"])
+    assert result.exit_code == 0
+    assert mock_download_webcomic.call_args[0][0].engine == "fast"
+
+
+def test_fast_engine_needs_aiohttp(mocker):
+    runner = CliRunner()
+    mocker.patch("webcomix.cli.fast_engine_available", return_value=False)
+    mock_download_webcomic = mocker.patch("webcomix.cli.download_webcomic")
+
+    result = runner.invoke(cli.download, ["xkcd", "--engine=fast"])
+    assert result.exit_code == 2
+    assert "pip install webcomix[fast]" in result.output
+    assert mock_download_webcomic.call_count == 0
+
+
+def test_predefined_downloadable_comics_are_downloaded_together(mocker):
+    runner = CliRunner()
+    second_comic = sorted(supported_comics.keys())[1]
+    mock_download = mocker.patch("webcomix.comic.Comic.download")
+    mock_download_comics = mocker.patch(
+        "webcomix.cli.download_comics", return_value=[None, CrawlerBlocked()]
+    )
+
+    result = runner.invoke(
+        cli.download, [first_comic, second_comic, "--jobs=3", "--jobs-per-domain=1"]
+    )
+    assert result.exit_code == 0
+    assert mock_download.call_count == 0
+    comics, jobs = mock_download_comics.call_args[0][:2]
+    assert [comic.name for comic in comics] == [first_comic, second_comic]
+    assert jobs == 3
+    assert mock_download_comics.call_args[0][7] == 1
+    assert "{}: finished downloading the images".format(first_comic) in result.output
+    assert "{}: blocked by the hosting website".format(second_comic) in result.output
+
+
+def test_index_writes_the_page_index_of_a_predefined_comic(mocker):
+    runner = CliRunner()
+    mock_index = mocker.patch("webcomix.comic.Comic.index")
+
+    result = runner.invoke(cli.index, [first_comic])
+    assert result.exit_code == 0
+    assert mock_index.call_args == mocker.call("{}.index.jsonl".format(first_comic))
+
+
+def test_images_downloads_the_images_of_the_page_index(mocker, tmp_path):
+    runner = CliRunner()
+    index_path = str(tmp_path / "foo.index.jsonl")
+    open(index_path, "w").close()
+    mock_download_from_index = mocker.patch("webcomix.comic.Comic.download_from_index")
+
+    result = runner.invoke(
+        cli.images,
+        ["foo", "--index", index_path, "--first-page=10", "--last-page=20"],
+    )
+    assert result.exit_code == 0
+    assert mock_download_from_index.call_args == mocker.call(
+        index_path, 10, 20, False, "store", None
+    )
+
+
+def test_images_without_page_index_aborts(mocker):
+    runner = CliRunner()
+    mock_download_from_index = mocker.patch("webcomix.comic.Comic.download_from_index")
+
+    result = runner.invoke(cli.images, ["foo"])
+    assert result.exit_code == 1
+    assert mock_download_from_index.call_count == 0
+
+
+def test_status_reports_the_images_downloaded(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("foo")
+    for page in [1, 2]:
+        with open(os.path.join("foo", "{}.jpg".format(page)), "w") as image_file:
+            image_file.write("image")
+    runner = CliRunner()
+
+    result = runner.invoke(cli.status, ["foo"])
+    assert result.exit_code == 0
+    assert result.output == "foo: 2 images downloaded (10 bytes), up to page 2\n"
+
+
+def test_status_without_download_aborts(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    runner = CliRunner()
+
+    result = runner.invoke(cli.status, ["foo"])
+    assert result.exit_code == 1
+    assert not os.path.isfile(Manifest.location("foo"))
+
+
+def test_predefined_downloadable_comic_exports_the_page_index(mocker):
+    runner = CliRunner()
+    mock_download = mocker.patch("webcomix.comic.Comic.download")
+
+    result = runner.invoke(cli.download, [first_comic, "--export-index=foo.csv"])
+    assert result.exit_code == 0
+    assert mock_download.call_args == mocker.call(
+        False, False, "store", None, "foo.csv", False
+    )
+
+
+def test_predefined_downloadable_comic_downloads_from_the_page_index(mocker, tmp_path):
+    runner = CliRunner()
+    index_path = str(tmp_path / "foo.index.jsonl")
+    open(index_path, "w").close()
+    mock_download = mocker.patch("webcomix.comic.Comic.download")
+    mock_download_from_index = mocker.patch("webcomix.comic.Comic.download_from_index")
+
+    result = runner.invoke(cli.download, [first_comic, "--from-index", index_path])
+    assert result.exit_code == 0
+    assert mock_download.call_count == 0
+    assert mock_download_from_index.call_args[0][0] == index_path
+
+
+def test_predefined_downloadable_comics_cannot_share_a_page_index(mocker):
+    runner = CliRunner()
+    second_comic = sorted(supported_comics.keys())[1]
+    mock_download_comics = mocker.patch("webcomix.cli.download_comics")
+
+    result = runner.invoke(
+        cli.download, [first_comic, second_comic, "--export-index=foo.csv"]
+    )
+    assert result.exit_code == 2
+    assert mock_download_comics.call_count == 0
+
+
+def test_update_downloads_every_downloaded_comic(mocker):
+    runner = CliRunner()
+    comics = [
+        Comic("foo", "url", "image", "next page"),
+        Comic("bar", "url", "image", "next page"),
+    ]
+    mocker.patch("webcomix.cli.downloaded_comics", return_value=comics)
+    mocker.patch("webcomix.cli.last_downloaded_page", side_effect=[1, 5, 3, 5])
+    mock_download_comics = mocker.patch(
+        "webcomix.cli.download_comics", return_value=[None, None]
+    )
+
+    result = runner.invoke(cli.update, ["--jobs=2"])
+    assert result.exit_code == 0
+    assert mock_download_comics.call_args[0] == (comics, 2)
+    assert "foo: 2 new pages" in result.output
+    assert "bar: 0 new pages" in result.output
+
+
+def test_update_reports_blocked_comics(mocker):
+    runner = CliRunner()
+    comics = [Comic("foo", "url", "image", "next page")]
+    mocker.patch("webcomix.cli.downloaded_comics", return_value=comics)
+    mocker.patch("webcomix.cli.last_downloaded_page", return_value=1)
+    mocker.patch("webcomix.cli.download_comics", return_value=[CrawlerBlocked()])
+
+    result = runner.invoke(cli.update)
+    assert result.exit_code == 0
+    assert "foo: blocked by the hosting website" in result.output
+
+
+def test_update_without_downloaded_comics_does_nothing(mocker):
+    runner = CliRunner()
+    mocker.patch("webcomix.cli.downloaded_comics", return_value=[])
+    mock_download_comics = mocker.patch("webcomix.cli.download_comics")
+
+    result = runner.invoke(cli.update)
+    assert result.exit_code == 0
+    assert mock_download_comics.call_count == 0
+
+
 def test_discovered_comic_searches_for_a_comic(mocker):
     runner = CliRunner()
     mock_discovery = mocker.patch(
-        "webcomix.cli.discovery",
+        "webcomix.search.discovery",
         return_value=(
             Comic(mocker.ANY, mocker.ANY, mocker.ANY, mocker.ANY, mocker.ANY),
             mocker.ANY,
@@ -266,11 +493,33 @@ def test_discovered_comic_searches_for_a_comic(mocker):
     assert mock_discovery.call_count == 1
 
 
+def test_discovered_comic_searches_with_the_number_of_jobs(mocker):
+    runner = CliRunner()
+    mock_discovery = mocker.patch(
+        "webcomix.search.discovery", return_value=(None, None)
+    )
+
+    result = runner.invoke(cli.search, ["foo", "--start_url=good", "--jobs=4"])
+    assert result.exit_code == 0
+    assert mock_discovery.call_args[1]["jobs"] == 4
+
+
+def test_discovered_comic_searches_without_the_selector_cache(mocker):
+    runner = CliRunner()
+    mock_discovery = mocker.patch(
+        "webcomix.search.discovery", return_value=(None, None)
+    )
+
+    result = runner.invoke(cli.search, ["foo", "--start_url=good", "--no-cache"])
+    assert result.exit_code == 0
+    assert mock_discovery.call_args[1]["selector_cache"] is None
+
+
 def test_discovered_comic_asks_for_verification_before_downloading(mocker):
     runner = CliRunner()
     mock_manager = mocker.Mock()
     mock_discovery = mocker.patch(
-        "webcomix.cli.discovery",
+        "webcomix.search.discovery",
         return_value=(
             Comic(mocker.ANY, mocker.ANY, mocker.ANY, mocker.ANY, mocker.ANY),
             mocker.ANY,
@@ -286,14 +535,17 @@ def test_discovered_comic_asks_for_verification_before_downloading(mocker):
     result = runner.invoke(cli.search, ["foo", "--start_url=good"], "y")
     assert result.exit_code == 0
     mock_manager.assert_has_calls(
-        [mocker.call.print_verification(mocker.ANY), mocker.call.download()]
+        [
+            mocker.call.print_verification(mocker.ANY),
+            mocker.call.download(False, False, "store", None, None, False),
+        ]
     )
 
 
 def test_discovered_comic_makes_cbz_file(mocker):
     runner = CliRunner()
     mock_discovery = mocker.patch(
-        "webcomix.cli.discovery",
+        "webcomix.search.discovery",
         return_value=(
             Comic(mocker.ANY, mocker.ANY, mocker.ANY, mocker.ANY, mocker.ANY),
             mocker.ANY,
@@ -303,10 +555,11 @@ def test_discovered_comic_makes_cbz_file(mocker):
     mock_verify_xpath = mocker.patch("webcomix.comic.Comic.verify_xpath")
     mock_print_verification = mocker.patch("webcomix.cli.print_verification")
     mock_convert_to_cbz = mocker.patch("webcomix.comic.Comic.convert_to_cbz")
+    mocker.patch("os.path.isdir", return_value=False)
 
     result = runner.invoke(cli.search, ["foo", "--start_url=good", "--cbz"], "y")
     assert result.exit_code == 0
-    assert mock_convert_to_cbz.call_count == 1
+    assert mock_download.call_args == mocker.call(False, True, "store", None, None, False)
 
 
 def test_download_will_abort_if_crawler_blocked(mocker):
@@ -318,6 +571,7 @@ def test_download_will_abort_if_crawler_blocked(mocker):
 
 
 def test_download_will_make_cbz_if_crawler_blocked_and_cbz_enabled(mocker):
+    mocker.patch("os.path.isdir", return_value=True)
     mock_comic = mocker.patch("webcomix.comic.Comic")
     mock_make_cbz = mocker.patch("webcomix.comic.Comic.convert_to_cbz")
     mocker.patch("webcomix.comic.Comic.download", side_effect=CrawlerBlocked)
@@ -1,37 +1,41 @@
+import asyncio
 import os
 import shutil
-from zipfile import ZipFile, BadZipFile
+from zipfile import ZIP_DEFLATED, ZipFile, BadZipFile
 
 import pytest
 
 from webcomix.comic import Comic, SPLASH_SETTINGS
+from webcomix.download_state import DownloadState
+from webcomix.manifest import Manifest
+from webcomix.scrapy.crawler_worker import CrawlerEngine
 from webcomix.supported_comics import supported_comics
 from webcomix.tests.fake_websites.fixture import (
     three_webpages_uri,
     three_webpages_alt_text_uri,
     one_webpage_uri,
+    numbered_webpages_uri,
 )
 
 
+def remove_test_outputs():
+    for name in ["xkcd", "test"]:
+        if os.path.isdir(name):
+            shutil.rmtree(name)
+        for path in [
+            "{}.cbz".format(name),
+            DownloadState.location(name),
+            Manifest.location(name),
+        ]:
+            if os.path.isfile(path):
+                os.remove(path)
+
+
 @pytest.fixture
 def cleanup_test_directories():
-    if os.path.isfile("xkcd.cbz"):
-        os.remove("xkcd.cbz")
-    if os.path.isfile("test.cbz"):
-        os.remove("test.cbz")
-    if os.path.isdir("xkcd"):
-        shutil.rmtree("xkcd")
-    if os.path.isdir("test"):
-        shutil.rmtree("test")
+    remove_test_outputs()
     yield None
-    if os.path.isdir("xkcd"):
-        shutil.rmtree("xkcd")
-    if os.path.isdir("test"):
-        shutil.rmtree("test")
-    if os.path.isfile("xkcd.cbz"):
-        os.remove("xkcd.cbz")
-    if os.path.isfile("test.cbz"):
-        os.remove("test.cbz")
+    remove_test_outputs()
 
 
 @pytest.fixture
@@ -91,10 +95,35 @@ def test_make_cbz(fake_downloaded_xkcd_comic):
                 assert image_file.read().decode("ascii") == "testing {}".format(i)
 
 
+def test_make_cbz_with_compression(fake_downloaded_xkcd_comic):
+    fake_downloaded_xkcd_comic.convert_to_cbz("deflate", 9)
+    with ZipFile("xkcd.cbz") as cbz_file:
+        assert cbz_file.testzip() is None
+        for i in range(1, 6):
+            assert cbz_file.getinfo("{}.txt".format(i)).compress_type == ZIP_DEFLATED
+            with cbz_file.open("{}.txt".format(i), "r") as image_file:
+                assert image_file.read().decode("ascii") == "testing {}".format(i)
+
+
 def test_make_cbz_corrupted_archive(mocker, capfd, fake_downloaded_xkcd_comic):
     mocker.patch.object(ZipFile, "testzip", return_value=mocker.ANY)
+    with pytest.raises(BadZipFile):
+        fake_downloaded_xkcd_comic.convert_to_cbz(deep_verify=True)
+
+
+def test_make_cbz_only_checks_the_new_pages(mocker, fake_downloaded_xkcd_comic):
+    mock_testzip = mocker.patch.object(ZipFile, "testzip")
+    fake_downloaded_xkcd_comic.convert_to_cbz()
+    assert mock_testzip.call_count == 0
+
+
+def test_make_cbz_keeps_the_pages_when_they_dont_match_the_archive(
+    mocker, fake_downloaded_xkcd_comic
+):
+    mocker.patch("webcomix.compression.zlib.crc32", return_value=0)
     with pytest.raises(BadZipFile):
         fake_downloaded_xkcd_comic.convert_to_cbz()
+    assert len(os.listdir("xkcd")) == 5
 
 
 def test_download_runs_the_worker(mocker, cleanup_test_directories):
@@ -143,6 +172,262 @@ def test_download_with_alt_text_saves_the_text(
     assert len(files) == 4
 
 
+@pytest.mark.parametrize("parallel_pages", [None, 3])
+def test_download_fetching_pages_ahead_keeps_the_order_of_the_pages(
+    cleanup_test_directories, numbered_webpages_uri, parallel_pages
+):
+    comic = Comic(
+        "test",
+        numbered_webpages_uri,
+        "//img/@src",
+        "//a/@href",
+        parallel_pages=parallel_pages,
+    )
+    comic.download()
+
+    pages = {}
+    for file_name in os.listdir("test"):
+        with open(os.path.join("test", file_name)) as image_file:
+            pages[file_name] = image_file.read()
+    # The fifth page breaks the pattern of the URLs, going from 4.html to 6.html
+    assert pages == {
+        "1": "page 1",
+        "2": "page 2",
+        "3": "page 3",
+        "4": "page 4",
+        "5": "page 6",
+        "6": "page 7",
+    }
+    download_state = DownloadState(DownloadState.location("test"), comic.definition())
+    assert download_state.last_page() == (
+        numbered_webpages_uri.replace("1.html", "7.html"),
+        6,
+    )
+
+
+@pytest.mark.parametrize("parallel_pages", [None, 2])
+def test_download_starts_from_the_pages_verified(
+    cleanup_test_directories, tmp_path, numbered_webpages_uri, parallel_pages
+):
+    website = tmp_path / "website"
+    shutil.copytree(os.path.dirname(numbered_webpages_uri[len("file://") :]), website)
+    comic = Comic(
+        "test",
+        (website / "1.html").as_uri(),
+        "//img/@src",
+        "//a/@href",
+        parallel_pages=parallel_pages,
+    )
+    comic.verify_xpath()
+    # The pages verified can only be downloaded from the verification
+    for page in ["1", "2", "3"]:
+        os.remove(str(website / "{}.html".format(page)))
+
+    comic.download()
+
+    pages = {}
+    for file_name in os.listdir("test"):
+        with open(os.path.join("test", file_name)) as image_file:
+            pages[file_name] = image_file.read()
+    assert pages == {
+        "1": "page 1",
+        "2": "page 2",
+        "3": "page 3",
+        "4": "page 4",
+        "5": "page 6",
+        "6": "page 7",
+    }
+
+
+def test_download_async_returns_the_pages_as_they_are_downloaded(
+    cleanup_test_directories, numbered_webpages_uri
+):
+    comic = Comic("test", numbered_webpages_uri, "//img/@src", "//a/@href")
+
+    async def verify_and_download():
+        with CrawlerEngine() as engine:
+            await comic.verify_xpath_async(engine)
+            return [page async for page in comic.download_async(engine=engine)]
+
+    pages = asyncio.run(verify_and_download())
+
+    assert [page["page"] for page in pages] == [1, 2, 3, 4, 5, 6]
+    assert pages[0]["url"] == numbered_webpages_uri
+    assert sorted(os.listdir("test")) == ["1", "2", "3", "4", "5", "6"]
+
+
+def test_download_async_stops_the_crawl_when_cancelled(
+    cleanup_test_directories, numbered_webpages_uri
+):
+    comic = Comic("test", numbered_webpages_uri, "//img/@src", "//a/@href")
+
+    async def download_first_page():
+        async for page in comic.download_async():
+            return page
+
+    async def cancel_download():
+        download = asyncio.ensure_future(comic.download_async().__anext__())
+        await asyncio.sleep(0)
+        download.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await download
+
+    assert asyncio.run(download_first_page())["page"] == 1
+    asyncio.run(cancel_download())
+
+
+@pytest.mark.parametrize(
+    "archive_url,archive_xpath",
+    [("archive.html", "//a/@href"), ("sitemap.xml", None)],
+)
+def test_download_fetches_the_pages_listed_in_the_archive(
+    cleanup_test_directories, numbered_webpages_uri, archive_url, archive_xpath
+):
+    comic = Comic(
+        "test",
+        numbered_webpages_uri,
+        "//img/@src",
+        "//a/@href",
+        archive_url=numbered_webpages_uri.replace("1.html", archive_url),
+        archive_xpath=archive_xpath,
+    )
+    comic.download()
+
+    pages = {}
+    for file_name in os.listdir("test"):
+        with open(os.path.join("test", file_name)) as image_file:
+            pages[file_name] = image_file.read()
+    assert pages == {
+        "1": "page 1",
+        "2": "page 2",
+        "3": "page 3",
+        "4": "page 4",
+        "5": "page 6",
+        "6": "page 7",
+    }
+
+
+def test_download_from_index_downloads_the_images_without_the_pages(
+    cleanup_test_directories, numbered_webpages_uri
+):
+    comic = Comic("test", numbered_webpages_uri, "//img/@src", "//a/@href")
+    comic.index("test.index.jsonl")
+    try:
+        assert not os.path.isdir("test")
+        with open("test.index.jsonl") as index_file:
+            assert len(index_file.readlines()) == 6
+
+        comic.download_from_index("test.index.jsonl", first_page=2, last_page=4)
+        assert sorted(os.listdir("test")) == ["2", "3", "4"]
+
+        comic.download_from_index("test.index.jsonl")
+        with open(os.path.join("test", "5")) as image_file:
+            assert image_file.read() == "page 6"
+        assert sorted(os.listdir("test")) == ["1", "2", "3", "4", "5", "6"]
+    finally:
+        os.remove("test.index.jsonl")
+
+
+def test_download_exports_the_page_index(
+    cleanup_test_directories, numbered_webpages_uri
+):
+    comic = Comic("test", numbered_webpages_uri, "//img/@src", "//a/@href")
+    comic.download(export_index="test.csv")
+    try:
+        shutil.rmtree("test")
+
+        comic.download_from_index("test.csv")
+        with open(os.path.join("test", "5")) as image_file:
+            assert image_file.read() == "page 6"
+        assert sorted(os.listdir("test")) == ["1", "2", "3", "4", "5", "6"]
+    finally:
+        os.remove("test.csv")
+
+
+def test_download_remembers_the_last_page(cleanup_test_directories, three_webpages_uri):
+    comic = Comic("test", three_webpages_uri, "//img/@src", "//a/@href")
+    comic.download()
+
+    download_state = DownloadState(DownloadState.location("test"), comic.definition())
+    assert download_state.last_page() == (
+        three_webpages_uri.replace("1.html", "3.html"),
+        3,
+    )
+
+
+def test_download_resumes_from_the_last_page(
+    mocker, cleanup_test_directories, three_webpages_uri
+):
+    comic = Comic("test", three_webpages_uri, "//img/@src", "//a/@href")
+    comic.download()
+    mock_crawler_worker = mocker.patch("webcomix.scrapy.crawler_worker.CrawlerWorker")
+
+    comic.download()
+
+    crawl_kwargs = mock_crawler_worker.call_args[1]
+    assert crawl_kwargs["start_url"] == three_webpages_uri.replace("1.html", "3.html")
+    assert crawl_kwargs["start_page"] == 3
+
+
+def test_download_from_start_ignores_the_last_page(
+    mocker, cleanup_test_directories, three_webpages_uri
+):
+    comic = Comic("test", three_webpages_uri, "//img/@src", "//a/@href")
+    comic.download()
+    mock_crawler_worker = mocker.patch("webcomix.scrapy.crawler_worker.CrawlerWorker")
+
+    comic.download(from_start=True)
+
+    crawl_kwargs = mock_crawler_worker.call_args[1]
+    assert crawl_kwargs["start_url"] == three_webpages_uri
+    assert crawl_kwargs["start_page"] == 1
+
+
+def test_download_refreshing_the_images_goes_through_every_page(
+    mocker, cleanup_test_directories, three_webpages_uri
+):
+    comic = Comic("test", three_webpages_uri, "//img/@src", "//a/@href")
+    comic.download()
+    mock_crawler_worker = mocker.patch("webcomix.scrapy.crawler_worker.CrawlerWorker")
+
+    comic.download(refresh=True)
+
+    settings = mock_crawler_worker.call_args[0][0]
+    assert settings["REFRESH_IMAGES"]
+    assert mock_crawler_worker.call_args[1]["start_url"] == three_webpages_uri
+
+
+def test_download_refreshing_the_cbz_file_replaces_the_images(
+    cleanup_test_directories, three_webpages_alt_text_uri
+):
+    comic = Comic(
+        "test",
+        three_webpages_alt_text_uri,
+        "//img/@src",
+        "//a/@href",
+        alt_text="//img/@title",
+    )
+    comic.download(cbz=True)
+
+    # Without validators, the images are downloaded again after a HEAD request
+    comic.download(cbz=True, refresh=True)
+
+    with ZipFile("test.cbz", mode="r") as cbz_file:
+        assert cbz_file.namelist() == ["1", "1.txt", "2", "2.txt"]
+        assert cbz_file.read("1.txt") == b"First page"
+
+
+def test_download_does_not_resume_a_comic_with_other_selectors(
+    mocker, cleanup_test_directories, three_webpages_uri
+):
+    Comic("test", three_webpages_uri, "//img/@src", "//a/@href").download()
+    mock_crawler_worker = mocker.patch("webcomix.scrapy.crawler_worker.CrawlerWorker")
+
+    Comic("test", three_webpages_uri, "//img/@src", "//a[1]/@href").download()
+
+    assert mock_crawler_worker.call_args[1]["start_url"] == three_webpages_uri
+
+
 def test_download_does_not_add_crawlers_in_main_process(
     mocker, cleanup_test_directories, three_webpages_uri
 ):
@@ -163,6 +448,23 @@ def test_convert_to_cbz_adds_all_files_to_cbz(
         assert len(cbz_file.infolist()) == 2
 
 
+def test_download_with_cbz_saves_the_files_in_the_cbz_file(
+    cleanup_test_directories, three_webpages_alt_text_uri
+):
+    comic = Comic(
+        "test",
+        three_webpages_alt_text_uri,
+        "//img/@src",
+        "//a/@href",
+        alt_text="//img/@title",
+    )
+    comic.download(cbz=True)
+    assert not os.path.isdir("test")
+    with ZipFile("test.cbz", mode="r") as cbz_file:
+        assert cbz_file.namelist() == ["1", "1.txt", "2", "2.txt"]
+        assert cbz_file.read("1.txt") == b"First page"
+
+
 def test_verify_xpath(three_webpages_uri):
     comic = Comic("test", three_webpages_uri, "//img/@src", "//a/@href")
 
@@ -174,18 +476,21 @@ def test_verify_xpath(three_webpages_uri):
             "url": three_webpages_uri,
             "image_urls": [three_webpages_folder + "1.jpeg"],
             "alt_text": None,
+            "next_page_url": three_webpages_folder + "2.html",
         },
         {
             "page": 2,
             "url": three_webpages_folder + "2.html",
             "image_urls": [three_webpages_folder + "2.jpeg"],
             "alt_text": None,
+            "next_page_url": three_webpages_folder + "3.html",
         },
         {
             "page": 3,
             "url": three_webpages_folder + "3.html",
             "image_urls": [],
             "alt_text": None,
+            "next_page_url": None,
         },
     ]
 
@@ -207,18 +512,21 @@ def test_verify_xpath_with_alt_text(three_webpages_alt_text_uri):
             "url": three_webpages_alt_text_uri,
             "image_urls": [three_webpages_alt_text_folder + "1.jpeg"],
             "alt_text": "First page",
+            "next_page_url": three_webpages_alt_text_folder + "2.html",
         },
         {
             "page": 2,
             "url": three_webpages_alt_text_folder + "2.html",
             "image_urls": [three_webpages_alt_text_folder + "2.jpeg"],
             "alt_text": "Second page",
+            "next_page_url": three_webpages_alt_text_folder + "3.html",
         },
         {
             "page": 3,
             "url": three_webpages_alt_text_folder + "3.html",
             "image_urls": [],
             "alt_text": None,
+            "next_page_url": None,
         },
     ]
 
@@ -232,7 +540,7 @@ def test_verify_xpath_only_verifies_one_page_with_single_page(one_webpage_uri):
 
 def test_download_will_run_splash_settings_if_javascript(mocker):
     mocker.patch("os.path.isdir")
-    mock_crawler_worker = mocker.patch("webcomix.comic.CrawlerWorker")
+    mock_crawler_worker = mocker.patch("webcomix.scrapy.crawler_worker.CrawlerWorker")
     comic = Comic(
         mocker.ANY,
         mocker.ANY,
@@ -250,7 +558,7 @@ def test_download_will_run_splash_settings_if_javascript(mocker):
 
 def test_download_will_not_run_splash_settings_if_not_javascript(mocker):
     mocker.patch("os.path.isdir")
-    mock_crawler_worker = mocker.patch("webcomix.comic.CrawlerWorker")
+    mock_crawler_worker = mocker.patch("webcomix.scrapy.crawler_worker.CrawlerWorker")
     comic = Comic(mocker.ANY, mocker.ANY, mocker.ANY, mocker.ANY, mocker.ANY)
     comic.download()
     settings = mock_crawler_worker.call_args_list[0][0][0]
@@ -259,7 +567,7 @@ def test_download_will_not_run_splash_settings_if_not_javascript(mocker):
 
 def test_verify_xpath_will_run_splash_settings_if_javascript(mocker):
     mocker.patch("os.path.isdir")
-    mock_crawler_worker = mocker.patch("webcomix.comic.CrawlerWorker")
+    mock_crawler_worker = mocker.patch("webcomix.scrapy.crawler_worker.CrawlerWorker")
     comic = Comic(
         mocker.ANY,
         mocker.ANY,
@@ -277,7 +585,7 @@ def test_verify_xpath_will_run_splash_settings_if_javascript(mocker):
 
 def test_verify_xpath_will_not_run_splash_settings_if_not_javascript(mocker):
     mocker.patch("os.path.isdir")
-    mock_crawler_worker = mocker.patch("webcomix.comic.CrawlerWorker")
+    mock_crawler_worker = mocker.patch("webcomix.scrapy.crawler_worker.CrawlerWorker")
     comic = Comic(mocker.ANY, mocker.ANY, mocker.ANY, mocker.ANY, mocker.ANY, False)
     comic.verify_xpath()
     settings = mock_crawler_worker.call_args_list[0][0][0]
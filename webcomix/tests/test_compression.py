@@ -0,0 +1,87 @@
+import zlib
+from zipfile import ZIP_DEFLATED, ZIP_LZMA, ZIP_STORED, BadZipFile, ZipFile
+
+import pytest
+
+from webcomix.compression import (
+    add_files,
+    compress_type,
+    drop_replaced_members,
+    verify_files,
+)
+
+
+def test_compressed_images_are_stored():
+    assert compress_type("1.jpg", "deflate") == ZIP_STORED
+    assert compress_type("1.PNG", "lzma") == ZIP_STORED
+    assert compress_type("1.txt", "deflate") == ZIP_DEFLATED
+    assert compress_type("1.txt", "lzma") == ZIP_LZMA
+    assert compress_type("1.txt") == ZIP_STORED
+
+
+def test_add_files_keeps_the_order_and_the_content_of_the_files(tmp_path):
+    files = []
+    for name in ["3.txt", "1.jpg", "2.txt", "4.bmp"]:
+        location = tmp_path / name
+        location.write_bytes(name.encode("ascii") * 1000)
+        files.append((str(location), name))
+
+    with ZipFile(str(tmp_path / "test.cbz"), "w") as cbz_file:
+        add_files(cbz_file, files, "deflate", 9, processes=2)
+
+    with ZipFile(str(tmp_path / "test.cbz")) as cbz_file:
+        assert cbz_file.testzip() is None
+        assert cbz_file.namelist() == ["3.txt", "1.jpg", "2.txt", "4.bmp"]
+        assert [info.compress_type for info in cbz_file.infolist()] == [
+            ZIP_DEFLATED,
+            ZIP_STORED,
+            ZIP_DEFLATED,
+            ZIP_DEFLATED,
+        ]
+        assert cbz_file.read("2.txt") == b"2.txt" * 1000
+        assert cbz_file.getinfo("2.txt").compress_size < 5000
+
+
+def test_add_files_appends_to_an_existing_archive(tmp_path):
+    location = tmp_path / "2.txt"
+    location.write_bytes(b"second")
+    with ZipFile(str(tmp_path / "test.cbz"), "w") as cbz_file:
+        cbz_file.writestr("1.txt", "first")
+
+    with ZipFile(str(tmp_path / "test.cbz"), "a") as cbz_file:
+        add_files(cbz_file, [(str(location), "2.txt")], "deflate")
+
+    with ZipFile(str(tmp_path / "test.cbz")) as cbz_file:
+        assert cbz_file.testzip() is None
+        assert cbz_file.read("1.txt") == b"first"
+        assert cbz_file.read("2.txt") == b"second"
+
+
+def test_verify_files_checks_the_files_added_against_the_archive(tmp_path):
+    location = tmp_path / "2.txt"
+    location.write_bytes(b"second")
+    with ZipFile(str(tmp_path / "test.cbz"), "w") as cbz_file:
+        cbz_file.writestr("1.txt", "first")
+        written = add_files(cbz_file, [(str(location), "2.txt")], "deflate")
+
+    assert written == {"2.txt": (zlib.crc32(b"second"), 6)}
+    verify_files(str(tmp_path / "test.cbz"), written)
+    with pytest.raises(BadZipFile):
+        verify_files(str(tmp_path / "test.cbz"), {"2.txt": (0, 6)})
+    with pytest.raises(BadZipFile):
+        verify_files(str(tmp_path / "test.cbz"), {"3.txt": (0, 6)})
+
+
+def test_drop_replaced_members_keeps_the_last_version_in_place(tmp_path):
+    cbz_path = str(tmp_path / "test.cbz")
+    with ZipFile(cbz_path, "w") as cbz_file:
+        cbz_file.writestr("1.jpg", "old")
+        cbz_file.writestr("2.jpg", "second")
+        with pytest.warns(UserWarning):
+            cbz_file.writestr("1.jpg", "new")
+
+    drop_replaced_members(cbz_path)
+
+    with ZipFile(cbz_path) as cbz_file:
+        assert cbz_file.namelist() == ["1.jpg", "2.jpg"]
+        assert cbz_file.read("1.jpg") == b"new"
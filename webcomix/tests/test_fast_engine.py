@@ -0,0 +1,136 @@
+import os
+from zipfile import ZipFile
+
+import pytest
+from parsel import Selector
+
+from webcomix.batch import download_comics, last_downloaded_page
+from webcomix.comic import FAST_ENGINE, Comic
+from webcomix.fast_engine import parse_page, xpath_values
+from webcomix.tests.fake_websites.fixture import (
+    numbered_webpages_uri,
+    three_webpages_alt_text_uri,
+    three_webpages_uri,
+)
+
+
+def read_directory(directory):
+    files = {}
+    for file_name in os.listdir(directory):
+        with open(os.path.join(directory, file_name), "rb") as downloaded_file:
+            files[file_name] = downloaded_file.read()
+    return files
+
+
+def test_fast_engine_downloads_the_same_images_as_scrapy(
+    tmp_path, monkeypatch, numbered_webpages_uri
+):
+    monkeypatch.chdir(tmp_path)
+    Comic("scrapy", numbered_webpages_uri, "//img/@src", "//a/@href").download()
+    fast_comic = Comic(
+        "fast", numbered_webpages_uri, "//img/@src", "//a/@href", engine=FAST_ENGINE
+    )
+
+    fast_comic.download()
+
+    assert read_directory("fast") == read_directory("scrapy")
+    assert last_downloaded_page(fast_comic) == 6
+
+
+def test_fast_engine_saves_the_alt_texts_in_the_cbz_file(
+    tmp_path, monkeypatch, three_webpages_alt_text_uri
+):
+    monkeypatch.chdir(tmp_path)
+    comic = Comic(
+        "test",
+        three_webpages_alt_text_uri,
+        "//img/@src",
+        "//a/@href",
+        alt_text="//img/@title",
+        engine=FAST_ENGINE,
+    )
+
+    comic.download(cbz=True)
+
+    with ZipFile("test.cbz") as cbz_file:
+        assert cbz_file.namelist() == ["1", "1.txt", "2", "2.txt"]
+        assert cbz_file.read("1.txt") == b"First page"
+
+
+def test_fast_engine_resumes_from_the_last_page_reached(
+    tmp_path, monkeypatch, mocker, three_webpages_uri
+):
+    monkeypatch.chdir(tmp_path)
+    comic = Comic("test", three_webpages_uri, "//img/@src", "//a/@href")
+    comic.download()
+    comic.engine = FAST_ENGINE
+    mock_echo = mocker.patch("click.echo")
+
+    comic.download()
+
+    assert mocker.call("Resuming the download of test from page 3") in (
+        mock_echo.call_args_list
+    )
+    assert mocker.call("Saving image {}".format(three_webpages_uri)) not in (
+        mock_echo.call_args_list
+    )
+
+
+def test_fast_engine_leaves_javascript_comics_to_scrapy(mocker):
+    mocker.patch("os.path.isdir")
+    mock_crawler_worker = mocker.patch("webcomix.scrapy.crawler_worker.CrawlerWorker")
+    mock_run_downloads = mocker.patch("webcomix.fast_engine.run_downloads")
+    comic = Comic(
+        "test", "http://example.com/1", "//img/@src", "//a/@href", javascript=True
+    )
+    comic.engine = FAST_ENGINE
+
+    comic.download()
+
+    assert mock_crawler_worker.call_count == 1
+    assert mock_run_downloads.call_count == 0
+
+
+def test_download_comics_uses_the_engine_of_each_comic(
+    tmp_path, monkeypatch, three_webpages_uri, three_webpages_alt_text_uri
+):
+    monkeypatch.chdir(tmp_path)
+    comics = [
+        Comic("first", three_webpages_uri, "//img/@src", "//a/@href"),
+        Comic(
+            "second",
+            three_webpages_alt_text_uri,
+            "//img/@src",
+            "//a/@href",
+            alt_text="//img/@title",
+            engine=FAST_ENGINE,
+        ),
+    ]
+
+    errors = download_comics(comics, jobs=2)
+
+    assert errors == [None, None]
+    assert len(os.listdir("first")) == 2
+    assert len(os.listdir("second")) == 4
+
+
+@pytest.mark.parametrize(
+    "selector",
+    [
+        "//a/@href",
+        "//div[@id='comic']",
+        "//p/text()",
+        "count(//a)",
+        "boolean(//img)",
+        "string(//p)",
+    ],
+)
+def test_xpath_values_match_scrapy(selector):
+    body = (
+        "<html><body><div id='comic'><img src='1.png'>é</div>"
+        "<p>Café <b>time</b></p><a href='2.html'>Next</a></body></html>"
+    )
+
+    assert xpath_values(parse_page(body.encode("utf-8")), selector) == (
+        Selector(text=body).xpath(selector).getall()
+    )
@@ -0,0 +1,76 @@
+import os
+from zipfile import ZipFile
+
+from webcomix.manifest import FAILED, Manifest
+
+
+def test_manifest_keeps_the_images_downloaded(tmp_path):
+    path = str(tmp_path / Manifest.location("test"))
+    manifest = Manifest(path)
+    manifest.add("1.jpg", page=1, image_url="http://foo/1.jpg", size=5)
+    manifest.add("2.jpg", page=2, image_url="http://foo/2.jpg", status=FAILED)
+    manifest.close()
+
+    manifest = Manifest(path)
+    assert not manifest.created
+    assert manifest.downloaded_files() == {"1.jpg"}
+    assert manifest.images()["1.jpg"]["image_url"] == "http://foo/1.jpg"
+    assert list(manifest.images(FAILED)) == ["2.jpg"]
+    assert manifest.report() == {
+        "downloaded": 1,
+        "failed": 1,
+        "size": 5,
+        "last_page": 1,
+    }
+    manifest.close()
+
+
+def test_manifest_writes_the_images_in_batches(tmp_path):
+    path = str(tmp_path / Manifest.location("test"))
+    manifest = Manifest(path)
+    for page in range(1, Manifest.BATCH_SIZE):
+        manifest.add("{}.jpg".format(page), page=page)
+    assert Manifest(path).downloaded_files() == set()
+
+    manifest.add("{}.jpg".format(Manifest.BATCH_SIZE), page=Manifest.BATCH_SIZE)
+    assert len(Manifest(path).downloaded_files()) == Manifest.BATCH_SIZE
+    manifest.close()
+
+
+def test_manifest_is_rebuilt_from_the_directory_and_the_cbz_file(tmp_path):
+    directory = str(tmp_path / "test")
+    os.mkdir(directory)
+    with open(os.path.join(directory, "test-2.jpg"), "w") as image_file:
+        image_file.write("image")
+    with ZipFile("{}.cbz".format(directory), "w") as cbz_file:
+        cbz_file.writestr("test-1.jpg", "image")
+    manifest = Manifest(Manifest.location(directory))
+
+    manifest.open(directory)
+
+    images = manifest.images()
+    assert sorted(images) == ["test-1.jpg", "test-2.jpg"]
+    assert images["test-1.jpg"]["page"] == 1
+    assert images["test-1.jpg"]["content_hash"].startswith("crc32:")
+    assert images["test-2.jpg"]["size"] == 5
+    manifest.close(directory)
+
+
+def test_manifest_is_rebuilt_when_the_files_changed(tmp_path):
+    directory = str(tmp_path / "test")
+    os.mkdir(directory)
+    manifest = Manifest(Manifest.location(directory))
+    manifest.open(directory)
+    manifest.add("1.jpg", page=1)
+    manifest.close(directory)
+
+    manifest = Manifest(Manifest.location(directory))
+    manifest.open(directory)
+    assert manifest.downloaded_files() == {"1.jpg"}
+    manifest.close(directory)
+
+    os.rmdir(directory)
+    manifest = Manifest(Manifest.location(directory))
+    manifest.open(directory)
+    assert manifest.downloaded_files() == set()
+    manifest.close(directory)
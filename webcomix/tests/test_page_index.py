@@ -0,0 +1,47 @@
+import pytest
+
+from webcomix.page_index import PageIndexWriter, read_images
+
+
+def write_index(path, append=False):
+    index_writer = PageIndexWriter(path, append)
+    index_writer.write_page(1, "https://xkcd.com/1/", ["1.png"], None)
+    index_writer.write_page(2, "https://xkcd.com/2/", ["2.png", "3.png"], "alt text")
+    index_writer.write_page(4, "https://xkcd.com/3/", ["4.png"], None)
+    index_writer.close()
+
+
+@pytest.mark.parametrize("file_name", ["test.index.jsonl", "test.csv"])
+def test_read_images_numbers_every_image_of_the_pages(tmp_path, file_name):
+    path = str(tmp_path / file_name)
+    write_index(path)
+
+    images = list(read_images(path))
+
+    assert [(image["url"], image["page"]) for image in images] == [
+        ("1.png", 1),
+        ("2.png", 2),
+        ("3.png", 3),
+        ("4.png", 4),
+    ]
+    assert images[2]["alt_text"] == "alt text"
+
+
+def test_read_images_keeps_the_images_of_the_page_range(tmp_path):
+    path = str(tmp_path / "test.index.jsonl")
+    write_index(path)
+
+    images = list(read_images(path, first_page=3, last_page=3))
+
+    assert [image["url"] for image in images] == ["3.png"]
+
+
+@pytest.mark.parametrize("file_name", ["test.index.jsonl", "test.csv"])
+def test_read_images_lists_the_images_written_again_once(tmp_path, file_name):
+    path = str(tmp_path / file_name)
+    write_index(path)
+    write_index(path, append=True)
+
+    images = list(read_images(path))
+
+    assert [image["page"] for image in images] == [1, 2, 3, 4]
@@ -1,5 +1,12 @@
+import asyncio
+import multiprocessing.pool
+import signal
+
+import webcomix.search
 from webcomix.comic import Comic
-from webcomix.search import discovery
+from webcomix.scrapy.crawler_worker import CrawlerWorker
+from webcomix.search import discovery, discovery_async, fetch_first_pages
+from webcomix.selector_cache import SelectorCache
 from webcomix.tests.fake_websites.fixture import (
     one_webpage_searchable_uri,
     three_webpages_uri,
@@ -11,15 +18,9 @@ def test_search_searchable_website(mocker, three_webpages_classes_uri):
     expected = Comic(
         "Blindsprings",
         three_webpages_classes_uri,
-        "//*[contains(translate(@class, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz'), 'comic')]//@src",
-        "//*[contains(translate(@class, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz'), 'next')]//@href",
+        "//img[contains(concat(' ', normalize-space(@class), ' '), ' comic ')]/@src",
+        "//a[contains(concat(' ', normalize-space(@class), ' '), ' next ')]/@href",
     )
-    mocker.patch("webcomix.search.possible_image_xpath", ["comic"])
-    mocker.patch("webcomix.search.possible_next_page_xpath", ["next"])
-    mocker.patch("webcomix.search.possible_tags_image", ["*"])
-    mocker.patch("webcomix.search.possible_tags_next", ["*"])
-    mocker.patch("webcomix.search.possible_attributes_image", ["@class"])
-    mocker.patch("webcomix.search.possible_attributes_next", ["@class"])
     mocker.patch("webcomix.util.check_first_pages")
     comic, result = discovery("Blindsprings", three_webpages_classes_uri)
 
@@ -31,61 +32,220 @@ def test_search_searchable_website(mocker, three_webpages_classes_uri):
             "url": three_webpages_classes_uri,
             "image_urls": [three_webpages_classes_folder + "1.jpeg"],
             "alt_text": None,
+            "next_page_url": three_webpages_classes_folder + "2.html",
         },
         {
             "page": 2,
             "url": three_webpages_classes_folder + "2.html",
             "image_urls": [three_webpages_classes_folder + "2.jpeg"],
             "alt_text": None,
+            "next_page_url": three_webpages_classes_folder + "3.html",
         },
         {
             "page": 3,
             "url": three_webpages_classes_folder + "3.html",
             "image_urls": [three_webpages_classes_folder + "3.jpeg"],
             "alt_text": None,
+            "next_page_url": three_webpages_classes_folder + "4.html",
         },
     ]
 
     assert comic.start_url == expected.start_url
     assert comic.next_page_selector == expected.next_page_selector
     assert comic.comic_image_selector == expected.comic_image_selector
+    assert comic.verified_pages == result
+
+
+def test_search_without_blocking_the_event_loop(mocker, three_webpages_classes_uri):
+    mocker.patch("webcomix.util.check_first_pages")
+    selector_cache = SelectorCache()
 
+    comic, result = asyncio.run(
+        discovery_async(
+            "Blindsprings", three_webpages_classes_uri, selector_cache=selector_cache
+        )
+    )
+    cached_comic, cached_result = asyncio.run(
+        discovery_async(
+            "Blindsprings", three_webpages_classes_uri, selector_cache=selector_cache
+        )
+    )
 
-def test_search_unsearchable_website(mocker, three_webpages_uri):
-    mocker.patch("webcomix.search.possible_image_xpath", ["comic"])
-    mocker.patch("webcomix.search.possible_next_page_xpath", ["next"])
-    mocker.patch("webcomix.search.possible_tags_image", ["*"])
-    mocker.patch("webcomix.search.possible_tags_next", ["*"])
-    mocker.patch("webcomix.search.possible_attributes_image", ["@class"])
-    mocker.patch("webcomix.search.possible_attributes_next", ["@class"])
+    assert comic.next_page_selector == cached_comic.next_page_selector
+    assert comic.comic_image_selector == cached_comic.comic_image_selector
+    assert [page["url"] for page in result] == [page["url"] for page in cached_result]
+    assert len(result) == 3
 
+
+def test_search_unsearchable_website(three_webpages_uri):
     assert discovery("test", three_webpages_uri) == (None, None)
 
 
 def test_can_stop_searching(mocker, three_webpages_classes_uri):
-    mocker.patch("webcomix.search.possible_image_xpath", ["comic"])
-    mocker.patch("webcomix.search.possible_next_page_xpath", ["next"])
-    mocker.patch("webcomix.search.possible_tags_image", ["div"])
-    mocker.patch("webcomix.search.possible_tags_next", ["div"])
-    mocker.patch("webcomix.search.possible_attributes_image", ["@rel"])
-    mocker.patch("webcomix.search.possible_attributes_next", ["@class"])
     exit_called = mocker.patch("sys.exit")
-    mocker.patch("webcomix.comic.Comic.verify_xpath", side_effect=KeyboardInterrupt)
+    mocker.patch(
+        "webcomix.scrapy.crawler_worker.CrawlerWorker.results",
+        side_effect=KeyboardInterrupt,
+    )
     result = discovery("test", three_webpages_classes_uri)
     assert exit_called.call_count == 1
     assert result == (None, None)
 
 
-def test_can_find_single_page_correctly_while_searching(
-    mocker, one_webpage_searchable_uri
+def test_search_fetches_the_pages_only_once(mocker, three_webpages_classes_uri):
+    crawler_worker_results = mocker.spy(CrawlerWorker, "results")
+    mock_verify_xpath = mocker.patch("webcomix.comic.Comic.verify_xpath")
+
+    comic, result = discovery("test", three_webpages_classes_uri)
+
+    assert comic is not None
+    assert crawler_worker_results.call_count == 1
+    assert mock_verify_xpath.call_count == 0
+
+
+def test_fetching_the_first_pages_gives_ctrl_c_back(three_webpages_classes_uri):
+    sigint_handler = signal.getsignal(signal.SIGINT)
+    sigterm_handler = signal.getsignal(signal.SIGTERM)
+
+    page_cache = fetch_first_pages(three_webpages_classes_uri)
+
+    assert three_webpages_classes_uri in page_cache
+    assert signal.getsignal(signal.SIGINT) == sigint_handler
+    assert signal.getsignal(signal.SIGTERM) == sigterm_handler
+
+
+def test_search_only_verifies_pairs_of_valid_candidates(
+    mocker, three_webpages_classes_uri
+):
+    check_first_pages = mocker.spy(webcomix.search, "check_first_pages")
+
+    comic, result = discovery("test", three_webpages_classes_uri)
+
+    assert check_first_pages.call_count == 1
+    assert comic.comic_image_selector == (
+        "//img[contains(concat(' ', normalize-space(@class), ' '), ' comic ')]/@src"
+    )
+    assert comic.next_page_selector == (
+        "//a[contains(concat(' ', normalize-space(@class), ' '), ' next ')]/@href"
+    )
+
+
+def test_search_remembers_the_selectors_found(mocker, three_webpages_classes_uri):
+    selector_cache = SelectorCache()
+    comic, result = discovery(
+        "test", three_webpages_classes_uri, selector_cache=selector_cache
+    )
+    fetch_first_pages = mocker.spy(webcomix.search, "fetch_first_pages")
+
+    cached_comic, cached_result = discovery(
+        "test", three_webpages_classes_uri, selector_cache=selector_cache
+    )
+
+    assert fetch_first_pages.call_count == 0
+    assert cached_comic.comic_image_selector == comic.comic_image_selector
+    assert cached_comic.next_page_selector == comic.next_page_selector
+    assert cached_result == result
+
+
+def test_search_does_not_remember_a_single_page_without_next_page(
+    one_webpage_searchable_uri,
+):
+    selector_cache = SelectorCache()
+
+    comic, result = discovery(
+        "test",
+        one_webpage_searchable_uri,
+        single_page=True,
+        selector_cache=selector_cache,
+    )
+
+    assert comic is not None
+    assert selector_cache.get(one_webpage_searchable_uri) is None
+
+
+def test_search_forgets_the_selectors_that_stopped_working(
+    mocker, three_webpages_classes_uri
+):
+    selector_cache = SelectorCache()
+    selector_cache.set(three_webpages_classes_uri, "//div/@src", "//a/@href")
+    fetch_first_pages = mocker.spy(webcomix.search, "fetch_first_pages")
+
+    comic, result = discovery(
+        "test", three_webpages_classes_uri, selector_cache=selector_cache
+    )
+
+    assert fetch_first_pages.call_count == 1
+    assert comic is not None
+    assert (
+        selector_cache.get(three_webpages_classes_uri)["comic_image_selector"]
+        == comic.comic_image_selector
+    )
+
+
+def test_parallel_search_finds_the_same_comic(three_webpages_classes_uri):
+    comic, result = discovery("test", three_webpages_classes_uri)
+    parallel_comic, parallel_result = discovery(
+        "test", three_webpages_classes_uri, jobs=3
+    )
+
+    assert parallel_comic.comic_image_selector == comic.comic_image_selector
+    assert parallel_comic.next_page_selector == comic.next_page_selector
+    assert parallel_result == result
+
+
+def test_verifier_processes_can_be_terminated():
+    # A CrawlerWorker leaves a SIGTERM handler behind which the processes of
+    # the pool would inherit, making them ignore Pool.terminate()
+    previous_sigint = signal.getsignal(signal.SIGINT)
+    previous_sigterm = signal.signal(signal.SIGTERM, lambda signum, frame: None)
+    try:
+        webcomix.search.initialize_verifier(None)
+
+        assert signal.getsignal(signal.SIGTERM) == signal.SIG_DFL
+        assert signal.getsignal(signal.SIGINT) == signal.SIG_IGN
+    finally:
+        signal.signal(signal.SIGINT, previous_sigint)
+        signal.signal(signal.SIGTERM, previous_sigterm)
+
+
+def test_parallel_search_keeps_several_verifications_in_flight(
+    mocker, three_webpages_classes_uri
 ):
-    mocker.patch("webcomix.search.possible_image_xpath", ["image"])
-    mocker.patch("webcomix.search.possible_next_page_xpath", ["next"])
-    mocker.patch("webcomix.search.possible_tags_image", ["*"])
-    mocker.patch("webcomix.search.possible_tags_next", ["*"])
-    mocker.patch("webcomix.search.possible_attributes_image", ["@class"])
-    mocker.patch("webcomix.search.possible_attributes_next", ["."])
+    pool = mocker.spy(webcomix.search, "Pool")
+    imap = mocker.spy(multiprocessing.pool.Pool, "imap")
+
+    discovery("test", three_webpages_classes_uri, jobs=3)
+
+    assert pool.call_args[0][0] == 3
+    assert imap.call_count > 0
+
+
+def test_parallel_search_stops_the_other_verifications_once_one_passes(
+    mocker, three_webpages_classes_uri
+):
+    submitted, used = [], []
+    imap = multiprocessing.pool.Pool.imap
+
+    def counting_imap(self, func, iterable, chunksize=1):
+        candidates = list(iterable)
+        submitted.append(len(candidates))
+        used.append(0)
+        for result in imap(self, func, candidates, chunksize):
+            used[-1] += 1
+            yield result
+
+    mocker.patch.object(multiprocessing.pool.Pool, "imap", counting_imap)
+    terminate = mocker.spy(multiprocessing.pool.Pool, "terminate")
+
+    comic, result = discovery("test", three_webpages_classes_uri, jobs=3)
+
+    assert comic is not None
+    assert terminate.call_count == 1
+    # The results of the combinations left once one has passed are never used
+    assert used[-1] < submitted[-1]
+
 
+def test_can_find_single_page_correctly_while_searching(one_webpage_searchable_uri):
     comic, result = discovery("test", one_webpage_searchable_uri, single_page=True)
 
     validation = comic.verify_xpath()
@@ -0,0 +1,48 @@
+from webcomix.selector_cache import SelectorCache
+
+AN_URL = "https://www.example.com/comic/1"
+
+
+def test_selector_cache_returns_selectors_of_same_host(tmp_path):
+    selector_cache = SelectorCache(str(tmp_path / "selectors.json"))
+    selector_cache.set(AN_URL, "//img/@src", "//a/@href", "//img/@title")
+
+    selectors = SelectorCache(str(tmp_path / "selectors.json")).get(
+        "https://www.example.com/comic/200"
+    )
+
+    assert selectors["comic_image_selector"] == "//img/@src"
+    assert selectors["next_page_selector"] == "//a/@href"
+    assert selectors["alt_text"] == "//img/@title"
+
+
+def test_selector_cache_ignores_other_hosts(tmp_path):
+    selector_cache = SelectorCache(str(tmp_path / "selectors.json"))
+    selector_cache.set(AN_URL, "//img/@src", "//a/@href")
+
+    assert selector_cache.get("https://xkcd.com/1/") is None
+
+
+def test_selector_cache_expires_entries(mocker, tmp_path):
+    selector_cache = SelectorCache(str(tmp_path / "selectors.json"), time_to_live=10)
+    mocker.patch("time.time", return_value=100)
+    selector_cache.set(AN_URL, "//img/@src", "//a/@href")
+    mocker.patch("time.time", return_value=111)
+
+    assert selector_cache.get(AN_URL) is None
+
+
+def test_selector_cache_evicts_least_recently_used_entries(mocker, tmp_path):
+    selector_cache = SelectorCache(str(tmp_path / "selectors.json"), maximum_size=2)
+    mock_time = mocker.patch("time.time", return_value=1)
+    selector_cache.set("https://first.com/", "//img/@src", "//a/@href")
+    mock_time.return_value = 2
+    selector_cache.set("https://second.com/", "//img/@src", "//a/@href")
+    mock_time.return_value = 3
+    selector_cache.get("https://first.com/")
+    mock_time.return_value = 4
+    selector_cache.set("https://third.com/", "//img/@src", "//a/@href")
+
+    assert selector_cache.get("https://first.com/") is not None
+    assert selector_cache.get("https://second.com/") is None
+    assert selector_cache.get("https://third.com/") is not None
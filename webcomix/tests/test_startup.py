@@ -0,0 +1,54 @@
+import subprocess
+import sys
+
+import pytest
+
+# Seconds webcomix.cli may take to import, on top of the interpreter
+STARTUP_BUDGET = 0.1
+
+HEAVY_MODULES = ["scrapy", "twisted", "tqdm", "aiohttp", "lxml"]
+
+IMPORTED_MODULES = """
+import sys
+from click.testing import CliRunner
+from webcomix.cli import cli
+result = CliRunner().invoke(cli, sys.argv[1:])
+assert result.exit_code == 0, result.output
+print(" ".join(sorted({name.split(".")[0] for name in sys.modules})))
+"""
+
+
+def import_time(module: str) -> float:
+    """
+    Returns the seconds taken to import the module in a new interpreter, as
+    measured by python -X importtime.
+    """
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    ).stderr
+    for line in output.splitlines():
+        _, cumulative, name = line.split("|")
+        if name.strip() == module:
+            return int(cumulative) / 1e6
+    raise AssertionError("{} was not imported".format(module))
+
+
+@pytest.mark.parametrize("arguments", [["comics"], ["--help"], ["download", "--help"]])
+def test_read_only_commands_do_not_import_the_crawlers(arguments):
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORTED_MODULES] + arguments,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    ).stdout
+
+    imported_modules = output.split()
+    assert [module for module in HEAVY_MODULES if module in imported_modules] == []
+
+
+def test_cli_starts_within_budget():
+    # The best of a few runs, so that a busy machine doesn't fail the test
+    assert min(import_time("webcomix.cli") for _ in range(3)) < STARTUP_BUDGET
@@ -1,3 +1,6 @@
+import os
+
+
 def check_first_pages(first_pages):
     page_links = set([page.get("url") for page in first_pages])
     assert len(set(page_links)) == len(page_links)
@@ -6,3 +9,17 @@ def check_first_pages(first_pages):
     image_links = [image for page in list_of_images for image in page]
     assert len(set(image_links)) == len(image_links)
     assert len(image_links) >= len(first_pages)
+
+
+def cache_directory() -> str:
+    """
+    Returns the directory in which webcomix keeps the data it reuses between
+    runs, which can be changed with the WEBCOMIX_CACHE_DIR environment
+    variable.
+    """
+    if os.environ.get("WEBCOMIX_CACHE_DIR"):
+        return os.environ["WEBCOMIX_CACHE_DIR"]
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache_home, "webcomix")